@@ -150,11 +150,41 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Fichiers téléversés (imports Excel en attente de traitement)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Les fichiers téléversés sont toujours écrits dans un fichier temporaire (jamais gardés en mémoire)
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Cache Django : seulement des résultats recalculables (analyses, cartes, aperçus...), dont les clés
+# portent la version des données ; la fraîcheur des matrices est vérifiée en base (MatriceTableau.version).
+# Un cache partagé entre processus (Redis, ou DatabaseCache + "manage.py createcachetable") évite
+# seulement de recalculer ces résultats dans chaque worker.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+# Valeurs des tableaux aussi rangées en matrices NumPy (ansade_app/matrice.py) pour les lectures
+ANSADE_STOCKAGE_MATRICE = True
+# Matrices indexées gardées en mémoire par processus pour les filtres (les moins récentes sont évincées)
+ANSADE_MATRICES_EN_MEMOIRE = 64
+# Taille maximale de l'index de suggestions en mémoire (entrées ; environ 100 octets chacune)
+ANSADE_SUGGESTIONS_MAX_ENTREES = 200_000
+# Nombre maximal de tableaux par appel de /api/structures/?ids=
+ANSADE_STRUCTURES_PAR_LOT = 50
+# Tâche d'import "en cours" sans signe de vie depuis ce délai (minutes) : reprise par un autre worker
+ANSADE_IMPORT_DELAI_REPRISE = 30
+# Nombre d'essais d'une tâche d'import avant de la marquer échouée
+ANSADE_IMPORT_TENTATIVES = 3
 CORS_ALLOW_ALL_ORIGINS = False
 CORS_ALLOWED_ORIGINS = [
     # "http://0.0.0.0:5173",
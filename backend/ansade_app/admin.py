@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 
-from .models import Categorie, Theme, Tableau, Donnees, User,LigneIndicateur
+from .models import Categorie, Theme, Tableau, Colonne, Donnees, User,LigneIndicateur, TacheImport
 
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
@@ -54,17 +54,15 @@ class DonneesAdmin(admin.ModelAdmin):
         'colonne',
         'unite',
         'statut',
-        'note_colonne',
-        'source',
         'valeur',
-        'categorie',
         'tableau',
         'get_code',
         'get_parent_code',
         'get_ordre',
     )
-    search_fields = ('ligne__label', 'colonne', 'source', 'ligne__code', 'ligne__parent_code', 'ligne__ordre')
-    list_filter = ('categorie', 'tableau')
+    search_fields = ('ligne__label', 'colonne__label', 'ligne__code', 'ligne__parent_code', 'ligne__ordre')
+    list_filter = ('tableau__theme__categorie', 'tableau')
+    list_select_related = ('ligne', 'colonne', 'tableau')
 
     @admin.display(description="LIGNE")
     def get_ligne_label(self, obj):
@@ -83,8 +81,22 @@ class DonneesAdmin(admin.ModelAdmin):
         return obj.ligne.ordre if obj.ligne else ""
 
 
+@admin.register(Colonne)
+class ColonneAdmin(admin.ModelAdmin):
+    list_display = ('id', 'label', 'principal', 'sous', 'note', 'ordre', 'tableau')
+    search_fields = ('label', 'note')
+    list_filter = ('tableau',)
+
+
 @admin.register(LigneIndicateur)
 class LigneIndicateurAdmin(admin.ModelAdmin):
     list_display = ('id', 'label', 'code', 'parent_code', 'ordre', 'tableau')
     search_fields = ('label', 'code', 'parent_code')
-    list_filter = ('tableau',)
\ No newline at end of file
+    list_filter = ('tableau',)
+
+
+@admin.register(TacheImport)
+class TacheImportAdmin(admin.ModelAdmin):
+    list_display = ('id', 'nom_fichier', 'statut', 'theme', 'categorie', 'utilisateur', 'cree_le', 'fin')
+    list_filter = ('statut', 'categorie')
+    readonly_fields = ('feuilles', 'erreur', 'cree_le', 'debut', 'fin')
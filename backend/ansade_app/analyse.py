@@ -0,0 +1,230 @@
+"""
+Analyse d'un tableau en séries temporelles (TableauAnalyseAPIView).
+Le tableau est pivoté depuis sa matrice (matrice.py) en séries indicateur × groupe sur les
+périodes (colonnes "2013", "2019-2020", "1T2021", "janv-22"...), puis toutes les mesures sont
+calculées en un passage NumPy sur le bloc séries × périodes : min / max / moyenne, taux de
+croissance d'une période à l'autre, TCAM (taux de croissance annuel moyen), part dans la
+ligne parente et moyenne mobile. Sans périodes, les colonnes servent d'axe (mesures de
+croissance absentes).
+Le résultat est mis en cache par version de matrice : une régénération l'invalide.
+"""
+import re
+import unicodedata
+
+import numpy as np
+from django.core.cache import cache
+
+from .matrice import ABSENTE, charger_index, construire_index
+
+DUREE_CACHE = 24 * 3600
+MOIS = {
+    "janv": 1, "janvier": 1, "fevr": 2, "fevrier": 2, "mars": 3, "avr": 4, "avril": 4, "mai": 5,
+    "juin": 6, "juil": 7, "juillet": 7, "aout": 8, "sept": 9, "septembre": 9, "oct": 10, "octobre": 10,
+    "nov": 11, "novembre": 11, "dec": 12, "decembre": 12,
+}
+_ANNEE = re.compile(r"^((?:19|20)\d\d)(?:\s*[-/]\s*(?:19|20)?\d\d)?$")  # 2013, 2019-2020, 2019/20
+_ANNEE_COURTE = re.compile(r"^(\d\d)-(\d\d)$")                          # 19-20
+_TRIMESTRE = re.compile(r"^([1-4])\s*t\s*((?:19|20)\d\d)$")             # 1T2021
+_MOIS = re.compile(r"^([a-z]+)\.?\s*-?\s*(\d\d|(?:19|20)\d\d)$")         # janv-22, Déc21, mars 2020
+
+
+def instant(libelle):
+    """Position dans le temps d'un en-tête de colonne, en années (2021.25 = 2e trimestre 2021), ou None."""
+    texte = unicodedata.normalize("NFKD", (libelle or "").strip().lower())
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    if m := _ANNEE.match(texte):
+        return float(m.group(1))
+    if m := _ANNEE_COURTE.match(texte):
+        return 2000.0 + int(m.group(1))
+    if m := _TRIMESTRE.match(texte):
+        return int(m.group(2)) + (int(m.group(1)) - 1) / 4
+    if (m := _MOIS.match(texte)) and m.group(1) in MOIS:
+        annee = int(m.group(2))
+        return (annee if annee > 100 else 2000 + annee) + (MOIS[m.group(1)] - 1) / 12
+    return None
+
+
+def type_tableau(temporel, lignes, colonnes):
+    """Type d'affichage, comme l'ancienne détection : annees / groupes / carte / generique."""
+    if temporel:
+        return "annees"
+    if any(label in ("Féminin", "Masculin", "Total") for label, _, _ in colonnes):
+        return "groupes"
+    if any("wilaya" in (label or "").lower() for label, _, _ in lignes):
+        return "carte"
+    return "generique"
+
+
+def _liste(valeurs):
+    """Tableau NumPy -> liste JSON (NaN -> None)."""
+    return [None if v != v else v for v in np.round(valeurs, 6).tolist()]
+
+
+def pivoter(index):
+    """
+    Axe des périodes et bloc X (séries × périodes) tiré de la matrice.
+    Retourne (temporel, periodes, instants, series, X) ; series : (position de ligne, groupe).
+    """
+    m = index.matrice
+    reperes = []  # (position de colonne, période, instant, groupe)
+    for j, (label, principal, sous) in enumerate(index.colonnes):
+        if (t := instant(principal)) is not None:
+            reperes.append((j, principal, t, sous))
+        elif sous and (t := instant(sous)) is not None:
+            reperes.append((j, sous, t, principal))
+    temporel = len({t for _, _, t, _ in reperes}) >= 2
+    if not temporel:
+        reperes = [(j, label, None, "") for j, (label, _, _) in enumerate(index.colonnes)]
+
+    periodes = list(dict.fromkeys(
+        p for _, p, _, _ in (sorted(reperes, key=lambda r: r[2]) if temporel else reperes)
+    ))
+    groupes = list(dict.fromkeys(g for _, _, _, g in reperes))
+    position_periode = {p: k for k, p in enumerate(periodes)}
+    position_groupe = {g: k for k, g in enumerate(groupes)}
+    instants = np.full(len(periodes), np.nan)
+
+    # J[g, p] : colonne de la matrice pour (groupe, période), -1 si absente
+    J = np.full((len(groupes), len(periodes)), -1, dtype=np.intp)
+    for j, p, t, g in reperes:
+        J[position_groupe[g], position_periode[p]] = j
+        if t is not None:
+            instants[position_periode[p]] = t
+
+    lignes = np.argsort(index.rang_ligne)  # ordre d'affichage
+    bloc = m.valeurs[lignes][:, J]                        # lignes × groupes × périodes
+    presentes = (m.etats[lignes][:, J] != ABSENTE) & (J >= 0)
+    X = np.where(presentes, bloc, np.nan).reshape(len(lignes) * len(groupes), len(periodes))
+    series = [(i, g) for i in lignes.tolist() for g in groupes]
+
+    gardees = ~np.isnan(X).all(axis=1) if X.size else np.zeros(len(series), dtype=bool)
+    X = X[gardees]
+    series = [s for s, garder in zip(series, gardees.tolist()) if garder]
+    return temporel, periodes, instants, series, X
+
+
+def mesures(X, instants, parents, fenetre):
+    """
+    Toutes les mesures du bloc X (séries × périodes) en un passage vectorisé.
+    `parents` : indice de la série parente de chaque série, -1 sans parent.
+    """
+    nb, P = X.shape
+    valides = ~np.isnan(X)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zeros = np.where(valides, X, 0)
+        resultat = {
+            "min": np.where(valides, X, np.inf).min(axis=1, initial=np.inf),
+            "max": np.where(valides, X, -np.inf).max(axis=1, initial=-np.inf),
+            "moyenne": zeros.sum(axis=1) / valides.sum(axis=1),
+        }
+
+        # croissance d'une période à l'autre (NaN pour la première période)
+        precedent = np.concatenate([np.full((nb, 1), np.nan), X[:, :-1]], axis=1)
+        croissance = (X - precedent) / np.abs(precedent)
+        croissance[~np.isfinite(croissance)] = np.nan
+        resultat["croissance"] = croissance
+
+        # TCAM entre la première et la dernière valeur connues
+        premiere = valides.argmax(axis=1)
+        derniere = P - 1 - valides[:, ::-1].argmax(axis=1)
+        lignes = np.arange(nb)
+        v0, v1 = X[lignes, premiere], X[lignes, derniere]
+        duree = instants[derniere] - instants[premiere]
+        tcam = np.where((v0 > 0) & (v1 > 0) & (duree > 0), (v1 / v0) ** (1 / duree) - 1, np.nan)
+        resultat["tcam"] = tcam
+        resultat["premiere"], resultat["derniere"] = premiere, derniere
+
+        # part dans la série parente, période par période
+        a_parent = parents >= 0
+        part = np.full_like(X, np.nan)
+        part[a_parent] = X[a_parent] / X[parents[a_parent]]
+        part[~np.isfinite(part)] = np.nan
+        resultat["part_parent"] = part
+
+        # moyenne mobile sur `fenetre` périodes (valeurs manquantes ignorées)
+        sommes = np.concatenate([np.zeros((nb, 1)), np.cumsum(zeros, axis=1)], axis=1)
+        comptes = np.concatenate([np.zeros((nb, 1)), np.cumsum(valides, axis=1)], axis=1)
+        fin = np.arange(1, P + 1)
+        debut = np.maximum(0, fin - fenetre)
+        n = comptes[:, fin] - comptes[:, debut]
+        resultat["moyenne_mobile"] = np.where(n > 0, (sommes[:, fin] - sommes[:, debut]) / n, np.nan)
+
+        # moyenne de toutes les séries par période (graphique d'ensemble)
+        resultat["moyennes_periodes"] = zeros.sum(axis=0) / valides.sum(axis=0)
+    return resultat
+
+
+def construire_analyse(index, titre, fenetre):
+    temporel, periodes, instants, series, X = pivoter(index)
+    if not series:
+        return {
+            "titre": titre, "type": type_tableau(temporel, index.lignes, index.colonnes), "periodes": periodes,
+            "fenetre": fenetre, "series": [], "moyennes": [], "version": index.version,
+        }
+    lignes_ids = index.matrice.lignes.tolist()
+    position_ligne = index.position_ligne
+
+    numero = {s: k for k, s in enumerate(series)}
+    parents = np.array([
+        numero.get((position_ligne.get(index.lignes[i][2], -1), g), -1) for i, g in series
+    ], dtype=np.intp)
+    r = mesures(X, instants, parents, fenetre)
+
+    sorties = []
+    for k, (i, groupe) in enumerate(series):
+        label = (index.lignes[i][0] or "").strip()
+        sorties.append({
+            "ligne_id": lignes_ids[i],
+            "indicateur": label,
+            "groupe": groupe,
+            "valeurs": _liste(X[k]),
+            "croissance": _liste(r["croissance"][k]) if temporel else None,
+            "moyenne_mobile": _liste(r["moyenne_mobile"][k]),
+            "part_parent": _liste(r["part_parent"][k]) if parents[k] >= 0 else None,
+            "stats": {
+                "min": _liste(r["min"][k:k + 1])[0],
+                "max": _liste(r["max"][k:k + 1])[0],
+                "moyenne": _liste(r["moyenne"][k:k + 1])[0],
+                "tcam": _liste(r["tcam"][k:k + 1])[0] if temporel else None,
+                "premiere_periode": periodes[r["premiere"][k]],
+                "derniere_periode": periodes[r["derniere"][k]],
+            },
+        })
+
+    # moyennes prêtes pour le graphique en barres : par période, sinon par indicateur
+    if temporel:
+        moyennes = [
+            {"annee": p, "moyenne": v}
+            for p, v in zip(periodes, _liste(r["moyennes_periodes"])) if v is not None
+        ]
+    else:
+        par_indicateur = {}
+        for s, moyenne in zip(sorties, _liste(r["moyenne"])):
+            par_indicateur.setdefault(s["indicateur"], []).append(moyenne)
+        moyennes = [
+            {"groupe": indicateur, "moyenne": round(float(np.mean(v)), 6)}
+            for indicateur, v in par_indicateur.items()
+        ]
+
+    return {
+        "titre": titre,
+        "type": type_tableau(temporel, index.lignes, index.colonnes),
+        "periodes": periodes,
+        "fenetre": fenetre,
+        "series": sorties,
+        "moyennes": moyennes,
+        "version": index.version,
+    }
+
+
+def analyser(tableau_id, titre, fenetre=3):
+    """Analyse du tableau, en cache pour la version courante de sa matrice."""
+    index = charger_index(tableau_id)
+    if index is None:
+        return construire_analyse(construire_index(tableau_id), titre, fenetre)
+    cle = f"ansade:analyse:{tableau_id}:v{index.version}:f{fenetre}"
+    analyse = cache.get(cle)
+    if analyse is None:
+        analyse = construire_analyse(index, titre, fenetre)
+        cache.set(cle, analyse, DUREE_CACHE)
+    return analyse
@@ -0,0 +1,214 @@
+import io
+import logging
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from .models import Colonne, Donnees, LigneIndicateur, Tableau
+
+logger = logging.getLogger(__name__)
+
+# Nombre de lignes envoyées par requête INSERT groupée
+BATCH_SIZE = 1000
+
+# PostgreSQL : nombre de cellules envoyées par commande COPY
+TAILLE_COPIE = 20000
+
+
+class CompteurRequetes:
+    """Compte les requêtes SQL exécutées (utilisé avec connection.execute_wrapper)."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def copie_disponible():
+    """COPY n'est utilisé qu'avec PostgreSQL (pilote psycopg2) ; sinon on reste sur bulk_create."""
+    return connection.vendor == 'postgresql' and connection.Database.__name__ == 'psycopg2'
+
+
+def _valeur_csv(valeur):
+    """Valeur au format CSV de COPY : \\N pour NULL, textes toujours entre guillemets."""
+    if valeur is None:
+        return '\\N'
+    if isinstance(valeur, bool):
+        return 't' if valeur else 'f'
+    if isinstance(valeur, (int, float)):
+        return repr(valeur)
+    return '"' + str(valeur).replace('"', '""') + '"'
+
+
+def copier(modele, objets):
+    """
+    Insère `objets` avec une seule commande COPY ... FROM STDIN (format CSV).
+    Les clés étrangères vers des objets enregistrés entre-temps (ex: la ligne d'une
+    cellule, insérée juste avant) sont reprises de l'objet lié.
+    Les id générés ne sont pas renvoyés : à réserver aux objets qui ne sont pas référencés.
+    """
+    champs = [f for f in modele._meta.concrete_fields if not f.primary_key]
+    tampon = io.StringIO()
+    for obj in objets:
+        valeurs = []
+        for champ in champs:
+            if champ.is_relation and champ.is_cached(obj):
+                lie = champ.get_cached_value(obj)
+                valeur = lie.pk if lie is not None else None
+            else:
+                valeur = champ.get_db_prep_save(getattr(obj, champ.attname), connection)
+            valeurs.append(_valeur_csv(valeur))
+        tampon.write(",".join(valeurs))
+        tampon.write("\n")
+    tampon.seek(0)
+
+    qn = connection.ops.quote_name
+    sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+        qn(modele._meta.db_table), ", ".join(qn(champ.column) for champ in champs),
+    )
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(sql, tampon)
+
+
+class EcritureFeuille:
+    """
+    Accumule les lignes (LigneIndicateur), les colonnes (Colonne) et les cellules (Donnees)
+    d'une feuille, puis les insère par lots dès qu'un lot est plein : la mémoire utilisée
+    ne dépend pas de la taille de la feuille.
+    Les lignes et les colonnes sont insérées en premier avec bulk_create : leurs id générés
+    sont ensuite repris automatiquement par les cellules qui les référencent.
+    Sur PostgreSQL, les cellules sont envoyées par COPY (lots de TAILLE_COPIE),
+    ailleurs (SQLite des tests...) par bulk_create.
+    """
+
+    def __init__(self, nom_feuille, batch_size=BATCH_SIZE, copie=None):
+        self.nom_feuille = nom_feuille
+        self.batch_size = batch_size
+        self.copie = copie_disponible() if copie is None else copie
+        self.taille_lot_donnees = TAILLE_COPIE if self.copie else batch_size
+        self.tableau = None
+        self.lignes = []
+        self.donnees = []
+        self.colonnes = {}  # libellé -> Colonne du tableau en cours
+        self.nouvelles_colonnes = []
+        self.nb_lignes = 0
+        self.nb_donnees = 0
+        self.nb_copies = 0
+        self.stats = None
+
+    def creer_tableau(self, **champs):
+        self.tableau = Tableau.objects.create(nom_feuille=self.nom_feuille, **champs)
+        self.colonnes = {}
+        return self.tableau
+
+    def colonne(self, label, note=None):
+        """Colonne du tableau pour ce libellé, créée (en attente d'écriture) à sa première cellule."""
+        colonne = self.colonnes.get(label)
+        if colonne is None:
+            principal, sous = Colonne.decouper(label)
+            colonne = self.colonnes[label] = Colonne(
+                tableau=self.tableau, label=label, principal=principal, sous=sous,
+                note=note, ordre=len(self.colonnes),
+            )
+            self.nouvelles_colonnes.append(colonne)
+        return colonne
+
+    def ajouter_ligne(self, **champs):
+        ligne = LigneIndicateur(tableau=self.tableau, **champs)
+        self.lignes.append(ligne)
+        if len(self.lignes) >= self.batch_size:
+            self.vider()
+        return ligne
+
+    def ajouter_donnee(self, colonne, note_colonne=None, **champs):
+        """Cellule de la colonne `colonne` (libellé) ; la note n'est retenue que sur la colonne."""
+        self.donnees.append(Donnees(tableau=self.tableau, colonne=self.colonne(colonne, note_colonne), **champs))
+        if len(self.donnees) >= self.taille_lot_donnees:
+            self.vider()
+
+    def vider(self):
+        """Écrit le contenu des tampons puis les vide."""
+        if self.lignes:
+            LigneIndicateur.objects.bulk_create(self.lignes, batch_size=self.batch_size)
+            self.nb_lignes += len(self.lignes)
+            self.lignes = []
+        if self.nouvelles_colonnes:
+            Colonne.objects.bulk_create(self.nouvelles_colonnes, batch_size=self.batch_size)
+            self.nouvelles_colonnes = []
+        if self.donnees:
+            if self.copie:
+                copier(Donnees, self.donnees)
+                self.nb_copies += 1
+            else:
+                Donnees.objects.bulk_create(self.donnees, batch_size=self.batch_size)
+            self.nb_donnees += len(self.donnees)
+            self.donnees = []
+
+    def abandonner(self):
+        """Supprime le tableau en cours (déjà écrit ou non) et vide les tampons."""
+        self.lignes = []
+        self.donnees = []
+        self.colonnes = {}
+        self.nouvelles_colonnes = []
+        if self.tableau:
+            self.tableau.delete()
+        self.tableau = None
+        self.nb_lignes = 0
+        self.nb_donnees = 0
+
+    def corriger(self, source=None, notes=None):
+        """
+        Applique les informations découvertes en fin de feuille aux lignes déjà écrites :
+        la source du tableau et les notes des colonnes étoilées ({colonne: note}).
+        """
+        self.vider()
+        if source is not None:
+            Tableau.objects.filter(pk=self.tableau.pk).update(source=source)
+            self.tableau.source = source
+        for note, colonnes in _regrouper(notes or {}).items():
+            Colonne.objects.filter(tableau=self.tableau, label__in=colonnes).update(note=note)
+
+
+def _regrouper(notes):
+    """{colonne: note} -> {note: [colonnes]} pour ne lancer qu'un UPDATE par note."""
+    par_note = {}
+    for colonne, note in notes.items():
+        par_note.setdefault(note, []).append(colonne)
+    return par_note
+
+
+@contextmanager
+def ecriture_feuille(nom_feuille, batch_size=BATCH_SIZE):
+    """
+    Ouvre une transaction pour une feuille et renvoie un EcritureFeuille.
+    À la sortie du bloc, les tampons sont écrits et `ecriture.stats` contient
+    le nombre de lignes, de cellules, de requêtes SQL (COPY compris) et le débit obtenu.
+    """
+    ecriture = EcritureFeuille(nom_feuille, batch_size=batch_size)
+    compteur = CompteurRequetes()
+    debut = time.perf_counter()
+
+    with connection.execute_wrapper(compteur), transaction.atomic():
+        yield ecriture
+        ecriture.vider()
+
+    duree = time.perf_counter() - debut
+    ecriture.stats = {
+        "feuille": nom_feuille,
+        "tableau_id": ecriture.tableau.id if ecriture.tableau else None,
+        "lignes": ecriture.nb_lignes,
+        "donnees": ecriture.nb_donnees,
+        # les COPY passent directement par le pilote : execute_wrapper ne les voit pas
+        "requetes": compteur.total + ecriture.nb_copies,
+        "duree": round(duree, 3),
+        "lignes_par_seconde": round(ecriture.nb_lignes / duree, 1) if duree else None,
+        "donnees_par_seconde": round(ecriture.nb_donnees / duree, 1) if duree else None,
+    }
+    if ecriture.tableau:
+        logger.info(
+            "Import feuille %s : %s lignes, %s cellules, %s requêtes en %.3fs",
+            nom_feuille, ecriture.nb_lignes, ecriture.nb_donnees, ecriture.stats["requetes"], duree,
+        )
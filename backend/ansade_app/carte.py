@@ -0,0 +1,121 @@
+"""
+Carte choroplèthe d'un tableau par wilaya (CarteParTableauAPIView).
+Une seule réponse porte toutes les périodes : valeurs denses périodes × wilayas, tirées de la
+matrice du tableau (pivot de analyse.py), et les bornes de classes calculées par période
+(quantiles et intervalles égaux) ; le curseur d'année ne refait donc aucune requête.
+Les libellés de lignes sont rapprochés des wilayas du fond de carte (codes MR01…MR15 de
+mauritania.geojson) malgré les variantes d'orthographe ; les agrégats (Total, Mauritanie,
+Nouakchott avant 2014…) restent dans la réponse sans code et n'entrent pas dans les classes.
+Le résultat est mis en cache par version de matrice.
+"""
+import re
+import warnings
+
+import numpy as np
+from django.core.cache import cache
+
+from .analyse import DUREE_CACHE, _liste, pivoter
+from .matrice import charger_index, construire_index
+from .recherche import normaliser
+
+# (code du fond de carte, motif sur le libellé normalisé sans espaces ni ponctuation)
+WILAYAS = [
+    ("MR01", r"^h\w*charg"),               # Hodh ech Chargui, Hodh Charghi, H. Charghi…
+    ("MR02", r"^h\w*gh?arb"),              # Hodh el Gharbi, Hodh Elgarbi…
+    ("MR03", r"^assaba"),
+    ("MR04", r"^gorgol"),
+    ("MR05", r"^brakna"),
+    ("MR06", r"^trarza"),
+    ("MR07", r"^adrar"),
+    ("MR08", r"^(d|dakh\w*)?nou\w*bou$"),  # Dakhlet Nouadhibou, D. Nouadhibou…
+    ("MR09", r"^tagant"),
+    ("MR10", r"^guid"),                    # Guidimakha, Guidimagha, Guidimaka
+    ("MR11", r"^t\w*zemm?our$"),           # Tiris Zemmour, Tris Zemour
+    ("MR12", r"^[il]nchiri"),
+    ("MR13", r"^n(ouakchh?ott|ktt)\w*oues"),
+    ("MR14", r"^n(ouakchh?ott|ktt)\w*nord"),
+    ("MR15", r"^n(ouakchh?ott|ktt)\w*sud"),
+]
+_WILAYAS = [(code, re.compile(motif)) for code, motif in WILAYAS]
+NB_CLASSES = 5
+
+
+def code_wilaya(libelle):
+    """Code MRxx de la wilaya désignée par un libellé de ligne, ou None."""
+    compact = re.sub(r"^wilaya", "", re.sub(r"[^a-z]", "", normaliser(libelle)))
+    return next((code for code, motif in _WILAYAS if motif.search(compact)), None)
+
+
+def est_carte(etiquette_ligne, resultat):
+    """Le tableau se lit par wilaya : étiquette de ligne "Wilaya" ou lignes reconnues."""
+    return (etiquette_ligne or "").strip().lower() == "wilaya" or any(w["code"] for w in resultat["wilayas"])
+
+
+def bornes(V, nb_classes):
+    """
+    Bornes intérieures des classes de chaque période (V : périodes × wilayas, NaN si absente) :
+    quantiles et intervalles égaux, (nb_classes - 1) bornes par période.
+    """
+    parts = np.arange(1, nb_classes) / nb_classes
+    valides = ~np.isnan(V)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # périodes sans aucune valeur
+        quantiles = np.nanquantile(V, parts, axis=1).T if V.size else np.full((len(V), len(parts)), np.nan)
+    minimum = np.where(valides, V, np.inf).min(axis=1, initial=np.inf)
+    maximum = np.where(valides, V, -np.inf).max(axis=1, initial=-np.inf)
+    minimum[~np.isfinite(minimum)] = np.nan
+    maximum[~np.isfinite(maximum)] = np.nan
+    intervalles = minimum[:, None] + (maximum - minimum)[:, None] * parts[None, :]
+    return quantiles, intervalles, minimum, maximum
+
+
+def construire_carte(index, titre, nb_classes=NB_CLASSES):
+    _, periodes, _, series, X = pivoter(index)
+    lignes_ids = index.matrice.lignes.tolist()
+
+    # une valeur par ligne et période : le groupe "Total" s'il existe, sinon la moyenne des groupes
+    par_ligne = {}
+    for k, (i, groupe) in enumerate(series):
+        par_ligne.setdefault(i, []).append((groupe, k))
+    positions, lignes = [], []
+    for i, groupes in par_ligne.items():
+        totaux = [k for g, k in groupes if (g or "").strip().lower() == "total"]
+        positions.append(totaux or [k for _, k in groupes])
+        label = (index.lignes[i][0] or "").strip()
+        lignes.append({"ligne_id": lignes_ids[i], "nom": label, "code": code_wilaya(label)})
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # groupes tous vides
+        V = np.array([np.nanmean(X[ks], axis=0) for ks in positions]).reshape(len(positions), len(periodes)).T
+
+    # classes sur les seules wilayas reconnues (sinon sur toutes les lignes)
+    wilayas = np.array([l["code"] is not None for l in lignes], dtype=bool)
+    quantiles, intervalles, minimum, maximum = bornes(V[:, wilayas] if wilayas.any() else V, nb_classes)
+
+    return {
+        "titre": titre,
+        "periodes": periodes,
+        "wilayas": lignes,
+        "valeurs": [_liste(v) for v in V],
+        "classes": {
+            "nombre": nb_classes,
+            "quantiles": [_liste(b) for b in quantiles],
+            "intervalles": [_liste(b) for b in intervalles],
+            "min": _liste(minimum),
+            "max": _liste(maximum),
+        },
+        "version": index.version,
+    }
+
+
+def carte(tableau_id, titre, nb_classes=NB_CLASSES):
+    """Carte du tableau, en cache pour la version courante de sa matrice."""
+    index = charger_index(tableau_id)
+    if index is None:
+        return construire_carte(construire_index(tableau_id), titre, nb_classes)
+    cle = f"ansade:carte:{tableau_id}:v{index.version}:c{nb_classes}"
+    resultat = cache.get(cle)
+    if resultat is None:
+        resultat = construire_carte(index, titre, nb_classes)
+        cache.set(cle, resultat, DUREE_CACHE)
+    return resultat
@@ -0,0 +1,77 @@
+"""
+Hiérarchie des lignes d'un tableau (nouveau format : arbre code / parent_code).
+Calculée à l'import et enregistrée sur LigneIndicateur :
+- parent : ligne parente (None pour les lignes de tête) ;
+- niveau : profondeur (0 pour les lignes de tête) ;
+- rang : ordre d'affichage dans le tableau (parcours en profondeur) ;
+- rang_fin : rang de la dernière ligne du sous-arbre (bornes d'ensemble imbriqué) :
+  le sous-arbre d'une ligne est l'ensemble des lignes de rang compris entre son rang et son rang_fin.
+Module sans dépendance à Django ; la migration 0009 qui remplit ces champs en garde une copie figée.
+"""
+
+
+def cle_noeud(ligne_id, code):
+    """Les lignes de même code forment un seul nœud ; une ligne sans code est un nœud à elle seule."""
+    return (code or "").strip() or f"__row_{ligne_id}"
+
+
+def calculer_hierarchie(lignes, nouveau=True):
+    """
+    `lignes` : tuples (id, label, code, parent_code, ordre) dans l'ordre d'import.
+    Retourne {id: (parent_id, niveau, rang, rang_fin)} pour les lignes placées dans l'arbre.
+    Les frères sont triés comme à l'affichage : par ordre (sans ordre en dernier) puis libellé.
+    Les lignes d'un même code partagent la position de la première.
+    Ancien format (`nouveau=False`) : toutes les lignes sont de niveau 0, dans l'ordre d'import.
+    """
+    if not nouveau:
+        return {ligne_id: (None, 0, rang, rang) for rang, (ligne_id, *_) in enumerate(lignes)}
+
+    noeuds = {}  # clé -> nœud, la première ligne rencontrée donne le libellé et l'ordre
+    membres = {}  # clé -> ids des lignes du nœud
+    for ligne_id, label, code, parent_code, ordre in lignes:
+        cle = cle_noeud(ligne_id, code)
+        membres.setdefault(cle, []).append(ligne_id)
+        if cle not in noeuds:
+            noeuds[cle] = {
+                "cle": cle,
+                "id": ligne_id,
+                "parent_code": (parent_code or "").strip(),
+                "indicateur": (label or "").strip(),
+                "ordre": ordre,
+                "enfants": [],
+            }
+
+    racines = []
+    for noeud in noeuds.values():
+        p = noeud["parent_code"]
+        if p and p in noeuds:
+            noeuds[p]["enfants"].append(noeud)
+        else:
+            racines.append(noeud)
+
+    def trier(freres):
+        return sorted(freres, key=lambda n: (n["ordre"] is None, n["ordre"], n["indicateur"]))
+
+    # 1) Parcours en profondeur itératif (pas de limite de récursion sur les arbres profonds).
+    # Les nœuds pris dans une boucle de parents (A -> B -> A) ne sont atteints depuis aucune
+    # racine : comme à l'affichage, ils restent hors de l'arbre (absents du résultat).
+    parcours = []  # (nœud, parent_id, niveau) dans l'ordre d'affichage
+    pile = [(noeud, None, 0) for noeud in reversed(trier(racines))]
+    while pile:
+        noeud, parent_id, niveau = pile.pop()
+        parcours.append((noeud, parent_id, niveau))
+        pile.extend((enfant, noeud["id"], niveau + 1) for enfant in reversed(trier(noeud["enfants"])))
+
+    # 2) Fin de sous-arbre : dernier rang avant le prochain nœud de niveau inférieur ou égal
+    rangs_fin = [len(parcours) - 1] * len(parcours)
+    ouverts = []
+    for rang, (_, _, niveau) in enumerate(parcours):
+        while ouverts and parcours[ouverts[-1]][2] >= niveau:
+            rangs_fin[ouverts.pop()] = rang - 1
+        ouverts.append(rang)
+
+    resultat = {}
+    for rang, (noeud, parent_id, niveau) in enumerate(parcours):
+        for membre in membres[noeud["cle"]]:
+            resultat[membre] = (parent_id, niveau, rang, rangs_fin[rang])
+    return resultat
@@ -0,0 +1,452 @@
+import logging
+import multiprocessing
+import os
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+import openpyxl
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .bulk import ecriture_feuille
+from .hierarchie import calculer_hierarchie
+from .lecture import (
+    ErreurImport, analyser_feuille_pool, deployer, empreinte_evenements, init_lecteur, lire_feuille,
+)
+from .models import Colonne, Donnees, LigneIndicateur, Tableau, TacheImport
+from .structure import format_lignes, regenerer_apres_commit
+
+logger = logging.getLogger(__name__)
+
+
+def ecrire_feuille(nom_feuille, evenements, id_theme, empreinte=""):
+    """
+    Écrit en base les événements d'une feuille (voir lecture.lire_feuille) au fil de l'eau.
+    Retourne les statistiques d'écriture, ou None si la feuille ne contient pas de tableau.
+    """
+    with ecriture_feuille(nom_feuille) as ecriture:
+        ligne = None
+        nouveau = False  # format du tableau en cours : une ligne avec code ou ordre => nouveau
+        for genre, contenu in evenements:
+            if genre == "cellule":
+                colonne, unite, valeur, statut, note = contenu
+                ecriture.ajouter_donnee(
+                    ligne=ligne,
+                    colonne=colonne,
+                    unite=unite,
+                    valeur=valeur,
+                    statut=statut,
+                    note_colonne=note,
+                )
+            elif genre == "ligne":
+                label, code, parent_code, ordre = contenu
+                ligne = ecriture.ajouter_ligne(label=label, code=code, parent_code=parent_code, ordre=ordre)
+                nouveau = nouveau or bool(code) or ordre is not None
+            elif genre == "tableau":
+                if ecriture.tableau:
+                    ecriture.abandonner()
+                ecriture.creer_tableau(theme_id=id_theme, empreinte=empreinte, **contenu)
+                nouveau = False
+            elif genre == "fin":
+                ecriture.corriger(**contenu)
+            elif genre == "annuler":
+                ecriture.abandonner()
+                nouveau = False
+
+        if ecriture.tableau:
+            ecriture.tableau.format = Tableau.NOUVEAU if nouveau else Tableau.ANCIEN
+            ecriture.tableau.save(update_fields=["format"])
+            ecriture.vider()
+            hierarchiser(ecriture.tableau, ecriture.batch_size)
+    return ecriture.stats if ecriture.tableau else None
+
+
+def hierarchiser(tableau, batch_size=1000, ordre_feuille=None):
+    """
+    Calcule la hiérarchie des lignes du tableau (parent, niveau, rang, rang_fin)
+    et n'enregistre que les lignes dont la position a changé.
+    Les lignes sont prises dans l'ordre des id (ordre d'import), ou dans l'ordre de la feuille
+    si `ordre_feuille` (id des lignes dans l'ordre de la feuille) est donné : après une mise
+    à jour, une ligne ajoutée au milieu de la feuille a un id plus grand que les suivantes.
+    """
+    lignes = list(
+        LigneIndicateur.objects.filter(tableau=tableau).order_by("id")
+        .values_list("id", "label", "code", "parent_code", "ordre", "parent_id", "niveau", "rang", "rang_fin")
+    )
+    if ordre_feuille is not None:
+        position = {pk: i for i, pk in enumerate(ordre_feuille)}
+        lignes.sort(key=lambda l: position.get(l[0], len(position)))
+    positions = calculer_hierarchie((l[:5] for l in lignes), tableau.format != Tableau.ANCIEN)
+    a_jour = []
+    for pk, *_, parent_id, niveau, rang, rang_fin in lignes:
+        position = positions.get(pk, (None, 0, None, None))  # ligne hors de l'arbre
+        if position != (parent_id, niveau, rang, rang_fin):
+            a_jour.append(LigneIndicateur(
+                pk=pk, parent_id=position[0], niveau=position[1], rang=position[2], rang_fin=position[3],
+            ))
+    LigneIndicateur.objects.bulk_update(a_jour, ["parent", "niveau", "rang", "rang_fin"], batch_size=batch_size)
+    return len(a_jour)
+
+
+def _collecter(evenements):
+    """
+    Charge en mémoire le contenu final d'une feuille (corrections de fin incluses) :
+    (entete, lignes, cellules) avec cellules = [(index_ligne, colonne, unite, valeur, statut, note)].
+    """
+    entete, lignes, cellules = None, [], []
+    for genre, contenu in evenements:
+        if genre == "cellule":
+            cellules.append((len(lignes) - 1, *contenu))
+        elif genre == "ligne":
+            lignes.append(contenu)
+        elif genre == "tableau":
+            entete, lignes, cellules = dict(contenu), [], []
+        elif genre == "annuler":
+            entete, lignes, cellules = None, [], []
+        elif genre == "fin":
+            if contenu.get("source") is not None:
+                entete["source"] = contenu["source"]
+            notes = contenu.get("notes") or {}
+            if notes:
+                cellules = [
+                    (i, col, unite, val, statut, notes.get(col, note))
+                    for i, col, unite, val, statut, note in cellules
+                ]
+    return entete, lignes, cellules
+
+
+def _cles_occurrences(cles):
+    """Numérote les clés répétées : [a, b, a] -> [(a, 0), (b, 0), (a, 1)]."""
+    vues = Counter()
+    resultat = []
+    for cle in cles:
+        resultat.append((cle, vues[cle]))
+        vues[cle] += 1
+    return resultat
+
+
+def mettre_a_jour_feuille(tableau, evenements, empreinte):
+    """
+    Réimporte une feuille déjà connue en n'écrivant que les différences :
+    les lignes sont appariées par (label, code), les colonnes par libellé et les cellules
+    par (ligne, colonne) ; seuls les éléments nouveaux, modifiés ou disparus sont écrits.
+    """
+    entete, lignes, cellules = _collecter(evenements)
+    if entete is None:
+        return None
+
+    with ecriture_feuille(tableau.nom_feuille) as ecriture:
+        ecriture.tableau = tableau
+
+        # 1) En-tête du tableau
+        entete = {**entete, "format": format_lignes(lignes)}
+        champs = [c for c, v in entete.items() if getattr(tableau, c) != v]
+        for c in champs:
+            setattr(tableau, c, entete[c])
+        tableau.empreinte = empreinte
+        tableau.save(update_fields=champs + ["empreinte"])
+
+        # 2) Lignes : appariement par (label, code) et rang d'apparition
+        anciennes_lignes = list(
+            LigneIndicateur.objects.filter(tableau=tableau).order_by("id")
+            .values_list("id", "label", "code", "parent_code", "ordre")
+        )
+        existantes = {
+            cle: (pk, parent_code, ordre)
+            for cle, (pk, _, _, parent_code, ordre) in zip(
+                _cles_occurrences((label, code or "") for _, label, code, _, _ in anciennes_lignes),
+                anciennes_lignes,
+            )
+        }
+
+        lignes_modifiees = []
+        ids_lignes = []  # index de ligne -> id existant ou LigneIndicateur à créer
+        for cle, (label, code, parent_code, ordre) in zip(
+            _cles_occurrences((label, code or "") for label, code, _, _ in lignes), lignes
+        ):
+            trouvee = existantes.pop(cle, None)
+            if trouvee is None:
+                ids_lignes.append(ecriture.ajouter_ligne(
+                    label=label, code=code, parent_code=parent_code, ordre=ordre
+                ))
+                continue
+            pk, ancien_parent, ancien_ordre = trouvee
+            ids_lignes.append(pk)
+            if (ancien_parent or "") != parent_code or ancien_ordre != ordre:
+                lignes_modifiees.append(LigneIndicateur(pk=pk, parent_code=parent_code, ordre=ordre))
+        ecriture.vider()
+        ids_lignes = [l if isinstance(l, int) else l.pk for l in ids_lignes]
+
+        # 3) Colonnes : appariement par libellé, note et ordre d'apparition mis à jour
+        voulues = {}  # libellé -> note de sa première cellule, dans l'ordre d'apparition
+        for _, colonne, _, _, _, note in cellules:
+            voulues.setdefault(colonne, note)
+        colonnes_existantes = {c.label: c for c in Colonne.objects.filter(tableau=tableau)}
+        libelles = {c.id: label for label, c in colonnes_existantes.items()}
+        colonnes_modifiees = []
+        ecriture.colonnes = {}
+        for ordre, (label, note) in enumerate(voulues.items()):
+            colonne = colonnes_existantes.pop(label, None)
+            if colonne is None:
+                ecriture.colonne(label, note)
+                continue
+            ecriture.colonnes[label] = colonne
+            if (colonne.note, colonne.ordre) != (note, ordre):
+                colonne.note, colonne.ordre = note, ordre
+                colonnes_modifiees.append(colonne)
+        ecriture.vider()
+
+        # 4) Cellules : appariement par (ligne, colonne)
+        valeurs = list(
+            Donnees.objects.filter(tableau=tableau).order_by("id")
+            .values_list("id", "ligne_id", "colonne_id", "unite", "valeur", "statut")
+        )
+        anciennes = {
+            cle: (pk, tuple(contenu))
+            for cle, (pk, _, _, *contenu) in zip(
+                _cles_occurrences((ligne_id, libelles[colonne_id]) for _, ligne_id, colonne_id, *_ in valeurs),
+                valeurs,
+            )
+        }
+        del valeurs
+
+        cellules_modifiees = []
+        for cle, (i, colonne, unite, valeur, statut, _) in zip(
+            _cles_occurrences((ids_lignes[i], colonne) for i, colonne, *_ in cellules), cellules
+        ):
+            nouveau = (unite, valeur, statut)
+            trouvee = anciennes.pop(cle, None)
+            if trouvee is None:
+                ecriture.ajouter_donnee(
+                    ligne_id=ids_lignes[i], colonne=colonne, unite=unite, valeur=valeur, statut=statut,
+                )
+            elif trouvee[1] != nouveau:
+                cellules_modifiees.append(Donnees(pk=trouvee[0], unite=unite, valeur=valeur, statut=statut))
+
+        # 5) Mises à jour puis suppressions (cellules, lignes et colonnes disparues)
+        LigneIndicateur.objects.bulk_update(
+            lignes_modifiees, ["parent_code", "ordre"], batch_size=ecriture.batch_size
+        )
+        Colonne.objects.bulk_update(colonnes_modifiees, ["note", "ordre"], batch_size=ecriture.batch_size)
+        Donnees.objects.bulk_update(
+            cellules_modifiees, ["unite", "valeur", "statut"], batch_size=ecriture.batch_size,
+        )
+        ids_supprimes = [pk for pk, _ in anciennes.values()]
+        ids_lignes_supprimees = [pk for pk, _, _ in existantes.values()]
+        for debut in range(0, len(ids_supprimes), ecriture.batch_size):
+            Donnees.objects.filter(id__in=ids_supprimes[debut:debut + ecriture.batch_size]).delete()
+        Donnees.objects.filter(ligne_id__in=ids_lignes_supprimees).delete()
+        LigneIndicateur.objects.filter(id__in=ids_lignes_supprimees).delete()
+        Colonne.objects.filter(id__in=[c.id for c in colonnes_existantes.values()]).delete()
+        hierarchiser(tableau, ecriture.batch_size, ids_lignes)
+
+    return {
+        **ecriture.stats,
+        "lignes_modifiees": len(lignes_modifiees),
+        "lignes_supprimees": len(ids_lignes_supprimees),
+        "donnees_modifiees": len(cellules_modifiees),
+        "donnees_supprimees": len(ids_supprimes),
+    }
+
+
+def importer_feuille(feuille, lire, id_theme):
+    """
+    Importe une feuille de façon idempotente. `lire()` renvoie les événements de la feuille.
+    Une feuille est identifiée par (nom_feuille, theme) et une empreinte de son contenu :
+    - feuille inconnue : import complet ;
+    - empreinte identique : rien n'est écrit ;
+    - empreinte différente : mise à jour en place des seules différences.
+    """
+    empreinte = empreinte_evenements(lire())
+    if empreinte is None:
+        return {"feuille": feuille, "statut": "ignoree"}
+
+    tableau = (
+        Tableau.objects
+        .filter(nom_feuille=feuille, theme_id=id_theme)
+        .order_by("-id")
+        .first()
+    )
+    if tableau is None:
+        stats = ecrire_feuille(feuille, lire(), id_theme, empreinte)
+        regenerer_apres_commit(stats["tableau_id"])
+        return {**stats, "statut": "importee"}
+    if tableau.empreinte == empreinte:
+        return {"feuille": feuille, "tableau_id": tableau.id, "statut": "inchangee"}
+    stats = mettre_a_jour_feuille(tableau, lire(), empreinte)
+    regenerer_apres_commit(tableau.id)
+    return {**stats, "statut": "mise_a_jour"}
+
+
+def _analyses(fichier, wb, processus):
+    """
+    Produit (feuille, lire) dans l'ordre des feuilles : `lire()` renvoie les événements de
+    la feuille, ou `lire` est l'exception levée si la lecture de la feuille a échoué.
+    En séquentiel, chaque appel à `lire()` relit la feuille en flux.
+    Avec processus > 1 et un chemin de fichier, les feuilles sont lues en parallèle :
+    au plus `processus` feuilles sont en cours de lecture ou en attente d'écriture (une
+    nouvelle feuille est soumise quand la plus ancienne est écrite), et chaque processus
+    renvoie les événements de sa feuille sous forme compacte (lecture.compacter).
+    Si le pool est cassé (processus tué, mémoire épuisée...), les feuilles pas encore rendues
+    sont lues ici en séquentiel : chacune reçoit quand même son état final.
+    """
+    feuilles = wb.sheetnames
+    parallele = processus > 1 and len(feuilles) > 1 and isinstance(fichier, (str, os.PathLike))
+
+    if not parallele:
+        for feuille in feuilles:
+            yield feuille, partial(lire_feuille, wb[feuille], feuille)
+        return
+
+    restantes = deque(feuilles)  # feuilles pas encore rendues, dans l'ordre du classeur
+    # "spawn" : les processus fils ne doivent pas hériter des connexions à la base
+    with ProcessPoolExecutor(
+        max_workers=min(processus, len(feuilles)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_lecteur,
+        initargs=(os.fspath(fichier),),
+    ) as pool:
+        soumises = {}
+
+        def soumettre():
+            for feuille in islice(restantes, processus):
+                if feuille not in soumises:
+                    soumises[feuille] = pool.submit(analyser_feuille_pool, feuille)
+
+        casse = False
+        while restantes and not casse:
+            feuille = restantes[0]
+            try:
+                soumettre()
+                lire = partial(deployer, soumises[feuille].result())
+            except BrokenProcessPool:
+                break
+            except Exception as e:
+                lire = e
+            restantes.popleft()
+            del soumises[feuille]
+            try:
+                soumettre()
+            except BrokenProcessPool:
+                casse = True
+            yield feuille, lire
+
+    if restantes:
+        logger.warning(
+            "Pool de lecture interrompu : %s feuille(s) lue(s) en séquentiel (%s)", len(restantes), fichier,
+        )
+    for feuille in restantes:
+        yield feuille, partial(lire_feuille, wb[feuille], feuille)
+
+
+def importer_classeur(fichier, id_theme, progression=None, processus=1):
+    """
+    Importe toutes les feuilles d'un classeur Excel.
+    Les feuilles peuvent être lues dans `processus` processus ; l'écriture reste
+    faite ici, une feuille après l'autre, dans l'ordre du classeur.
+    `progression(feuille, rapport)` est appelé à chaque changement d'état d'une feuille
+    (en_attente, en_cours, importee, mise_a_jour, inchangee, ignoree, erreur) ; une feuille
+    en erreur est annulée (sa transaction) sans bloquer les suivantes.
+    """
+    try:
+        wb = openpyxl.load_workbook(fichier, data_only=True, read_only=True)
+    except Exception as e:
+        raise ErreurImport(f'Erreur de lecture du fichier : {str(e)}')
+
+    rapports = []
+    try:
+        if progression:
+            for feuille in wb.sheetnames:
+                progression(feuille, {"feuille": feuille, "statut": "en_attente"})
+        for feuille, lire in _analyses(fichier, wb, processus):
+            if progression:
+                progression(feuille, {"feuille": feuille, "statut": "en_cours"})
+            try:
+                if isinstance(lire, Exception):
+                    raise lire
+                rapport = importer_feuille(feuille, lire, id_theme)
+            except Exception as e:
+                logger.exception("Échec de l'import de la feuille %s", feuille)
+                rapport = {"feuille": feuille, "statut": "erreur", "erreur": str(e)}
+            rapports.append(rapport)
+            if progression:
+                progression(feuille, rapport)
+    finally:
+        wb.close()
+    return rapports
+
+
+# --------- file d'attente des imports ---------
+
+def reserver_tache():
+    """
+    Réserve la plus ancienne tâche à traiter (verrou SKIP LOCKED sur PostgreSQL) : une tâche
+    en attente, ou une tâche en cours dont le worker ne donne plus signe de vie depuis
+    ANSADE_IMPORT_DELAI_REPRISE minutes (worker arrêté en plein import). L'import étant
+    idempotent, la reprise ne réécrit pas les feuilles déjà importées. Une tâche déjà essayée
+    ANSADE_IMPORT_TENTATIVES fois est marquée échouée au lieu d'être reprise.
+    """
+    delai = timedelta(minutes=getattr(settings, 'ANSADE_IMPORT_DELAI_REPRISE', 30))
+    tentatives = getattr(settings, 'ANSADE_IMPORT_TENTATIVES', 3)
+    while True:
+        with transaction.atomic():
+            maintenant = timezone.now()
+            tache = (
+                TacheImport.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(statut=TacheImport.EN_ATTENTE)
+                    | Q(statut=TacheImport.EN_COURS, actif_le__lt=maintenant - delai)
+                )
+                .order_by('cree_le')
+                .first()
+            )
+            if tache is None:
+                return None
+            if tache.tentatives >= tentatives:
+                logger.error("Tâche d'import %s abandonnée après %s essais", tache.id, tache.tentatives)
+                tache.statut = TacheImport.ECHOUEE
+                tache.erreur = f"Import interrompu {tache.tentatives} fois (worker arrêté pendant l'import)."
+                tache.fin = maintenant
+                tache.fichier.delete(save=False)
+                tache.save(update_fields=['statut', 'erreur', 'fin', 'fichier'])
+                continue
+            tache.statut = TacheImport.EN_COURS
+            tache.debut = tache.actif_le = maintenant
+            tache.tentatives += 1
+            tache.save(update_fields=['statut', 'debut', 'actif_le', 'tentatives'])
+        return tache
+
+
+def executer_tache(tache, processus=1):
+    """
+    Importe le fichier d'une tâche en enregistrant l'avancement feuille par feuille
+    (chaque enregistrement est aussi un signe de vie du worker). Le fichier déposé est
+    supprimé une fois la tâche terminée ou échouée.
+    """
+    feuilles = OrderedDict()
+
+    def progression(feuille, rapport):
+        feuilles[feuille] = rapport
+        tache.feuilles = list(feuilles.values())
+        tache.actif_le = timezone.now()
+        tache.save(update_fields=['feuilles', 'actif_le'])
+
+    try:
+        importer_classeur(tache.fichier.path, tache.theme_id, progression, processus)
+    except Exception as e:
+        logger.exception("Échec de la tâche d'import %s", tache.id)
+        tache.statut = TacheImport.ECHOUEE
+        tache.erreur = str(e)
+    else:
+        tache.statut = TacheImport.TERMINEE
+    tache.fin = timezone.now()
+    tache.fichier.delete(save=False)
+    tache.save(update_fields=['statut', 'erreur', 'fin', 'fichier'])
+    return tache
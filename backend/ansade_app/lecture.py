@@ -0,0 +1,491 @@
+"""
+Lecture des feuilles Excel importées.
+Une feuille est lue ligne par ligne et produit une suite d'événements (genre, contenu) :
+- ("tableau", {titre, source, etiquette_ligne})
+- ("ligne", (label, code, parent_code, ordre))
+- ("cellule", (colonne, unite, valeur, statut, note_colonne)) : cellule de la dernière ligne
+- ("fin", {"source": ..., "notes": {colonne: note}}) : corrections connues en fin de feuille
+- ("annuler", None) : le tableau commencé n'est finalement pas retenu
+Un nouvel événement "tableau" remplace le tableau en cours (ancien format à plusieurs titres).
+Ce module ne dépend pas de Django : il peut être exécuté dans les processus
+du pool d'analyse (voir importation.importer_classeur).
+"""
+import hashlib
+import re
+from array import array
+from datetime import datetime
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+import openpyxl
+from openpyxl.utils.datetime import from_excel
+
+
+class ErreurImport(Exception):
+    """Erreur bloquante rencontrée pendant la lecture d'un classeur."""
+
+
+def parse_numeric(cell):
+    """Retourne (valeur_float_ou_None, had_percent_sign: bool)"""
+    if isinstance(cell, str):
+        had_pct = '%' in cell
+        txt = (cell.replace('%', '')
+                   .replace('\u202f', '')
+                   .replace(' ', '')
+                   .replace(',', '.')).strip()
+        if txt == '':
+            return None, had_pct
+        try:
+            return float(txt), had_pct
+        except ValueError:
+            return None, had_pct
+    elif isinstance(cell, (int, float)):
+        return float(cell), False
+    return None, False
+
+
+def format_excel_date(value):
+    """Convertit une valeur Excel en texte mois-année (ex: janv-12)."""
+    mois_fr = [
+        "janv", "févr", "mars", "avr", "mai", "juin",
+        "juil", "août", "sept", "oct", "nov", "déc"
+    ]
+    try:
+        # Si Excel a stocké la date comme nombre
+        if isinstance(value, (int, float)):
+            date_val = from_excel(value)
+            return f"{mois_fr[date_val.month - 1]}-{str(date_val.year)[2:]}"
+        # Si c'est un datetime
+        if isinstance(value, datetime):
+            return f"{mois_fr[value.month - 1]}-{str(value.year)[2:]}"
+        # Si c’est une chaîne ISO comme "2012-01-01"
+        if isinstance(value, str):
+            try:
+                date_val = datetime.fromisoformat(value.split(" ")[0])
+                return f"{mois_fr[date_val.month - 1]}-{str(date_val.year)[2:]}"
+            except Exception:
+                return value.strip()
+        return str(value)
+    except Exception:
+        return str(value)
+
+
+# Nombre de lignes non vides examinées pour trouver le titre "TABLEAU ..." (ancien format)
+FENETRE_ENTETE = 50
+
+COLONNES_NOUVEAU_FORMAT = ["titre_fr", "source_fr", "ordre", "code", "parent", "des_fr"]
+
+
+def lignes_normalisees(ws):
+    """Itère sur les lignes non vides d'une feuille, cellules converties en texte."""
+    for row in ws.iter_rows(values_only=True):
+        row_str = [str(cell).strip() if cell is not None else '' for cell in row]
+        if all(cell == '' for cell in row_str):
+            continue
+        yield row_str
+
+
+def convertir_valeur(raw_val, had_percent, is_pourcentage):
+    """Applique l'unité "%" et la mise à l'échelle des pourcentages saisis en texte."""
+    unite = ""
+    val = raw_val
+    if is_pourcentage or had_percent:
+        unite = "%"
+
+        # ✅ Si la cellule Excel est un texte contenant "%", on divise par 100
+        # sinon (Excel stocke déjà 0.1502 pour 15%), on ne touche pas.
+        if had_percent:
+            val = val / 100.0 if val is not None else None
+
+        # ✅ Garder plus de précision (4 décimales)
+        val = round(val, 4) if val is not None else None
+    return unite, val
+
+
+def est_titre(up):
+    """Ligne de titre de l'ancien format ("TABLEAU 2.1 : ...")."""
+    return bool(re.search(r'\bTABLEAU\b', up) or re.match(r'^\s*TAB(?:LEAU)?\s*[\.:]?\s*\d+', up))
+
+
+def lire_feuille(ws, feuille, fenetre=FENETRE_ENTETE):
+    """
+    Lit une feuille (nouveau ou ancien format) en flux, sans toucher à la base.
+    Ne produit aucun événement si la feuille ne contient pas de tableau.
+    """
+    rows = lignes_normalisees(ws)
+    entete = next(rows, None)
+    if entete is None:
+        return
+
+    normalized_first_row = [h.lower() for h in entete]
+    if all(col in normalized_first_row for col in COLONNES_NOUVEAU_FORMAT):
+        yield from _lire_nouveau_format(entete, normalized_first_row, rows)
+    else:
+        yield from _lire_ancien_format(chain([entete], rows), fenetre)
+
+
+def _lire_nouveau_format(entete, normalized_first_row, rows):
+    # ==============================
+    # NOUVEAU FORMAT (structuré)
+    # ==============================
+    try:
+        titre_fr_idx = normalized_first_row.index('titre_fr')
+        source_fr_idx = normalized_first_row.index('source_fr')
+        ordre_idx = normalized_first_row.index('ordre')
+        code_idx = normalized_first_row.index('code')
+        parent_idx = normalized_first_row.index('parent')
+        des_fr_idx = normalized_first_row.index('des_fr')
+    except ValueError as e:
+        raise ErreurImport(f"Colonnes manquantes : {str(e)}")
+
+    # ✅ Inclure toutes les colonnes sauf 'Agreg'
+    annee_indexes = []
+    for i in range(des_fr_idx + 1, len(entete)):
+        header = str(entete[i]).strip()
+        if header == "" or header.lower() in ["agreg", "agrég", "agrégée"]:
+            continue  # ignorer les colonnes sans nom
+        annee_indexes.append(i)
+    colonnes, notes_colonnes = compiler_colonnes(entete, annee_indexes)
+
+    premiere = next(rows, None)
+    if premiere is None:
+        return
+
+    titre = premiere[titre_fr_idx]
+    source = premiere[source_fr_idx]
+    is_pourcentage = "%" in titre
+
+    yield "tableau", {
+        "titre": titre,
+        "source": source,
+        "etiquette_ligne": "Indicateur",
+    }
+
+    # ✅ Notes de bas de page (ex: "* Données RGE 2024") : elles sont en général en bas
+    # de la feuille, les colonnes étoilées reçoivent donc leur note en fin de lecture.
+    notes_etoiles = {}
+
+    # Les valeurs sont extraites par blocs de lignes puis analysées d'un coup (analyser_bloc)
+    largeur = max(annee_indexes, default=-1) + 1
+    extraire = _extracteur(annee_indexes)
+    lignes, textes = [], []
+    nb_lignes = 0
+
+    for row in chain([entete, premiere], rows):
+        first_cell = row[0] if row else ""
+        if first_cell.startswith("*"):
+            # exemple: "* Données RGE 2024"
+            notes_etoiles["*"] = first_cell.lstrip("*").strip()  # on stocke la note brute
+
+        if row is entete:
+            continue
+
+        label_raw = row[des_fr_idx] if len(row) > des_fr_idx else ''
+        label = format_excel_date(label_raw).strip()
+
+        # ⚠️ Si le label est vide (aucun indicateur), on saute la ligne
+        if not label:
+            continue
+
+        code = str(row[code_idx]).strip() if len(row) > code_idx and row[code_idx] else ''
+        parent_code = str(row[parent_idx]).strip() if len(row) > parent_idx and row[parent_idx] else ''
+
+        ordre = None
+        if len(row) > ordre_idx and row[ordre_idx] != '':
+            try:
+                ordre = int(float(str(row[ordre_idx]).replace(',', '.')))
+            except Exception:
+                ordre = None
+
+        # Cellules absentes en fin de ligne : texte vide (même statut que les cellules vides)
+        if len(row) < largeur:
+            row = row + [''] * (largeur - len(row))
+        lignes.append((label, code, parent_code, ordre))
+        textes.append(extraire(row))
+        nb_lignes += 1
+        if len(lignes) >= TAILLE_BLOC:
+            yield from _evenements_bloc(lignes, textes, colonnes, notes_colonnes, is_pourcentage)
+            lignes, textes = [], []
+
+    # Même si toute la ligne est vide, elle a été créée avec statut="" pour chaque colonne
+    yield from _evenements_bloc(lignes, textes, colonnes, notes_colonnes, is_pourcentage)
+
+    colonnes_etoilees = [col for col, note in zip(colonnes, notes_colonnes) if note is not None]
+    if notes_etoiles and colonnes_etoilees and nb_lignes:
+        yield "fin", {"notes": {col: notes_etoiles["*"] for col in dict.fromkeys(colonnes_etoilees)}}
+
+
+# Nombre de lignes analysées ensemble par analyser_bloc (nouveau format)
+TAILLE_BLOC = 500
+
+# Séparateur utilisé pour nettoyer toutes les cellules d'un bloc en une seule passe
+SEPARATEUR = "\x1f"
+
+def compiler_colonnes(entete, annee_indexes):
+    """
+    Descripteurs des colonnes d'années, calculés une fois par feuille :
+    libellés (dates Excel converties) et note de colonne ("" pour les colonnes étoilées,
+    complétée par l'événement "fin", sinon None).
+    """
+    colonnes = [str(format_excel_date(entete[idx])) for idx in annee_indexes]
+    notes = ["" if "*" in col else None for col in colonnes]
+    return colonnes, notes
+
+
+def _extracteur(indexes):
+    """Fonction qui extrait les cellules d'une ligne aux indexes donnés, sous forme de tuple."""
+    if not indexes:
+        return lambda row: ()
+    if len(indexes) == 1:
+        idx = indexes[0]
+        return lambda row: (row[idx],)
+    return itemgetter(*indexes)
+
+
+def _en_nombre(txt):
+    try:
+        return float(txt)
+    except ValueError:
+        return None
+
+
+def analyser_bloc(textes, is_pourcentage):
+    """
+    Version vectorisée de parse_numeric + convertir_valeur pour un bloc de cellules texte
+    (liste de lignes, une cellule par colonne d'année).
+    Retourne trois listes à plat, ligne par ligne : unite, valeur, statut
+    (le statut garde le texte d'origine, ex "N/D", quand la cellule n'est pas numérique).
+    """
+    cellules = [cell for ligne in textes for cell in ligne]
+    nb = len(cellules)
+
+    # ✅ Nettoyage (%, espaces, virgule décimale) sur le texte de tout le bloc d'un coup
+    bloc = SEPARATEUR.join(cellules)
+    if bloc.count(SEPARATEUR) == nb - 1:
+        nettoyees = (bloc.replace('%', '')
+                         .replace('\u202f', '')
+                         .replace(' ', '')
+                         .replace(',', '.')).split(SEPARATEUR)
+    else:
+        # le séparateur apparaît dans une cellule : nettoyage cellule par cellule
+        nettoyees = [c.replace('%', '').replace('\u202f', '').replace(' ', '').replace(',', '.') for c in cellules]
+
+    valeurs = list(map(_en_nombre, nettoyees))
+    statuts = [None if val is not None else cell for val, cell in zip(valeurs, cellules)]
+
+    if not is_pourcentage and '%' not in bloc:
+        return [""] * nb, valeurs, statuts
+
+    numerique = np.array([val is not None for val in valeurs], dtype=bool)
+    had_pct = np.array(['%' in cell for cell in cellules], dtype=bool)
+    nombres = np.array(valeurs, dtype=np.float64)  # None -> NaN
+    nombres = np.where(had_pct, nombres / 100.0, nombres)
+
+    en_pourcentage = numerique & (had_pct | is_pourcentage)
+    resultat = np.array(valeurs, dtype=object)
+    # ✅ 4 décimales, avec l'arrondi de round() (np.round peut différer d'un ulp)
+    resultat[en_pourcentage] = [round(v, 4) for v in nombres[en_pourcentage].tolist()]
+
+    unites = np.where(en_pourcentage, "%", "").tolist()
+    return unites, resultat.tolist(), statuts
+
+
+def _evenements_bloc(lignes, textes, colonnes, notes_colonnes, is_pourcentage):
+    """Événements "ligne" / "cellule" d'un bloc de lignes analysé par analyser_bloc."""
+    unites, valeurs, statuts = analyser_bloc(textes, is_pourcentage)
+    nb_colonnes = len(colonnes)
+    for i, ligne in enumerate(lignes):
+        yield "ligne", ligne
+        debut = i * nb_colonnes
+        for j in range(nb_colonnes):
+            k = debut + j
+            yield "cellule", (colonnes[j], unites[k], valeurs[k], statuts[k], notes_colonnes[j])
+
+
+def _lire_ancien_format(rows, fenetre):
+    # ==============================
+    # ANCIEN FORMAT
+    # ==============================
+    titre = ""
+    source = ""
+
+    def detecter_source(joined, up):
+        if re.search(r'\bSOURCE\b', up):
+            src_text = re.sub(r'(?i)^source\s*:?', '', joined).strip()
+            if src_text:
+                return src_text
+        return None
+
+    # 1) Recherche du titre "TABLEAU ..." dans une fenêtre bornée de lignes
+    for n, row in enumerate(rows):
+        if n >= fenetre:
+            return
+        joined = " ".join([c for c in row if c]).strip()
+        up = joined.upper()
+
+        if est_titre(up):
+            titre = joined
+            break
+
+        source = detecter_source(joined, up) or source
+
+    if not titre:
+        return
+
+    # Une feuille peut enchaîner plusieurs "TABLEAU ..." : comme auparavant, c'est le
+    # dernier qui est retenu (événement "tableau" répété, ou "annuler" s'il est vide).
+    source_initiale = None
+    while titre:
+        # 2) La première ligne non vide après le titre contient les en-têtes de colonnes
+        headers_old = next(rows, None)
+        if not headers_old:
+            if source_initiale is not None:
+                yield "annuler", None
+            return
+        joined = " ".join([c for c in headers_old if c]).strip()
+        if est_titre(joined.upper()):
+            titre = joined  # deux titres consécutifs : seul le second compte
+            continue
+        source = detecter_source(joined, joined.upper()) or source
+
+        etiquette_value = headers_old[0]
+        colonnes = [format_excel_date(h) for h in headers_old]  # ✅ colonnes
+
+        source_initiale = source
+        yield "tableau", {
+            "titre": titre,
+            "source": source,
+            "etiquette_ligne": etiquette_value,
+        }
+
+        is_pourcentage = "%" in titre
+        titre = None
+
+        # 3) Lignes de données
+        for row in rows:
+            joined = " ".join([c for c in row if c]).strip()
+            up = joined.upper()
+
+            if est_titre(up):
+                titre = joined
+                break
+
+            source = detecter_source(joined, up) or source
+
+            if len(row) < 2:
+                continue
+
+            indicateur_brut = format_excel_date(row[0])  # ✅ formate les lignes
+            if not indicateur_brut:
+                continue
+
+            yield "ligne", (indicateur_brut, '', '', None)  # ✅ version formatée
+
+            for cidx in range(1, min(len(headers_old), len(row))):
+                annee = colonnes[cidx]
+                if not annee:
+                    continue
+
+                raw_val, had_percent = parse_numeric(row[cidx])
+                if raw_val is None:
+                    if row[cidx]:  # s'il y a "N/D" ou "NS" etc.
+                        yield "cellule", (str(annee), "", None, row[cidx], None)
+                    continue
+
+                unite, val = convertir_valeur(raw_val, had_percent, is_pourcentage)
+                yield "cellule", (str(annee), unite, val, None, None)
+
+    # ✅ La ligne "Source : ..." se trouve souvent sous le tableau
+    if source != source_initiale:
+        yield "fin", {"source": source}
+
+
+def empreinte_evenements(evenements):
+    """
+    Empreinte (sha256) du contenu final d'une feuille, calculée en flux sur ses événements.
+    Retourne None si la feuille ne contient pas de tableau.
+    """
+    h = None
+    for genre, contenu in evenements:
+        if genre == "tableau":
+            h = hashlib.sha256()  # seul le dernier tableau de la feuille est retenu
+        elif genre == "annuler":
+            h = None
+            continue
+        if h is not None:
+            h.update(repr((genre, contenu)).encode("utf-8"))
+    return h.hexdigest() if h else None
+
+
+# --------- analyse dans un pool de processus ---------
+
+_classeur = None
+
+
+def init_lecteur(chemin):
+    """Initialiseur des processus du pool : ouvre le classeur une seule fois par processus."""
+    global _classeur
+    _classeur = openpyxl.load_workbook(chemin, data_only=True, read_only=True)
+
+
+def analyser_feuille_pool(feuille):
+    """Lit une feuille dans un processus du pool ; les événements sont renvoyés sous forme compacte."""
+    return compacter(lire_feuille(_classeur[feuille], feuille))
+
+
+def compacter(evenements):
+    """
+    Forme compacte des événements d'une feuille, pour le retour des processus du pool.
+    Les événements autres que "cellule" sont gardés tels quels ; chaque suite de cellules
+    devient ("cellules", n) et leurs champs sont rangés dans des tableaux : les textes
+    (colonne, unité, statut, note) numérotés une seule fois, les valeurs en flottants.
+    """
+    autres = []
+    textes, numeros = [], {}
+    codes = array("I")       # colonne, unité, statut, note : 4 numéros de texte par cellule
+    valeurs = array("d")
+    presentes = bytearray()  # 0 si la valeur est None
+    nb = 0
+
+    def numero(texte):
+        n = numeros.get(texte)
+        if n is None:
+            n = numeros[texte] = len(textes)
+            textes.append(texte)
+        return n
+
+    for genre, contenu in evenements:
+        if genre == "cellule":
+            colonne, unite, valeur, statut, note = contenu
+            codes.extend((numero(colonne), numero(unite), numero(statut), numero(note)))
+            valeurs.append(0.0 if valeur is None else valeur)
+            presentes.append(valeur is not None)
+            nb += 1
+            continue
+        if nb:
+            autres.append(("cellules", nb))
+            nb = 0
+        autres.append((genre, contenu))
+    if nb:
+        autres.append(("cellules", nb))
+    # les numéros tiennent presque toujours sur un octet (colonnes, unités et statuts distincts)
+    type_code = "B" if len(textes) <= 0xFF else "H" if len(textes) <= 0xFFFF else "I"
+    return autres, textes, array(type_code, codes), valeurs, bytes(presentes)
+
+
+def deployer(compacte):
+    """Événements d'une feuille à partir de sa forme compacte (voir compacter)."""
+    autres, textes, codes, valeurs, presentes = compacte
+    k = 0
+    for genre, contenu in autres:
+        if genre != "cellules":
+            yield genre, contenu
+            continue
+        for i in range(k, k + contenu):
+            c = 4 * i
+            yield "cellule", (
+                textes[codes[c]], textes[codes[c + 1]], valeurs[i] if presentes[i] else None,
+                textes[codes[c + 2]], textes[codes[c + 3]],
+            )
+        k += contenu
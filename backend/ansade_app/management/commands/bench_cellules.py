@@ -0,0 +1,96 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from ansade_app.lecture import (
+    analyser_bloc, compiler_colonnes, convertir_valeur, format_excel_date, parse_numeric,
+)
+
+
+def generer_bloc(nb_lignes, nb_colonnes, graine=0):
+    """Bloc de cellules texte représentatif des feuilles (virgules, espaces, %, statuts)."""
+    hasard = random.Random(graine)
+    formats = [
+        lambda: str(hasard.randint(0, 5000)),
+        lambda: f"{hasard.uniform(0, 100000):.2f}".replace('.', ','),
+        lambda: f"{hasard.randint(1, 999)}\u202f{hasard.randint(0, 999):03d}",
+        lambda: f"{hasard.randint(1, 99)} {hasard.randint(0, 999):03d},{hasard.randint(0, 9)}",
+        lambda: f"{hasard.uniform(0, 100):.1f}%",
+        lambda: str(hasard.random()),
+        lambda: hasard.choice(["N/D", "-", "nd", "..."]),
+        lambda: "",
+    ]
+    entete = [str(2000 + i) + ("*" if i % 10 == 9 else "") for i in range(nb_colonnes)]
+    textes = [tuple(hasard.choice(formats)() for _ in range(nb_colonnes)) for _ in range(nb_lignes)]
+    return entete, textes
+
+
+def analyser_par_cellule(entete, textes, is_pourcentage):
+    """
+    Chemin historique : en-tête de colonne, note, parse_numeric et convertir_valeur
+    calculés pour chaque cellule.
+    """
+    cellules = []
+    for ligne in textes:
+        for idx, cellule in enumerate(ligne):
+            annee = str(format_excel_date(entete[idx]))
+            note = "" if "*" in annee else None
+            raw_val, had_percent = parse_numeric(cellule)
+            if raw_val is None:
+                cellules.append((annee, "", None, cellule, note))
+                continue
+            unite, val = convertir_valeur(raw_val, had_percent, is_pourcentage)
+            cellules.append((annee, unite, val, None, note))
+    return cellules
+
+
+def analyser_vectorise(entete, textes, is_pourcentage):
+    """Descripteurs de colonnes compilés une fois, puis analyse du bloc entier (analyser_bloc)."""
+    colonnes, notes = compiler_colonnes(entete, range(len(entete)))
+    unites, valeurs, statuts = analyser_bloc(textes, is_pourcentage)
+    nb_colonnes = len(colonnes)
+    return [
+        (colonnes[k % nb_colonnes], unites[k], valeurs[k], statuts[k], notes[k % nb_colonnes])
+        for k in range(len(valeurs))
+    ]
+
+
+def chronometrer(fonction, repetitions):
+    meilleur = None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        duree = time.perf_counter() - debut
+        meilleur = duree if meilleur is None else min(meilleur, duree)
+    return meilleur, resultat
+
+
+class Command(BaseCommand):
+    help = "Compare l'analyse des cellules cellule par cellule et l'analyse vectorisée (nouveau format)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lignes', type=int, default=500, help="Nombre de lignes du bloc.")
+        parser.add_argument('--colonnes', type=int, default=40, help="Nombre de colonnes d'années.")
+        parser.add_argument('--repetitions', type=int, default=5, help="Mesures effectuées (on garde la meilleure).")
+        parser.add_argument('--pourcentage', action='store_true', help="Tableau en pourcentage (titre avec %%).")
+
+    def handle(self, *args, **options):
+        entete, textes = generer_bloc(options['lignes'], options['colonnes'])
+        is_pourcentage = options['pourcentage']
+        repetitions = options['repetitions']
+
+        duree_cellule, attendu = chronometrer(lambda: analyser_par_cellule(entete, textes, is_pourcentage), repetitions)
+        duree_bloc, obtenu = chronometrer(lambda: analyser_vectorise(entete, textes, is_pourcentage), repetitions)
+
+        # Comparaison par repr() : les NaN éventuels sont considérés égaux
+        identique = repr(attendu) == repr(obtenu)
+        nb_cellules = options['lignes'] * options['colonnes']
+        self.stdout.write(f"{nb_cellules} cellules ({options['lignes']} lignes × {options['colonnes']} colonnes)")
+        self.stdout.write(f"Cellule par cellule : {duree_cellule * 1000:.1f} ms ({nb_cellules / duree_cellule:,.0f} cellules/s)")
+        self.stdout.write(f"Vectorisé           : {duree_bloc * 1000:.1f} ms ({nb_cellules / duree_bloc:,.0f} cellules/s)")
+        self.stdout.write(f"Accélération        : x{duree_cellule / duree_bloc:.1f}")
+        if identique:
+            self.stdout.write(self.style.SUCCESS("Résultats identiques"))
+        else:
+            self.stdout.write(self.style.ERROR("Résultats différents"))
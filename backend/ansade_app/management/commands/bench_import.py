@@ -0,0 +1,104 @@
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+from itertools import product
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ansade_app.bulk import CompteurRequetes
+from ansade_app.importation import importer_classeur
+from ansade_app.models import Categorie, Tableau, Theme
+from ansade_app.synthetique import FORMATS, generer_classeur
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit de l'import sur des classeurs synthétiques (nouveau et ancien format) "
+        "et écrit les résultats dans un fichier JSON comparable d'un commit à l'autre."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS)
+        parser.add_argument('--feuilles', type=int, nargs='+', default=[5], help="Nombre(s) de feuilles par classeur.")
+        parser.add_argument('--lignes', type=int, nargs='+', default=[200], help="Nombre(s) de lignes par feuille.")
+        parser.add_argument('--colonnes', type=int, nargs='+', default=[20], help="Nombre(s) de colonnes d'années.")
+        parser.add_argument('--part-statuts', type=float, default=0.05, help="Part des cellules en statut texte (N/D...).")
+        parser.add_argument('--processus', type=int, default=1, help="Processus de lecture des feuilles.")
+        parser.add_argument('--sans-memoire', action='store_true', help="Ne mesure pas le pic mémoire (import de plus).")
+        parser.add_argument('--sortie', default='bench_import.json', help="Fichier JSON des résultats.")
+
+    def handle(self, *args, **options):
+        # Catégorie et thème dédiés, supprimés (avec les tableaux importés) à la fin
+        categorie = Categorie.objects.create(nom_cat="Benchmark import")
+        theme = Theme.objects.create(nom_theme="Benchmark import", categorie=categorie)
+        resultats = []
+        try:
+            with tempfile.TemporaryDirectory() as dossier:
+                for format, feuilles, lignes, colonnes in product(
+                    options['formats'], options['feuilles'], options['lignes'], options['colonnes'],
+                ):
+                    cas = {
+                        "format": format, "feuilles": feuilles, "lignes": lignes,
+                        "colonnes": colonnes, "part_statuts": options['part_statuts'],
+                    }
+                    chemin = Path(dossier) / f"{format}_{feuilles}x{lignes}x{colonnes}.xlsx"
+                    generer_classeur(chemin, format, feuilles, lignes, colonnes, options['part_statuts'])
+                    cas.update(self.mesurer(chemin, theme, options))
+                    resultats.append(cas)
+                    self.stdout.write(
+                        f"{format:8} {feuilles}×{lignes}×{colonnes} : {cas['duree']:.2f}s, "
+                        f"{cas['lignes_par_seconde']:,.0f} lignes/s, {cas['donnees_par_seconde']:,.0f} cellules/s, "
+                        f"{cas['requetes']} requêtes"
+                        + (f", pic {cas['memoire_pic_mo']:.1f} Mo" if 'memoire_pic_mo' in cas else "")
+                    )
+        finally:
+            categorie.delete()
+
+        rapport = {
+            "base": connection.vendor,
+            "python": platform.python_version(),
+            "processus": options['processus'],
+            "cas": resultats,
+        }
+        with open(options['sortie'], 'w', encoding='utf-8') as f:
+            json.dump(rapport, f, ensure_ascii=False, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['sortie']}"))
+
+    def mesurer(self, chemin, theme, options):
+        # Les tableaux du passage précédent sont supprimés (hors mesure) : chaque passage est un import complet
+        Tableau.objects.filter(theme=theme).delete()
+        compteur = CompteurRequetes()
+        debut = time.perf_counter()
+        with connection.execute_wrapper(compteur):
+            rapports = importer_classeur(str(chemin), theme.id, processus=options['processus'])
+        duree = time.perf_counter() - debut
+
+        erreurs = [r for r in rapports if r["statut"] == "erreur"]
+        if erreurs:
+            self.stderr.write(f"{chemin.name} : {len(erreurs)} feuille(s) en erreur ({erreurs[0]['erreur']})")
+        nb_lignes = sum(r.get("lignes", 0) for r in rapports)
+        nb_donnees = sum(r.get("donnees", 0) for r in rapports)
+        mesures = {
+            "duree": round(duree, 3),
+            "lignes_importees": nb_lignes,
+            "donnees_importees": nb_donnees,
+            "lignes_par_seconde": round(nb_lignes / duree, 1),
+            "donnees_par_seconde": round(nb_donnees / duree, 1),
+            "requetes": compteur.total,
+            "erreurs": len(erreurs),
+        }
+
+        # tracemalloc ralentit l'import : le pic mémoire est mesuré sur un second passage
+        if not options['sans_memoire']:
+            Tableau.objects.filter(theme=theme).delete()
+            tracemalloc.start()
+            try:
+                importer_classeur(str(chemin), theme.id, processus=options['processus'])
+                mesures["memoire_pic_mo"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            finally:
+                tracemalloc.stop()
+        return mesures
@@ -0,0 +1,185 @@
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Dossiers numérotés : "4_Statistiques Economiques", "2.Education", "10_Finaces Publiques"
+NUMERO_DOSSIER = re.compile(r'^\s*\d+\s*[._]\s*')
+
+RACINE_PAR_DEFAUT = Path(settings.BASE_DIR).parent / 'Donnees' / 'ANSADE_BD' / 'Themes'
+
+
+def nom_dossier(dossier):
+    """Nom d'une catégorie ou d'un thème sans son numéro d'ordre."""
+    return NUMERO_DOSSIER.sub('', dossier.name).strip()
+
+
+def parcourir(racine):
+    """
+    Liste les classeurs de l'arborescence <n>_<Categorie>/<n>.<Theme>/*.xlsx
+    sous forme de (chemin, nom_categorie, nom_theme).
+    Un classeur placé directement dans le dossier d'une catégorie est rangé
+    dans un thème du même nom que la catégorie.
+    Les fichiers de verrouillage d'Excel (~$Education.xlsx) sont ignorés.
+    """
+    classeurs = []
+    for dossier_cat in sorted(p for p in racine.iterdir() if p.is_dir()):
+        categorie = nom_dossier(dossier_cat)
+        for chemin in sorted(dossier_cat.rglob('*.xlsx')):
+            if chemin.name.startswith('~$'):
+                continue
+            relatif = chemin.relative_to(dossier_cat)
+            theme = nom_dossier(dossier_cat / relatif.parts[0]) if len(relatif.parts) > 1 else categorie
+            classeurs.append((chemin, categorie, theme))
+    return classeurs
+
+
+def lire_reprise(fichier):
+    if fichier.exists():
+        with open(fichier, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def ecrire_reprise(fichier, reprise):
+    """Écriture atomique : un arrêt brutal ne laisse jamais un fichier de reprise tronqué."""
+    temporaire = fichier.with_name(fichier.name + '.tmp')
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump(reprise, f, ensure_ascii=False, indent=2)
+    os.replace(temporaire, fichier)
+
+
+def etat_classeur(rapports):
+    """
+    État de reprise d'un classeur importé : "termine" seulement si aucune feuille n'est en erreur.
+    Un classeur "partiel" est réimporté au prochain passage ; ses feuilles déjà écrites
+    reviennent "inchangee" (empreinte identique) et ne sont pas réécrites.
+    """
+    feuilles = {r['feuille']: r['statut'] for r in rapports}
+    erreurs = [r for r in rapports if r['statut'] == 'erreur']
+    etat = {'statut': 'partiel' if erreurs else 'termine', 'feuilles': feuilles}
+    if erreurs:
+        etat['erreur'] = "; ".join(f"{r['feuille']} : {r.get('erreur', '')}" for r in erreurs)
+    return etat
+
+
+def premier_ou_creer(modele, **champs):
+    """Comme get_or_create, sans échouer si la base contient déjà des doublons (envois manuels)."""
+    objet = modele.objects.filter(**champs).order_by('id').first()
+    return objet if objet is not None else modele.objects.create(**champs)
+
+
+def init_import():
+    """Initialiseur des processus d'import : chaque processus configure Django et ouvre sa connexion."""
+    import django
+    django.setup()
+
+
+def importer_fichier(chemin, id_theme, processus):
+    """Importe un classeur (exécuté dans un processus du pool) et renvoie ses rapports par feuille."""
+    from django.db import connection
+
+    from ansade_app.importation import importer_classeur
+
+    try:
+        return importer_classeur(chemin, id_theme, processus=processus)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe tous les classeurs d'une arborescence <n>_<Categorie>/<n>.<Theme>/*.xlsx "
+        "(par défaut Donnees/ANSADE_BD/Themes), en créant les catégories et thèmes manquants."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'racine', nargs='?', default=str(RACINE_PAR_DEFAUT),
+            help="Dossier contenant les dossiers de catégories.",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Nombre de classeurs importés en parallèle.",
+        )
+        parser.add_argument(
+            '--processus', type=int, default=1,
+            help="Processus de lecture des feuilles par classeur (voir import_worker).",
+        )
+        parser.add_argument(
+            '--reprise', default=None,
+            help="Fichier de reprise (par défaut <racine>/.import_reprise.json).",
+        )
+        parser.add_argument(
+            '--recommencer', action='store_true',
+            help="Ignore le fichier de reprise et réimporte tous les classeurs.",
+        )
+
+    def handle(self, *args, **options):
+        # Import local : ce module est aussi chargé par les processus du pool avant django.setup()
+        from ansade_app.models import Categorie, Theme
+
+        racine = Path(options['racine'])
+        if not racine.is_dir():
+            raise CommandError(f"Dossier introuvable : {racine}")
+
+        fichier_reprise = Path(options['reprise']) if options['reprise'] else racine / '.import_reprise.json'
+        reprise = {} if options['recommencer'] else lire_reprise(fichier_reprise)
+
+        # Catégories et thèmes créés ici, avant l'import, pour éviter les doublons entre processus
+        a_importer = []
+        ids = {}
+        for chemin, nom_cat, nom_theme in parcourir(racine):
+            cle = chemin.relative_to(racine).as_posix()
+            if reprise.get(cle, {}).get('statut') == 'termine':
+                continue
+            if (nom_cat, nom_theme) not in ids:
+                categorie = premier_ou_creer(Categorie, nom_cat=nom_cat)
+                theme = premier_ou_creer(Theme, nom_theme=nom_theme, categorie=categorie)
+                ids[(nom_cat, nom_theme)] = theme.id
+            a_importer.append((cle, chemin, ids[(nom_cat, nom_theme)]))
+
+        deja = sum(1 for etat in reprise.values() if etat.get('statut') == 'termine')
+        self.stdout.write(f"{len(a_importer)} classeur(s) à importer ({deja} déjà importé(s) d'après la reprise)")
+        if not a_importer:
+            return
+
+        debut = time.perf_counter()
+        erreurs = 0
+        # "spawn" : les processus fils ne doivent pas hériter des connexions à la base
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(options['workers'], len(a_importer))),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_import,
+        ) as pool:
+            futures = {
+                pool.submit(importer_fichier, os.fspath(chemin), id_theme, options['processus']): cle
+                for cle, chemin, id_theme in a_importer
+            }
+            for future in as_completed(futures):
+                cle = futures[future]
+                try:
+                    rapports = future.result()
+                    etat = etat_classeur(rapports)
+                    if etat['statut'] == 'termine':
+                        self.stdout.write(f"✅ {cle} : {len(rapports)} feuille(s)")
+                    else:
+                        erreurs += 1
+                        self.stderr.write(f"⚠️ {cle} : {etat['erreur']} (classeur repris au prochain passage)")
+                except Exception as e:
+                    erreurs += 1
+                    etat = {'statut': 'erreur', 'erreur': str(e)}
+                    self.stderr.write(f"❌ {cle} : {e}")
+                reprise[cle] = etat
+                ecrire_reprise(fichier_reprise, reprise)
+
+        self.stdout.write(
+            f"Import terminé en {time.perf_counter() - debut:.1f}s : "
+            f"{len(a_importer) - erreurs} classeur(s) importé(s), {erreurs} en erreur"
+        )
@@ -0,0 +1,40 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ansade_app.importation import executer_tache, reserver_tache
+
+
+class Command(BaseCommand):
+    help = "Traite les imports Excel mis en file d'attente par ImportExcelView."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--une-fois', action='store_true',
+            help="Traite les tâches en attente puis s'arrête (au lieu de boucler).",
+        )
+        parser.add_argument(
+            '--intervalle', type=float, default=2.0,
+            help="Délai (secondes) entre deux vérifications de la file d'attente.",
+        )
+        parser.add_argument(
+            '--processus', type=int, default=os.cpu_count() or 1,
+            help="Nombre de processus utilisés pour lire les feuilles d'un classeur (1 = séquentiel).",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Worker d'import démarré")
+        while True:
+            close_old_connections()
+            tache = reserver_tache()
+            if tache is None:
+                if options['une_fois']:
+                    break
+                time.sleep(options['intervalle'])
+                continue
+
+            self.stdout.write(f"Tâche {tache.id} : {tache.nom_fichier}")
+            executer_tache(tache, options['processus'])
+            self.stdout.write(f"Tâche {tache.id} : {tache.statut}")
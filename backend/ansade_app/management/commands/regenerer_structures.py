@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from ansade_app.models import Tableau
+from ansade_app.recherche import indexer_tout
+from ansade_app.structure import regenerer
+
+
+class Command(BaseCommand):
+    help = (
+        "Régénère les instantanés StructureTableau, les matrices de valeurs et l'index de recherche "
+        "(tous les tableaux avec les catégories et thèmes, ou les tableaux indiqués) : "
+        "utile après la migration ou après des modifications faites hors API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tableaux', nargs='*', type=int, help="Identifiants des tableaux (par défaut : tous).")
+
+    def handle(self, *args, **options):
+        ids = options['tableaux']
+        if not ids:
+            indexer_tout()
+            ids = Tableau.objects.order_by('id').values_list('id', flat=True)
+        total = 0
+        for tableau_id in ids:
+            regenerer(tableau_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"{total} tableau(x) régénéré(s)"))
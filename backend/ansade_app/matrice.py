@@ -0,0 +1,303 @@
+"""
+Stockage en matrice des valeurs d'un tableau (lignes × colonnes), à côté des cellules Donnees.
+Un tableau est une grille dense : ses valeurs sont rangées dans des tableaux NumPy contigus,
+enregistrés en octets dans MatriceTableau et relus sans copie avec np.frombuffer.
+- lignes, colonnes : id des LigneIndicateur (ordre des id) et des Colonne (ordre de la feuille) ;
+- valeurs : float64, NaN pour une cellule sans valeur ;
+- etats : int16, -1 cellule absente, 0 cellule présente, k > 0 statut statuts[k - 1] ("N/D"...) ;
+- codes_unites : uint8, indice dans unites ("", "%").
+Les cellules Donnees restent la référence (modifications, export brut) : la matrice est
+régénérée avec l'instantané de structure (voir structure.regenerer_apres_commit).
+Désactivable avec le réglage ANSADE_STOCKAGE_MATRICE = False : les vues relisent alors les cellules.
+
+Les vues de filtrage passent par MatriceIndexee : matrice décodée + index id -> position des
+lignes et colonnes, gardée en mémoire (LRU de ANSADE_MATRICES_EN_MEMOIRE tableaux par processus).
+Chaque lecture compare la copie en mémoire à MatriceTableau.version (une lecture par clé) :
+une régénération faite par un autre processus (import_worker, commandes, autre worker web)
+est donc vue aussitôt, quel que soit le cache Django configuré.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Colonne, Donnees, LigneIndicateur, MatriceTableau
+
+ABSENTE = -1
+
+# Types enregistrés (petit-boutiste : indépendant de la machine qui relit)
+TYPE_ID = np.dtype('<i8')
+TYPE_VALEUR = np.dtype('<f8')
+TYPE_ETAT = np.dtype('<i2')
+TYPE_UNITE = np.dtype('u1')
+
+
+def stockage_actif():
+    return getattr(settings, 'ANSADE_STOCKAGE_MATRICE', True)
+
+
+class Matrice:
+    """Valeurs d'un tableau décodées en tableaux NumPy (lecture seule)."""
+
+    def __init__(self, lignes, colonnes, valeurs, etats, codes_unites, statuts, unites, version=0):
+        self.lignes = lignes
+        self.colonnes = colonnes
+        self.valeurs = valeurs
+        self.etats = etats
+        self.codes_unites = codes_unites
+        self.statuts = statuts
+        self.unites = unites
+        self.version = version
+
+    @property
+    def forme(self):
+        return self.valeurs.shape
+
+    def presentes(self):
+        """Masque des cellules existantes."""
+        return self.etats != ABSENTE
+
+    @classmethod
+    def depuis_modele(cls, m):
+        forme = (m.nb_lignes, m.nb_colonnes)
+        return cls(
+            lignes=np.frombuffer(m.lignes, dtype=TYPE_ID),
+            colonnes=np.frombuffer(m.colonnes, dtype=TYPE_ID),
+            valeurs=np.frombuffer(m.valeurs, dtype=TYPE_VALEUR).reshape(forme),
+            etats=np.frombuffer(m.etats, dtype=TYPE_ETAT).reshape(forme),
+            codes_unites=np.frombuffer(m.codes_unites, dtype=TYPE_UNITE).reshape(forme),
+            statuts=m.statuts,
+            unites=m.unites,
+            version=m.version,
+        )
+
+
+def encoder(cellules, ordre_colonnes):
+    """
+    `cellules` : (ligne_id, colonne_id, valeur, unite, statut) dans l'ordre des id des cellules ;
+    `ordre_colonnes` : id des colonnes du tableau dans l'ordre de la feuille.
+    Les cellules sans ligne sont ignorées ; pour une même (ligne, colonne), la dernière l'emporte.
+    """
+    cellules = [c for c in cellules if c[0] is not None]
+    if not cellules:
+        vide = np.zeros((0, 0))
+        return Matrice(
+            np.zeros(0, TYPE_ID), np.zeros(0, TYPE_ID), vide.astype(TYPE_VALEUR),
+            vide.astype(TYPE_ETAT), vide.astype(TYPE_UNITE), [], [],
+        )
+    ligne_ids, colonne_ids, valeurs, unites, statuts = zip(*cellules)
+
+    lignes, i = np.unique(np.array(ligne_ids, dtype=TYPE_ID), return_inverse=True)
+    presentes = set(colonne_ids)
+    colonnes = np.array([c for c in ordre_colonnes if c in presentes], dtype=TYPE_ID)
+    position = {c: j for j, c in enumerate(colonnes.tolist())}
+    j = np.fromiter((position[c] for c in colonne_ids), dtype=np.intp, count=len(colonne_ids))
+
+    noms_statuts = list(dict.fromkeys(s for s in statuts if s))
+    code_statut = {s: k + 1 for k, s in enumerate(noms_statuts)}
+    noms_unites = list(dict.fromkeys(u or "" for u in unites))
+    code_unite = {u: k for k, u in enumerate(noms_unites)}
+
+    forme = (len(lignes), len(colonnes))
+    m_valeurs = np.full(forme, np.nan, dtype=TYPE_VALEUR)
+    m_etats = np.full(forme, ABSENTE, dtype=TYPE_ETAT)
+    m_unites = np.zeros(forme, dtype=TYPE_UNITE)
+    # affectations indexées : en cas d'indices répétés, la dernière valeur est retenue
+    m_valeurs[i, j] = np.array(valeurs, dtype=TYPE_VALEUR)  # None -> NaN
+    m_etats[i, j] = [code_statut.get(s, 0) if s else 0 for s in statuts]
+    m_unites[i, j] = [code_unite[u or ""] for u in unites]
+    return Matrice(lignes, colonnes, m_valeurs, m_etats, m_unites, noms_statuts, noms_unites)
+
+
+def construire_matrice(tableau_id):
+    """Matrice d'un tableau lue depuis ses cellules (deux requêtes)."""
+    ordre_colonnes = list(
+        Colonne.objects.filter(tableau_id=tableau_id).order_by("ordre", "id").values_list("id", flat=True)
+    )
+    cellules = (
+        Donnees.objects.filter(tableau_id=tableau_id)
+        .order_by("id")
+        .values_list("ligne_id", "colonne_id", "valeur", "unite", "statut")
+    )
+    return encoder(cellules, ordre_colonnes)
+
+
+def generer_matrice(tableau_id):
+    """Construit et enregistre la matrice du tableau ; sa version augmente à chaque régénération."""
+    matrice = construire_matrice(tableau_id)
+    champs = {
+        "nb_lignes": matrice.forme[0],
+        "nb_colonnes": matrice.forme[1],
+        "lignes": matrice.lignes.tobytes(),
+        "colonnes": matrice.colonnes.tobytes(),
+        "valeurs": matrice.valeurs.tobytes(),
+        "etats": matrice.etats.tobytes(),
+        "codes_unites": matrice.codes_unites.tobytes(),
+        "statuts": matrice.statuts,
+        "unites": matrice.unites,
+    }
+    mises_a_jour = MatriceTableau.objects.filter(tableau_id=tableau_id).update(
+        version=F("version") + 1, genere_le=timezone.now(), **champs,
+    )
+    if not mises_a_jour:
+        try:
+            with transaction.atomic():
+                MatriceTableau.objects.create(tableau_id=tableau_id, **champs)
+        except IntegrityError:
+            # tableau supprimé entre-temps, ou matrice créée en parallèle
+            pass
+    matrice.version = version_matrice(tableau_id) or 0
+    oublier_index(tableau_id)
+    return matrice
+
+
+def version_matrice(tableau_id):
+    """Version enregistrée de la matrice du tableau (None si elle n'existe pas encore)."""
+    return MatriceTableau.objects.filter(tableau_id=tableau_id).values_list("version", flat=True).first()
+
+
+def charger_matrice(tableau_id):
+    """
+    Matrice d'un tableau (une lecture par clé primaire), construite et enregistrée si elle
+    manque. None si le stockage en matrice est désactivé.
+    """
+    if not stockage_actif():
+        return None
+    m = MatriceTableau.objects.filter(tableau_id=tableau_id).first()
+    if m is not None:
+        return Matrice.depuis_modele(m)
+    return generer_matrice(tableau_id)
+
+
+class MatriceIndexee:
+    """
+    Matrice d'un tableau avec ses index : position d'une ligne / colonne à partir de son id
+    ou de son libellé, et ordre d'affichage (ordre de la ligne, libellé de la colonne).
+    Une sélection se découpe en mémoire, en O(cellules sélectionnées).
+    """
+
+    def __init__(self, matrice, lignes, colonnes):
+        # lignes : (label, ordre, parent_id) et colonnes : (label, principal, sous), alignées sur la matrice
+        self.matrice = matrice
+        self.version = matrice.version
+        self.lignes = lignes
+        self.colonnes = colonnes
+        self.position_ligne = {pk: k for k, pk in enumerate(matrice.lignes.tolist())}
+        self.position_colonne = {pk: k for k, pk in enumerate(matrice.colonnes.tolist())}
+        self.lignes_par_label = defaultdict(list)
+        for k, (label, _, _) in enumerate(lignes):
+            self.lignes_par_label[label].append(k)
+        self.colonnes_par_label = defaultdict(list)
+        for k, (label, _, _) in enumerate(colonnes):
+            self.colonnes_par_label[label].append(k)
+
+        # rang d'affichage : lignes par ordre (sans ordre en dernier) puis id, colonnes par libellé
+        self.rang_ligne = np.empty(len(lignes), dtype=np.intp)
+        self.rang_ligne[sorted(range(len(lignes)), key=lambda k: (lignes[k][1] is None, lignes[k][1] or 0, k))] = np.arange(len(lignes))
+        self.rang_colonne = np.empty(len(colonnes), dtype=np.intp)
+        self.rang_colonne[sorted(range(len(colonnes)), key=lambda k: colonnes[k][0])] = np.arange(len(colonnes))
+
+    @staticmethod
+    def _positions(index_ids, index_labels, ids, labels, taille):
+        """Positions retenues (toutes si ni ids ni libellés) ; les inconnus sont ignorés."""
+        if ids is None and labels is None:
+            return np.arange(taille, dtype=np.intp)
+        positions = set()
+        for pk in ids or ():
+            if pk in index_ids:
+                positions.add(index_ids[pk])
+        for label in labels or ():
+            positions.update(index_labels.get(label, ()))
+        return np.fromiter(positions, dtype=np.intp, count=len(positions))
+
+    def selection(self, ligne_ids=None, colonne_ids=None, labels=None, colonnes=None):
+        """Positions (lignes, colonnes) retenues, dans l'ordre d'affichage."""
+        i = self._positions(self.position_ligne, self.lignes_par_label, ligne_ids, labels, len(self.lignes))
+        j = self._positions(self.position_colonne, self.colonnes_par_label, colonne_ids, colonnes, len(self.colonnes))
+        return i[np.argsort(self.rang_ligne[i])], j[np.argsort(self.rang_colonne[j])]
+
+    def cellules(self, i, j):
+        """
+        Cellules présentes du bloc (i × j), ligne par ligne :
+        (ligne_id, colonne_id, valeur ou None, unite, statut).
+        """
+        m = self.matrice
+        bloc = np.ix_(i, j)
+        a, b = np.nonzero(m.etats[bloc] != ABSENTE)
+        i, j = i[a], j[b]
+        valeurs = m.valeurs[i, j].tolist()
+        etats = m.etats[i, j].tolist()
+        unites = m.codes_unites[i, j].tolist()
+        lignes, colonnes = m.lignes.tolist(), m.colonnes.tolist()
+        return [
+            (lignes[x], colonnes[y], None if v != v else v,  # NaN -> None
+             m.unites[u], m.statuts[e - 1] if e > 0 else None)
+            for x, y, v, u, e in zip(i.tolist(), j.tolist(), valeurs, unites, etats)
+        ]
+
+
+_index = OrderedDict()
+_verrou = threading.Lock()
+
+
+def oublier_index(tableau_id=None):
+    """Retire de la mémoire l'index d'un tableau (de tous si tableau_id est None)."""
+    with _verrou:
+        if tableau_id is None:
+            _index.clear()
+        else:
+            _index.pop(tableau_id, None)
+
+
+def construire_index(tableau_id):
+    """
+    Matrice du tableau + libellés des lignes et colonnes (régénérée si elle est périmée).
+    Stockage en matrice désactivé : matrice construite depuis les cellules, sans être enregistrée.
+    """
+    matrice = charger_matrice(tableau_id) if stockage_actif() else construire_matrice(tableau_id)
+    lignes = {
+        pk: (label, ordre, parent_id)
+        for pk, label, ordre, parent_id in
+        LigneIndicateur.objects.filter(tableau_id=tableau_id).values_list("id", "label", "ordre", "parent_id")
+    }
+    colonnes = {
+        pk: (label, principal, sous)
+        for pk, label, principal, sous in
+        Colonne.objects.filter(tableau_id=tableau_id).values_list("id", "label", "principal", "sous")
+    }
+    if stockage_actif() and not (
+        set(matrice.lignes.tolist()) <= lignes.keys() and set(matrice.colonnes.tolist()) <= colonnes.keys()
+    ):
+        # ligne ou colonne supprimée depuis la dernière génération
+        matrice = generer_matrice(tableau_id)
+    return MatriceIndexee(
+        matrice,
+        [lignes[pk] for pk in matrice.lignes.tolist()],
+        [colonnes[pk] for pk in matrice.colonnes.tolist()],
+    )
+
+
+def charger_index(tableau_id):
+    """
+    MatriceIndexee du tableau : une lecture de la version en base, la matrice n'est relue
+    qu'au premier accès ou après une régénération. None si le stockage en matrice est désactivé.
+    """
+    if not stockage_actif():
+        return None
+    version = version_matrice(tableau_id)
+    with _verrou:
+        index = _index.get(tableau_id)
+        if index is not None and index.version == version:
+            _index.move_to_end(tableau_id)
+            return index
+
+    index = construire_index(tableau_id)
+    with _verrou:
+        _index[tableau_id] = index
+        while len(_index) > getattr(settings, 'ANSADE_MATRICES_EN_MEMOIRE', 64):
+            _index.popitem(last=False)
+    return index
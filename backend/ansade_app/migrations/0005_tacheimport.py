@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0004_donnees_note_colonne'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fichier', models.FileField(upload_to='imports/')),
+                ('nom_fichier', models.CharField(max_length=255)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('terminee', 'Terminée'), ('echouee', 'Échouée')], default='en_attente', max_length=20)),
+                ('feuilles', models.JSONField(blank=True, default=list)),
+                ('erreur', models.TextField(blank=True)),
+                ('cree_le', models.DateTimeField(auto_now_add=True)),
+                ('debut', models.DateTimeField(blank=True, null=True)),
+                ('fin', models.DateTimeField(blank=True, null=True)),
+                ('categorie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ansade_app.categorie')),
+                ('theme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ansade_app.theme')),
+                ('utilisateur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-cree_le'],
+            },
+        ),
+    ]
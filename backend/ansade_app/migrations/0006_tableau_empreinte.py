@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0005_tacheimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tableau',
+            name='empreinte',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='tableau',
+            index=models.Index(fields=['theme', 'nom_feuille'], name='ansade_app__theme_i_c72669_idx'),
+        ),
+    ]
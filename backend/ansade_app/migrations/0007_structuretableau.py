@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0006_tableau_empreinte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StructureTableau',
+            fields=[
+                ('tableau', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='structure', serialize=False, to='ansade_app.tableau')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('document', models.BinaryField()),
+                ('genere_le', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
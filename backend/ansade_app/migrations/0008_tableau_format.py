@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:01
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def renseigner_format(apps, schema_editor):
+    """Même détection que l'ancienne vue structure : une cellule dont la ligne a un code ou un ordre."""
+    Tableau = apps.get_model('ansade_app', 'Tableau')
+    Donnees = apps.get_model('ansade_app', 'Donnees')
+    nouveaux = (
+        Donnees.objects
+        .filter(Q(ligne__code__gt='') | Q(ligne__ordre__isnull=False))
+        .values('tableau_id')
+    )
+    Tableau.objects.filter(id__in=nouveaux).update(format='nouveau')
+    Tableau.objects.exclude(id__in=nouveaux).update(format='ancien')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0007_structuretableau'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tableau',
+            name='format',
+            field=models.CharField(blank=True, choices=[('nouveau', 'Nouveau format'), ('ancien', 'Ancien format')], default='', max_length=10),
+        ),
+        migrations.RunPython(renseigner_format, migrations.RunPython.noop),
+    ]
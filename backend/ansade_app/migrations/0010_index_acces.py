@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0009_ligneindicateur_hierarchie'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donnees',
+            index=models.Index(fields=['tableau', 'colonne'], name='donnees_tableau_colonne_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donnees',
+            index=models.Index(fields=['tableau', 'ligne'], name='donnees_tableau_ligne_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donnees',
+            index=models.Index(condition=models.Q(('statut__isnull', False)), fields=['tableau', 'statut'], name='donnees_statut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donnees',
+            index=models.Index(condition=models.Q(('note_colonne__isnull', False)), fields=['tableau', 'note_colonne'], name='donnees_note_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ligneindicateur',
+            index=models.Index(fields=['tableau', 'code'], name='ligne_tableau_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ligneindicateur',
+            index=models.Index(fields=['tableau', 'parent_code'], name='ligne_tableau_parent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ligneindicateur',
+            index=models.Index(fields=['tableau', 'label'], name='ligne_tableau_label_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tableau',
+            index=models.Index(fields=['source'], name='tableau_source_idx'),
+        ),
+    ]
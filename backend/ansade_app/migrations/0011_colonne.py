@@ -0,0 +1,78 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def decouper(label):
+    col = (label or "").strip()
+    if "~" in col:
+        principal, sous = map(str.strip, col.split("~", 1))
+        return principal, sous
+    return col, ""
+
+
+def creer_colonnes(apps, schema_editor):
+    """
+    Une Colonne par (tableau, libellé) dans l'ordre d'apparition des cellules, avec la note
+    de ses cellules ; les cellules sont ensuite rattachées colonne par colonne.
+    La source est déjà portée par le tableau (identique sur toutes ses cellules) ; elle
+    n'est reprise des cellules que pour les tableaux qui n'en ont pas.
+    """
+    Tableau = apps.get_model('ansade_app', 'Tableau')
+    Colonne = apps.get_model('ansade_app', 'Colonne')
+    Donnees = apps.get_model('ansade_app', 'Donnees')
+    for tableau_id, source in Tableau.objects.values_list('id', 'source').iterator():
+        cellules = Donnees.objects.filter(tableau_id=tableau_id)
+        libelles = list(
+            cellules.values('colonne')
+            .annotate(premiere=Min('id'), note=Max('note_colonne'))
+            .order_by('premiere')
+            .values_list('colonne', 'note')
+        )
+        colonnes = Colonne.objects.bulk_create([
+            Colonne(
+                tableau_id=tableau_id, label=label, principal=decouper(label)[0], sous=decouper(label)[1],
+                note=note, ordre=ordre,
+            )
+            for ordre, (label, note) in enumerate(libelles)
+        ])
+        for colonne in colonnes:
+            cellules.filter(colonne=colonne.label).update(colonne_ref=colonne.id)
+        if not source:
+            source_cellules = cellules.exclude(source='').values_list('source', flat=True).first()
+            if source_cellules:
+                Tableau.objects.filter(pk=tableau_id).update(source=source_cellules)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0010_index_acces'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Colonne',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=255)),
+                ('principal', models.CharField(max_length=255)),
+                ('sous', models.CharField(blank=True, max_length=255)),
+                ('note', models.CharField(blank=True, max_length=255, null=True)),
+                ('ordre', models.PositiveIntegerField(default=0)),
+                ('tableau', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='colonnes', to='ansade_app.tableau')),
+            ],
+            options={
+                'ordering': ['ordre'],
+                'constraints': [models.UniqueConstraint(fields=('tableau', 'label'), name='colonne_unique_par_tableau')],
+            },
+        ),
+        migrations.AddField(
+            model_name='donnees',
+            name='colonne_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='ansade_app.colonne'),
+        ),
+        migrations.RunPython(creer_colonnes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Donnees réduite à (ligne, colonne, unite, valeur, statut) + tableau.
+    Migration séparée de 0011 : sur PostgreSQL, modifier la table dans la transaction
+    qui vient de la remplir échoue (contrôles de clés étrangères différés en attente).
+    """
+
+    dependencies = [
+        ('ansade_app', '0011_colonne'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='donnees',
+            name='donnees_tableau_colonne_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='donnees',
+            name='donnees_note_idx',
+        ),
+        migrations.RemoveField(
+            model_name='donnees',
+            name='colonne',
+        ),
+        migrations.RemoveField(
+            model_name='donnees',
+            name='note_colonne',
+        ),
+        migrations.RemoveField(
+            model_name='donnees',
+            name='source',
+        ),
+        migrations.RemoveField(
+            model_name='donnees',
+            name='categorie',
+        ),
+        migrations.RenameField(
+            model_name='donnees',
+            old_name='colonne_ref',
+            new_name='colonne',
+        ),
+        migrations.AlterField(
+            model_name='donnees',
+            name='colonne',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ansade_app.colonne'),
+        ),
+        migrations.AddIndex(
+            model_name='donnees',
+            index=models.Index(fields=['tableau', 'colonne'], name='donnees_tableau_colonne_idx'),
+        ),
+    ]
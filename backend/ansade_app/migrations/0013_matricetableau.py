@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0012_donnees_etroites'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatriceTableau',
+            fields=[
+                ('tableau', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='matrice', serialize=False, to='ansade_app.tableau')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('nb_lignes', models.PositiveIntegerField(default=0)),
+                ('nb_colonnes', models.PositiveIntegerField(default=0)),
+                ('lignes', models.BinaryField()),
+                ('colonnes', models.BinaryField()),
+                ('valeurs', models.BinaryField()),
+                ('etats', models.BinaryField()),
+                ('codes_unites', models.BinaryField()),
+                ('statuts', models.JSONField(blank=True, default=list)),
+                ('unites', models.JSONField(blank=True, default=list)),
+                ('genere_le', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0013_matricetableau'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='structuretableau',
+            name='options',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Index plein texte propre au moteur, tenu à jour par la base elle-même :
+# - PostgreSQL : colonne tsvector générée (configuration french) + index GIN ;
+# - SQLite : table FTS5 à contenu externe (unicode61, accents ignorés) + déclencheurs.
+POSTGRESQL = [
+    (
+        "ALTER TABLE ansade_app_documentrecherche ADD COLUMN vecteur tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('french', texte)) STORED",
+        "ALTER TABLE ansade_app_documentrecherche DROP COLUMN vecteur",
+    ),
+    (
+        "CREATE INDEX recherche_vecteur_gin ON ansade_app_documentrecherche USING gin (vecteur)",
+        "DROP INDEX recherche_vecteur_gin",
+    ),
+]
+SQLITE = [
+    (
+        "CREATE VIRTUAL TABLE ansade_recherche_fts USING fts5(texte, content='ansade_app_documentrecherche', "
+        "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "DROP TABLE ansade_recherche_fts",
+    ),
+    (
+        "CREATE TRIGGER ansade_recherche_ai AFTER INSERT ON ansade_app_documentrecherche BEGIN "
+        "INSERT INTO ansade_recherche_fts(rowid, texte) VALUES (new.id, new.texte); END",
+        "DROP TRIGGER ansade_recherche_ai",
+    ),
+    (
+        "CREATE TRIGGER ansade_recherche_ad AFTER DELETE ON ansade_app_documentrecherche BEGIN "
+        "INSERT INTO ansade_recherche_fts(ansade_recherche_fts, rowid, texte) VALUES ('delete', old.id, old.texte); END",
+        "DROP TRIGGER ansade_recherche_ad",
+    ),
+    (
+        "CREATE TRIGGER ansade_recherche_au AFTER UPDATE ON ansade_app_documentrecherche BEGIN "
+        "INSERT INTO ansade_recherche_fts(ansade_recherche_fts, rowid, texte) VALUES ('delete', old.id, old.texte); "
+        "INSERT INTO ansade_recherche_fts(rowid, texte) VALUES (new.id, new.texte); END",
+        "DROP TRIGGER ansade_recherche_au",
+    ),
+]
+
+
+def instructions(schema_editor):
+    return {'postgresql': POSTGRESQL, 'sqlite': SQLITE}.get(schema_editor.connection.vendor, [])
+
+
+def creer_index(apps, schema_editor):
+    for creation, _ in instructions(schema_editor):
+        schema_editor.execute(creation)
+
+
+def supprimer_index(apps, schema_editor):
+    for _, suppression in reversed(instructions(schema_editor)):
+        schema_editor.execute(suppression)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0014_structuretableau_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentRecherche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('Categorie', 'Categorie'), ('Theme', 'Theme'), ('Tableau', 'Tableau'), ('Indicateur', 'Indicateur'), ('Colonne', 'Colonne')], max_length=20)),
+                ('objet_id', models.BigIntegerField()),
+                ('libelle', models.TextField()),
+                ('texte', models.TextField()),
+                ('poids', models.FloatField(default=1.0)),
+                ('categorie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ansade_app.categorie')),
+                ('tableau', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ansade_app.tableau')),
+                ('theme', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ansade_app.theme')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['type', 'objet_id'], name='recherche_objet_idx')],
+            },
+        ),
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:20
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0015_recherche'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ligneindicateur',
+            index=models.Index(fields=['code'], name='ligne_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ligneindicateur',
+            index=models.Index(django.db.models.functions.text.Upper('label'), name='ligne_label_maj_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 09:10
+
+from django.db import migrations, models
+
+
+def creer_compteur(apps, schema_editor):
+    # ligne unique du compteur : recherche.journaliser ne fait ensuite que l'incrémenter
+    apps.get_model('ansade_app', 'CompteurRecherche').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0016_ligne_code_label_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurRecherche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valeur', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JournalRecherche',
+            fields=[
+                ('generation', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('genre', models.CharField(max_length=20)),
+                ('objet_id', models.BigIntegerField(blank=True, null=True)),
+                ('cree_le', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(creer_compteur, migrations.RunPython.noop),
+    ]
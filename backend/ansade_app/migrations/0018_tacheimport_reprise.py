@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ansade_app', '0017_journal_recherche'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tacheimport',
+            name='actif_le',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tacheimport',
+            name='tentatives',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -2,6 +2,7 @@
 
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils import timezone
 
 class Categorie(models.Model):
@@ -57,11 +58,23 @@ class Theme(models.Model):
 
 
 class Tableau(models.Model):
+    NOUVEAU = 'nouveau'  # colonnes titre_fr / code / parent / ordre...
+    ANCIEN = 'ancien'    # titre "TABLEAU ..." puis lignes à plat
+    FORMATS = [(NOUVEAU, 'Nouveau format'), (ANCIEN, 'Ancien format')]
+
     nom_feuille = models.CharField(max_length=255)
     titre = models.CharField(max_length=255)
     etiquette_ligne = models.CharField(max_length=255, blank=True, null=True)
     theme = models.ForeignKey(Theme, on_delete=models.CASCADE)
     source = models.TextField(blank=True, null=True)
+    empreinte = models.CharField(max_length=64, blank=True, default='')  # sha256 du contenu importé
+    format = models.CharField(max_length=10, choices=FORMATS, blank=True, default='')  # fixé à l'import
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['theme', 'nom_feuille']),
+            models.Index(fields=['source'], name='tableau_source_idx'),  # ListeSources / TableauxParSource
+        ]
 
     def __str__(self):
         return self.titre
@@ -73,8 +86,24 @@ class LigneIndicateur(models.Model):
     parent_code = models.CharField(max_length=100, blank=True, null=True)
     ordre = models.IntegerField(blank=True, null=True)
 
+    # ✅ Hiérarchie calculée à l'import (voir hierarchie.py)
+    parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='enfants')
+    niveau = models.PositiveSmallIntegerField(default=0)
+    rang = models.IntegerField(blank=True, null=True)      # ordre d'affichage dans le tableau
+    rang_fin = models.IntegerField(blank=True, null=True)  # rang de la dernière ligne du sous-arbre
+
     class Meta:
         ordering = ['ordre']
+        indexes = [
+            models.Index(fields=['tableau', 'rang']),
+            models.Index(fields=['tableau', 'niveau', 'rang']),
+            models.Index(fields=['tableau', 'code'], name='ligne_tableau_code_idx'),
+            models.Index(fields=['tableau', 'parent_code'], name='ligne_tableau_parent_idx'),
+            models.Index(fields=['tableau', 'label'], name='ligne_tableau_label_idx'),  # filtres par libellé
+            # séries d'un indicateur à travers les tableaux (voir series.py)
+            models.Index(fields=['code'], name='ligne_code_idx'),
+            models.Index(Upper('label'), name='ligne_label_maj_idx'),
+        ]
 
     def __str__(self):
         return self.label
@@ -82,16 +111,177 @@ class LigneIndicateur(models.Model):
 
 # models.py
 
+class Colonne(models.Model):
+    """
+    Colonne d'un tableau (ex: "2023", "Urbain ~ Féminin"), partagée par toutes ses cellules.
+    Le libellé, son découpage principal / sous-colonne et la note ne sont stockés qu'une fois.
+    """
+    tableau = models.ForeignKey(Tableau, on_delete=models.CASCADE, related_name='colonnes')
+    label = models.CharField(max_length=255)
+    principal = models.CharField(max_length=255)            # partie avant "~"
+    sous = models.CharField(max_length=255, blank=True)     # partie après "~" ("" sinon)
+    note = models.CharField(max_length=255, blank=True, null=True)  # ex: colonne étoilée "* Données RGE 2024"
+    ordre = models.PositiveIntegerField(default=0)          # ordre d'apparition dans la feuille
+
+    class Meta:
+        ordering = ['ordre']
+        constraints = [
+            models.UniqueConstraint(fields=['tableau', 'label'], name='colonne_unique_par_tableau'),
+        ]
+
+    @staticmethod
+    def decouper(label):
+        """Découpe un libellé : "Urbain ~ Féminin" -> ("Urbain", "Féminin"), "2023" -> ("2023", "")."""
+        col = (label or "").strip()
+        if "~" in col:
+            principal, sous = map(str.strip, col.split("~", 1))
+            return principal, sous
+        return col, ""
+
+    def __str__(self):
+        return self.label
+
+
 class Donnees(models.Model):
+    """Cellule d'un tableau : colonne, source et catégorie sont portées par Colonne et Tableau."""
     ligne = models.ForeignKey("LigneIndicateur", on_delete=models.SET_NULL, null=True, blank=True)  # ✅ null autorisé
-    colonne = models.CharField(max_length=255)
+    colonne = models.ForeignKey(Colonne, on_delete=models.CASCADE)
     unite = models.CharField(max_length=50, blank=True)
-    source = models.TextField(blank=True)
     valeur = models.FloatField(null=True, blank=True)
     statut = models.CharField(max_length=50, blank=True, null=True)
-    note_colonne = models.CharField(max_length=255, blank=True, null=True)  
-    categorie = models.ForeignKey(Categorie, on_delete=models.CASCADE)
-    tableau = models.ForeignKey(Tableau, on_delete=models.CASCADE)
+    tableau = models.ForeignKey(Tableau, on_delete=models.CASCADE)  # index simple : lecture par tableau dans l'ordre des id
+
+    class Meta:
+        # Index taillés sur les accès des vues (voir QueryPlanTests)
+        indexes = [
+            models.Index(fields=['tableau', 'colonne'], name='donnees_tableau_colonne_idx'),
+            models.Index(fields=['tableau', 'ligne'], name='donnees_tableau_ligne_idx'),
+            # partiel : seules les cellules en statut sont indexées
+            models.Index(
+                fields=['tableau', 'statut'], name='donnees_statut_idx',
+                condition=models.Q(statut__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.ligne} - {self.colonne}: {self.valeur}"
+
+
+class StructureTableau(models.Model):
+    """
+    Instantané du document servi par TableauDetailStructureView, déjà sérialisé en JSON,
+    et des options de filtrage (TableauFiltresOptionsView).
+    Régénéré à chaque import du tableau et à chaque modification de ses données.
+    """
+    tableau = models.OneToOneField(Tableau, on_delete=models.CASCADE, primary_key=True, related_name='structure')
+    version = models.PositiveIntegerField(default=1)  # incrémentée à chaque régénération
+    document = models.BinaryField()
+    options = models.BinaryField(null=True)  # null : instantané antérieur aux options, recalculé à la lecture
+    genere_le = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Structure {self.tableau_id} (v{self.version})"
+
+
+class MatriceTableau(models.Model):
+    """
+    Valeurs d'un tableau rangées en matrice lignes × colonnes (voir matrice.py),
+    régénérées avec l'instantané de structure. Les cellules Donnees restent la référence.
+    """
+    tableau = models.OneToOneField(Tableau, on_delete=models.CASCADE, primary_key=True, related_name='matrice')
+    version = models.PositiveIntegerField(default=1)  # incrémentée à chaque régénération
+    nb_lignes = models.PositiveIntegerField(default=0)
+    nb_colonnes = models.PositiveIntegerField(default=0)
+    lignes = models.BinaryField()        # id des lignes (int64)
+    colonnes = models.BinaryField()      # id des colonnes (int64)
+    valeurs = models.BinaryField()       # float64, NaN : pas de valeur
+    etats = models.BinaryField()         # int16 : -1 absente, 0 présente, k > 0 : statuts[k - 1]
+    codes_unites = models.BinaryField()  # uint8 : indice dans unites
+    statuts = models.JSONField(default=list, blank=True)
+    unites = models.JSONField(default=list, blank=True)
+    genere_le = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Matrice {self.tableau_id} ({self.nb_lignes}×{self.nb_colonnes}, v{self.version})"
+
+
+class DocumentRecherche(models.Model):
+    """
+    Entrée de l'index de recherche (voir recherche.py) : une catégorie, un thème, un tableau
+    (titre + source), une ligne ou une colonne d'un tableau. `texte` est normalisé
+    (minuscules, sans accents) ; l'index plein texte propre au moteur (tsvector + GIN sous
+    PostgreSQL, table FTS5 sous SQLite) est créé par la migration et suit cette table.
+    """
+    CATEGORIE = 'Categorie'
+    THEME = 'Theme'
+    TABLEAU = 'Tableau'
+    LIGNE = 'Indicateur'
+    COLONNE = 'Colonne'
+    TYPES = [(t, t) for t in (CATEGORIE, THEME, TABLEAU, LIGNE, COLONNE)]
+
+    type = models.CharField(max_length=20, choices=TYPES)
+    objet_id = models.BigIntegerField()
+    libelle = models.TextField()  # texte affiché
+    texte = models.TextField()    # texte indexé
+    poids = models.FloatField(default=1.0)  # multiplie la pertinence : titres avant libellés de lignes
+    # propriétaire, pour la suppression en cascade et le lien vers le tableau
+    categorie = models.ForeignKey(Categorie, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    theme = models.ForeignKey(Theme, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    tableau = models.ForeignKey(Tableau, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+
+    class Meta:
+        indexes = [models.Index(fields=['type', 'objet_id'], name='recherche_objet_idx')]
+
+    def __str__(self):
+        return f"{self.type} {self.objet_id} : {self.libelle}"
+
+
+class JournalRecherche(models.Model):
+    """
+    Réindexations successives (recherche.journaliser), rejouées par les index en mémoire de
+    chaque processus (suggestions.py) : seuls les propriétaires modifiés sont relus.
+    """
+    generation = models.PositiveBigIntegerField(primary_key=True)  # attribuée par CompteurRecherche
+    genre = models.CharField(max_length=20)  # tableau / categorie / theme / tout
+    objet_id = models.BigIntegerField(null=True, blank=True)
+    cree_le = models.DateTimeField(auto_now_add=True)
+
+
+class CompteurRecherche(models.Model):
+    """Dernière génération du journal de recherche (ligne unique, pk=1)."""
+    valeur = models.PositiveBigIntegerField(default=0)
+
+
+class TacheImport(models.Model):
+    """Import Excel mis en file d'attente, traité par la commande `import_worker`."""
+
+    EN_ATTENTE = 'en_attente'
+    EN_COURS = 'en_cours'
+    TERMINEE = 'terminee'
+    ECHOUEE = 'echouee'
+    STATUTS = [
+        (EN_ATTENTE, 'En attente'),
+        (EN_COURS, 'En cours'),
+        (TERMINEE, 'Terminée'),
+        (ECHOUEE, 'Échouée'),
+    ]
+
+    fichier = models.FileField(upload_to='imports/')
+    nom_fichier = models.CharField(max_length=255)
+    theme = models.ForeignKey(Theme, on_delete=models.CASCADE)
+    categorie = models.ForeignKey(Categorie, on_delete=models.CASCADE)
+    utilisateur = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    statut = models.CharField(max_length=20, choices=STATUTS, default=EN_ATTENTE)
+    feuilles = models.JSONField(default=list, blank=True)  # progression par feuille
+    erreur = models.TextField(blank=True)
+    cree_le = models.DateTimeField(auto_now_add=True)
+    debut = models.DateTimeField(null=True, blank=True)
+    fin = models.DateTimeField(null=True, blank=True)
+    actif_le = models.DateTimeField(null=True, blank=True)  # dernier signe de vie du worker
+    tentatives = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-cree_le']
+
+    def __str__(self):
+        return f"{self.nom_fichier} ({self.statut})"
@@ -0,0 +1,26 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class DonneesPagination(CursorPagination):
+    """
+    Pagination par curseur (keyset) : chaque page reprend après le dernier id servi,
+    sans OFFSET, donc en temps constant quelle que soit la profondeur de la page.
+    """
+    ordering = 'id'
+    page_size = 500
+    page_size_query_param = 'page_size'
+    max_page_size = 5000
+
+
+class TableauPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class RecherchePagination(PageNumberPagination):
+    """Pages numérotées : les résultats de recherche sont classés par pertinence, pas par id."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
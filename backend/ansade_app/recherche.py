@@ -0,0 +1,223 @@
+"""
+Recherche globale : index des catégories, thèmes, tableaux (titre + source), libellés de
+lignes et en-têtes de colonnes, dans DocumentRecherche.
+Le texte indexé est normalisé (minuscules, sans accents) ; la requête l'est de la même façon,
+et chaque terme est cherché comme préfixe ("popul" trouve "population").
+- PostgreSQL : vecteur tsvector (configuration french) + index GIN, classement ts_rank ;
+- SQLite : table FTS5 (unicode61), classement bm25 ;
+- autre moteur : simple filtre LIKE sur le texte normalisé, sans classement.
+L'index d'un tableau est reconstruit avec ses instantanés (structure.regenerer), celui des
+catégories et thèmes à leur enregistrement par l'API.
+Chaque réindexation est inscrite en base dans JournalRecherche (génération + propriétaire
+modifié), que les index en mémoire de chaque processus (suggestions.py) rejouent sans relire
+toute la base.
+"""
+import re
+import unicodedata
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import (
+    Categorie, Colonne, CompteurRecherche, DocumentRecherche, JournalRecherche, LigneIndicateur, Tableau, Theme,
+)
+
+# Pertinence relative : un titre qui correspond passe avant un libellé de ligne ou de colonne
+POIDS = {
+    DocumentRecherche.CATEGORIE: 3.0,
+    DocumentRecherche.THEME: 3.0,
+    DocumentRecherche.TABLEAU: 3.0,
+    DocumentRecherche.LIGNE: 1.0,
+    DocumentRecherche.COLONNE: 0.5,
+}
+
+
+def normaliser(texte):
+    """Minuscules sans accents : "Énergie électrique" -> "energie electrique"."""
+    texte = unicodedata.normalize("NFKD", texte or "")
+    return "".join(c for c in texte if not unicodedata.combining(c)).lower()
+
+
+def termes(requete):
+    return re.findall(r"\w+", normaliser(requete))
+
+
+JOURNAL_MAX = 1000  # entrées gardées ; un processus plus en retard reconstruit son index
+
+
+def generation_courante():
+    """Dernière génération validée du journal (une lecture par clé primaire)."""
+    return CompteurRecherche.objects.filter(pk=1).values_list("valeur", flat=True).first() or 0
+
+
+def journaliser(proprietaire):
+    """
+    Inscrit au journal le propriétaire réindexé : ("tableau", id), ("categorie", id),
+    ("theme", id) ou ("tout", None), dans la transaction de la réindexation. La ligne du
+    compteur reste verrouillée jusqu'à la validation : les générations sont validées dans l'ordre.
+    """
+    genre, objet_id = proprietaire
+    with transaction.atomic():
+        if not CompteurRecherche.objects.filter(pk=1).update(valeur=F("valeur") + 1):
+            try:
+                with transaction.atomic():
+                    CompteurRecherche.objects.create(pk=1, valeur=1)
+            except IntegrityError:  # compteur créé en parallèle
+                CompteurRecherche.objects.filter(pk=1).update(valeur=F("valeur") + 1)
+        generation = generation_courante()
+        JournalRecherche.objects.create(generation=generation, genre=genre, objet_id=objet_id)
+        JournalRecherche.objects.filter(generation__lte=generation - JOURNAL_MAX).delete()
+
+
+def _document(type, objet_id, libelle, texte=None, **proprietaire):
+    return DocumentRecherche(
+        type=type, objet_id=objet_id, libelle=libelle, texte=normaliser(texte or libelle),
+        poids=POIDS[type], **proprietaire,
+    )
+
+
+def documents_tableau(tableau_id):
+    """Documents d'un tableau : son titre (avec la source), ses lignes et ses colonnes, sans doublons."""
+    tableau = Tableau.objects.filter(pk=tableau_id).values_list("titre", "source").first()
+    if tableau is None:
+        return []
+    titre, source = tableau
+    documents = [_document(DocumentRecherche.TABLEAU, tableau_id, titre or "", f"{titre or ''} {source or ''}",
+                           tableau_id=tableau_id)]
+
+    vus = set()
+    for type, elements in (
+        (DocumentRecherche.LIGNE, LigneIndicateur.objects.filter(tableau_id=tableau_id).order_by("id").values_list("id", "label")),
+        (DocumentRecherche.COLONNE, Colonne.objects.filter(tableau_id=tableau_id).order_by("ordre", "id").values_list("id", "label")),
+    ):
+        for pk, label in elements:
+            libelle = " ".join((label or "").replace("~", " ").split())
+            cle = (type, normaliser(libelle))
+            # les en-têtes purement numériques (années) ne distinguent pas un tableau d'un autre
+            if not libelle or libelle.isdigit() or cle in vus:
+                continue
+            vus.add(cle)
+            documents.append(_document(type, pk, libelle, tableau_id=tableau_id))
+    return documents
+
+
+def indexer_tableau(tableau_id):
+    with transaction.atomic():
+        DocumentRecherche.objects.filter(tableau_id=tableau_id).delete()
+        DocumentRecherche.objects.bulk_create(documents_tableau(tableau_id))
+        journaliser(("tableau", tableau_id))
+
+
+def indexer_categorie(categorie):
+    with transaction.atomic():
+        DocumentRecherche.objects.filter(type=DocumentRecherche.CATEGORIE, objet_id=categorie.id).delete()
+        _document(DocumentRecherche.CATEGORIE, categorie.id, categorie.nom_cat, categorie_id=categorie.id).save()
+        journaliser(("categorie", categorie.id))
+
+
+def indexer_theme(theme):
+    with transaction.atomic():
+        DocumentRecherche.objects.filter(type=DocumentRecherche.THEME, objet_id=theme.id).delete()
+        _document(DocumentRecherche.THEME, theme.id, theme.nom_theme, theme_id=theme.id).save()
+        journaliser(("theme", theme.id))
+
+
+def indexer_tout():
+    """Reconstruit l'index des catégories et des thèmes (les tableaux passent par indexer_tableau)."""
+    with transaction.atomic():
+        DocumentRecherche.objects.filter(type__in=[DocumentRecherche.CATEGORIE, DocumentRecherche.THEME]).delete()
+        DocumentRecherche.objects.bulk_create(
+            [_document(DocumentRecherche.CATEGORIE, pk, nom, categorie_id=pk)
+             for pk, nom in Categorie.objects.values_list("id", "nom_cat")]
+            + [_document(DocumentRecherche.THEME, pk, nom, theme_id=pk)
+               for pk, nom in Theme.objects.values_list("id", "nom_theme")]
+        )
+        journaliser(("tout", None))
+
+
+COLONNES_RESULTAT = "d.id, d.type, d.objet_id, d.libelle, d.tableau_id"
+
+
+class ResultatsRecherche:
+    """
+    Résultats classés d'une requête, lus à la demande : count() puis une tranche [debut:fin]
+    (une requête chacun), comme un QuerySet pour le paginateur de DRF.
+    """
+
+    def __init__(self, requete):
+        self.termes = termes(requete)
+        self._total = None
+
+    def _sql(self):
+        """(FROM + WHERE, paramètres, expression du score) selon le moteur."""
+        if connection.vendor == "postgresql":
+            requete = " & ".join(f"{t}:*" for t in self.termes)
+            return (
+                "ansade_app_documentrecherche d, to_tsquery('french', %s) q WHERE d.vecteur @@ q",
+                [requete], "ts_rank(d.vecteur, q) * d.poids",
+            )
+        if connection.vendor == "sqlite":
+            requete = " ".join(f'"{t}"*' for t in self.termes)
+            return (
+                "ansade_recherche_fts f JOIN ansade_app_documentrecherche d ON d.id = f.rowid "
+                "WHERE ansade_recherche_fts MATCH %s",
+                [requete], "-bm25(ansade_recherche_fts) * d.poids",
+            )
+        conditions = " AND ".join(["d.texte LIKE %s"] * len(self.termes))
+        return (
+            f"ansade_app_documentrecherche d WHERE {conditions}",
+            [f"%{t}%" for t in self.termes], "d.poids",
+        )
+
+    def count(self):
+        if not self.termes:
+            return 0
+        if self._total is None:
+            source, parametres, _ = self._sql()
+            with connection.cursor() as curseur:
+                curseur.execute(f"SELECT COUNT(*) FROM {source}", parametres)
+                self._total = curseur.fetchone()[0]
+        return self._total
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, tranche):
+        if not isinstance(tranche, slice):
+            raise TypeError("ResultatsRecherche ne se lit que par tranches")
+        debut = int(tranche.start or 0)
+        fin = self.count() if tranche.stop is None else int(tranche.stop)
+        if not self.termes or fin <= debut:
+            return []
+        source, parametres, score = self._sql()
+        with connection.cursor() as curseur:
+            curseur.execute(
+                f"SELECT {COLONNES_RESULTAT}, {score} AS score FROM {source} "
+                f"ORDER BY score DESC, d.id LIMIT {fin - debut} OFFSET {debut}",
+                parametres,
+            )
+            return curseur.fetchall()
+
+
+def rechercher(requete):
+    return ResultatsRecherche(requete)
+
+
+def resultats_json(lignes):
+    """Résultats d'une page, avec le tableau auquel appartient chaque ligne ou colonne (une requête)."""
+    tableaux = {
+        t["id"]: t
+        for t in Tableau.objects.filter(id__in={l[4] for l in lignes if l[4]}).values("id", "titre", "source")
+    }
+    resultats = []
+    for _, type, objet_id, libelle, tableau_id, score in lignes:
+        tableau = tableaux.get(tableau_id)
+        resultats.append({
+            "type": type,
+            "id": objet_id,
+            "nom": libelle,
+            "source": tableau["source"] if tableau and type == DocumentRecherche.TABLEAU else None,
+            "tableau": {"id": tableau["id"], "titre": tableau["titre"]} if tableau else None,
+            "score": round(score, 6),
+        })
+    return resultats
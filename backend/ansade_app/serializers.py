@@ -1,10 +1,36 @@
 from rest_framework import serializers
-from .models import Categorie, Theme, Tableau, Donnees,User,LigneIndicateur
+from .models import Categorie, Colonne, Theme, Tableau, Donnees,User,LigneIndicateur, TacheImport
+from django.db.models import Max
+from django.utils import timezone
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from django.contrib.auth import authenticate
 from django.utils.translation import gettext_lazy as _
 
+def champs_demandes(request):
+    """Champs demandés par `?fields=id,titre` (None : tous les champs)."""
+    if request is None:
+        return None
+    valeur = request.query_params.get('fields', '')
+    champs = {c.strip() for c in valeur.split(',') if c.strip()}
+    return champs or None
+
+
+class ChampsDynamiquesMixin:
+    """✅ Réponses allégées : `?fields=` restreint les champs sérialisés."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        champs = champs_demandes(self.context.get('request'))
+        if champs is None:
+            return
+        inconnus = champs - set(self.fields)
+        if inconnus:
+            raise ValidationError({'fields': f"Champs inconnus : {', '.join(sorted(inconnus))}"})
+        for nom in set(self.fields) - champs:
+            self.fields.pop(nom)
+
+
 class CategorieSerializer(serializers.ModelSerializer):
     class Meta:
         model = Categorie
@@ -13,7 +39,7 @@ class CategorieSerializer(serializers.ModelSerializer):
 class LigneIndicateurSerializer(serializers.ModelSerializer):
     class Meta:
         model = LigneIndicateur
-        fields = ['id', 'label', 'ordre', 'code', 'parent_code', 'niveau']
+        fields = ['id', 'label', 'ordre', 'code', 'parent_code', 'niveau', 'parent', 'rang', 'rang_fin']
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     username_field = 'email'
@@ -55,16 +81,71 @@ class ThemeSerializer(serializers.ModelSerializer):
         model = Theme
         fields = '__all__'
 
-class TableauSerializer(serializers.ModelSerializer):
+class TableauSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Tableau
         fields = '__all__'
+        # ✅ tenus par l'import (empreinte du contenu, format de stockage)
+        read_only_fields = ['empreinte', 'format']
 
 from .models import Donnees
 
-class DonneesSerializer(serializers.ModelSerializer):
+class DonneesSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     ligne = LigneIndicateurSerializer()
+    # ✅ mêmes champs qu'avant la normalisation : lus sur la colonne et le tableau
+    colonne = serializers.CharField(source='colonne.label', max_length=255)
+    note_colonne = serializers.CharField(source='colonne.note', read_only=True, allow_null=True)
+    source = serializers.CharField(source='tableau.source', read_only=True, allow_null=True)
 
     class Meta:
         model = Donnees
         fields = ['id', 'valeur', 'colonne', 'unite', 'source', 'ligne','statut','note_colonne']
+
+    @staticmethod
+    def colonne_du_tableau(tableau_id, label):
+        """Colonne du tableau portant ce libellé, créée en fin de feuille si elle n'existe pas."""
+        label = label.strip()
+        principal, sous = Colonne.decouper(label)
+        colonne, _ = Colonne.objects.get_or_create(
+            tableau_id=tableau_id, label=label,
+            defaults={
+                'principal': principal, 'sous': sous,
+                'ordre': (Colonne.objects.filter(tableau_id=tableau_id).aggregate(m=Max('ordre'))['m'] or 0) + 1,
+            },
+        )
+        return colonne
+
+    def update(self, instance, validated_data):
+        # {"colonne": "2024"} : la cellule passe dans la colonne de ce libellé
+        label = validated_data.pop('colonne', {}).get('label')
+        if label is not None:
+            validated_data['colonne'] = self.colonne_du_tableau(instance.tableau_id, label)
+        return super().update(instance, validated_data)
+
+
+class TacheImportSerializer(serializers.ModelSerializer):
+    duree = serializers.SerializerMethodField()
+    totaux = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TacheImport
+        fields = ['id', 'nom_fichier', 'theme', 'categorie', 'statut', 'feuilles', 'totaux',
+                  'erreur', 'cree_le', 'debut', 'fin', 'duree']
+
+    def get_duree(self, obj):
+        """Temps écoulé (en secondes) depuis le début du traitement."""
+        if not obj.debut:
+            return None
+        return round(((obj.fin or timezone.now()) - obj.debut).total_seconds(), 1)
+
+    def get_totaux(self, obj):
+        feuilles = obj.feuilles or []
+        return {
+            "feuilles": len(feuilles),
+            "importees": sum(1 for f in feuilles if f.get("statut") == "importee"),
+            "mises_a_jour": sum(1 for f in feuilles if f.get("statut") == "mise_a_jour"),
+            "inchangees": sum(1 for f in feuilles if f.get("statut") == "inchangee"),
+            "erreurs": sum(1 for f in feuilles if f.get("statut") == "erreur"),
+            "lignes": sum(f.get("lignes", 0) for f in feuilles),
+            "donnees": sum(f.get("donnees", 0) for f in feuilles),
+        }
@@ -0,0 +1,123 @@
+"""
+Séries d'un indicateur à travers tous les tableaux (IndicateurSeriesAPIView).
+Un indicateur est désigné par son code (LigneIndicateur.code) ou son libellé (sans tenir
+compte de la casse) ; toutes les cellules de toutes les lignes correspondantes sont lues en
+une requête (index ligne_code_idx / ligne_label_maj_idx, puis l'index de Donnees.ligne).
+Les colonnes sont placées dans le temps par analyse.instant ; seule la sous-colonne
+demandée (?groupe=) est retenue, par défaut la colonne sans sous-colonne ou "Total".
+
+Quand plusieurs tableaux donnent la même période, une seule valeur est gardée, dans l'ordre :
+1. une valeur numérique passe avant une cellule vide ou en statut (N/D, ...) ;
+2. puis le tableau le plus récent, c'est-à-dire celui dont la dernière période est la plus récente ;
+3. puis le dernier tableau importé (id le plus grand) ;
+4. dans un même tableau, la première ligne portant ce code ou ce libellé (id le plus petit).
+Les autres valeurs restent visibles dans "sources" (tableaux ayant contribué à la série).
+Le résultat est mis en cache jusqu'à la prochaine réindexation d'un tableau (génération du
+journal de recherche, lue en base).
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Q, Value
+from django.db.models.functions import Upper
+
+from .analyse import DUREE_CACHE, instant
+from .models import Donnees, LigneIndicateur
+from .recherche import generation_courante
+
+MAX_INDICATEURS = 20
+GROUPES_TOTAL = ("", "total", "ensemble")
+
+
+def lignes_demandees(codes, labels, theme_id=None):
+    """Lignes désignées par leurs codes ou leurs libellés (requête non évaluée)."""
+    condition = Q(code__in=codes) if codes else Q()
+    for label in labels:
+        condition |= Q(label_maj=Upper(Value(label)))
+    lignes = LigneIndicateur.objects.alias(label_maj=Upper("label")).filter(condition)
+    if theme_id is not None:
+        lignes = lignes.filter(tableau__theme_id=theme_id)
+    return lignes.values("id")
+
+
+def cellules(codes, labels, theme_id=None):
+    return (
+        Donnees.objects
+        .filter(ligne_id__in=lignes_demandees(codes, labels, theme_id))
+        .order_by("id")
+        .values_list(
+            "ligne_id", "ligne__code", "ligne__label", "colonne__principal", "colonne__sous",
+            "valeur", "unite", "statut", "tableau_id", "tableau__titre", "tableau__source",
+        )
+    )
+
+
+def _periode(principal, sous, groupe):
+    """(libellé de période, instant) si la colonne est retenue pour le groupe, sinon None."""
+    for periode, autre in ((principal, sous), (sous, principal)):
+        if periode and (t := instant(periode)) is not None:
+            retenue = (autre or "").strip().lower() in GROUPES_TOTAL if groupe is None else (
+                (autre or "").strip().lower() == groupe.strip().lower())
+            return (periode, t) if retenue else None
+    return None
+
+
+def construire_series(codes, labels, debut=None, fin=None, groupe=None, theme_id=None):
+    cles = [("code", c) for c in codes] + [("label", l) for l in labels]
+    labels_maj = {l.upper(): l for l in labels}
+    periodes = {}
+    candidats = {cle: {} for cle in cles}   # cle -> instant -> [(rang, cellule)]
+    sources = {cle: {} for cle in cles}     # cle -> tableau_id -> description
+    derniere = {}                           # tableau_id -> dernière période du tableau
+
+    lues = []
+    for ligne_id, code, label, principal, sous, valeur, unite, statut, tableau_id, titre, source in cellules(
+        codes, labels, theme_id
+    ):
+        if (principal, sous) not in periodes:
+            periodes[principal, sous] = _periode(principal, sous, groupe)
+        periode = periodes[principal, sous]
+        if periode is None:
+            continue
+        derniere[tableau_id] = max(derniere.get(tableau_id, periode[1]), periode[1])
+        if (debut is not None and periode[1] < debut) or (fin is not None and periode[1] >= fin + 1):
+            continue
+        correspondances = [("code", code)] if code in codes else []
+        if (label or "").upper() in labels_maj:
+            correspondances.append(("label", labels_maj[label.upper()]))
+        lues.append((correspondances, periode, ligne_id, valeur, unite, statut, tableau_id, titre, source))
+
+    for correspondances, (periode, t), ligne_id, valeur, unite, statut, tableau_id, titre, source in lues:
+        rang = (valeur is not None, derniere[tableau_id], tableau_id, -ligne_id)
+        point = {"periode": periode, "valeur": valeur, "unite": unite, "statut": statut, "tableau_id": tableau_id}
+        for cle in correspondances:
+            candidats[cle].setdefault(t, []).append((rang, point))
+            description = sources[cle].setdefault(tableau_id, {
+                "tableau_id": tableau_id, "titre": titre, "source": source, "ligne_id": ligne_id, "valeurs": 0,
+            })
+            description["valeurs"] += valeur is not None
+
+    indicateurs = []
+    for cle in cles:
+        serie = [max(points, key=lambda p: p[0])[1] for _, points in sorted(candidats[cle].items())]
+        indicateurs.append({
+            "par": cle[0],
+            "cle": cle[1],
+            "serie": serie,
+            "sources": sorted(sources[cle].values(), key=lambda s: -derniere[s["tableau_id"]]),
+        })
+    return {"debut": debut, "fin": fin, "groupe": groupe, "indicateurs": indicateurs}
+
+
+def series(codes, labels, debut=None, fin=None, groupe=None, theme_id=None):
+    """Séries des indicateurs, en cache jusqu'à la prochaine réindexation d'un tableau."""
+    parametres = json.dumps([codes, labels, debut, fin, groupe, theme_id], ensure_ascii=False)
+    cle = "ansade:series:{}:{}".format(
+        generation_courante(), hashlib.sha256(parametres.encode()).hexdigest()[:32],
+    )
+    resultat = cache.get(cle)
+    if resultat is None:
+        resultat = construire_series(codes, labels, debut, fin, groupe, theme_id)
+        cache.set(cle, resultat, DUREE_CACHE)
+    return resultat
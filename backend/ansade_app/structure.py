@@ -0,0 +1,500 @@
+"""
+Document "structure" d'un tableau (colonnes groupées, lignes hiérarchisées, valeurs formatées),
+servi par TableauDetailStructureView, et options de filtrage servies par TableauFiltresOptionsView.
+Ils ne changent que lorsque le tableau est réimporté ou modifié : ils sont construits
+à ce moment-là, sérialisés une fois, et stockés dans StructureTableau.
+Les documents de plusieurs tableaux sont servis en un lot (StructuresParLotView), éventuellement
+réduits à un aperçu (en-têtes et premières lignes).
+"""
+import json
+from collections import OrderedDict, defaultdict
+from functools import partial
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .matrice import generer_matrice, stockage_actif
+from .models import Colonne, Donnees, LigneIndicateur, StructureTableau, Tableau
+from .recherche import indexer_tableau
+
+
+def structure_vide():
+    return {
+        "colonnes_groupées": {},
+        "colonnes_order": [],
+        "data": [],
+        "has_sous_indicateurs": False,
+        "meta": {"titre": "", "source": "", "etiquette_ligne": ""},
+        "format": None,
+        "statuts": [],
+    }
+
+# Colonnes lues pour chaque cellule : tuples étroits plutôt qu'instances de modèles
+CHAMPS_CELLULE = (
+    "colonne__principal", "colonne__sous", "valeur", "unite", "statut", "colonne__note",
+    "ligne_id", "ligne__label", "ligne__code", "ligne__parent_code", "ligne__ordre",
+    "ligne__niveau", "ligne__rang", "ligne__rang_fin",
+)
+
+
+def format_lignes(lignes):
+    """Format d'un tableau d'après ses lignes (label, code, parent_code, ordre) : code/ordre => nouveau."""
+    nouveau = any(code or ordre is not None for _, code, _, ordre in lignes)
+    return Tableau.NOUVEAU if nouveau else Tableau.ANCIEN
+
+
+def _formateur(titre):
+    """Formate une cellule (valeur, unité, statut) ; le test du titre est fait une seule fois."""
+    titre_lower = (titre or "").lower()
+    titre_contient_pourcentage = ("%" in titre_lower) or ("pourcentage" in titre_lower)
+
+    def format_value(valeur, unite, statut):
+        if valeur is None and not statut:
+            return ""  # cellule vide
+        if statut:
+            return statut  # ex: "N/D", "NS"
+
+        if unite == "%":
+            val = (valeur * 100) if abs(valeur) <= 1.5 else valeur
+            s = f"{val:.1f}".rstrip('0').rstrip('.')
+            return s if titre_contient_pourcentage else f"{s}%"
+        # 👉 ne pas ajouter d'étoile ici, juste retourner la valeur
+        return f"{valeur:.2f}".rstrip('0').rstrip('.')
+
+    return format_value
+
+
+def construire_structure(tableau_id):
+    """
+    Construit le document structure d'un tableau en un seul passage sur ses cellules.
+    Nombre de requêtes fixe : le tableau, puis ses cellules (avec leur ligne et leur colonne) en tuples.
+    """
+    tableau = (
+        Tableau.objects
+        .filter(pk=tableau_id)
+        .values("titre", "source", "etiquette_ligne", "format")
+        .first()
+    )
+    if tableau is None:
+        return structure_vide()
+
+    cellules = (
+        Donnees.objects
+        .filter(tableau_id=tableau_id)
+        .order_by("id")
+        .values_list(*CHAMPS_CELLULE)
+    )
+    # Anciens tableaux sans format enregistré : détection sur les lignes
+    format_tableau = tableau["format"] or None
+    if format_tableau is None:
+        cellules = list(cellules)
+        format_tableau = format_lignes((None, code, None, ordre) for *_, code, _, ordre, _, _, _ in cellules)
+    is_nouveau_format = format_tableau == Tableau.NOUVEAU
+
+    format_value = _formateur(tableau["titre"])
+    colonnes_principales = OrderedDict()
+    statuts_uniques = {}
+    notes = {}
+    nodes_by_code = OrderedDict()  # nouveau format
+    structure = OrderedDict()      # ancien format
+    vide = True
+
+    for (col_principal, col_sous, valeur, unite, statut, note,
+         ligne_id, label, code, parent_code, ordre, niveau, rang, rang_fin) in cellules:
+        vide = False
+
+        # ✅ Statuts textuels spéciaux et notes liées aux colonnes (ex: * Données RGE 2024)
+        if statut:
+            s = statut.strip().upper()
+            if s:
+                statuts_uniques[s] = None
+        if note:
+            notes[note] = None
+
+        # Colonnes groupées (découpage "principal ~ sous" fait à l'import)
+        sous_colonnes = colonnes_principales.setdefault(col_principal, [])
+        if col_sous not in sous_colonnes:
+            sous_colonnes.append(col_sous)
+
+        v = format_value(valeur, unite or "", statut)
+        label = (label or "").strip()
+
+        if is_nouveau_format:
+            # Clés hiérarchie
+            cle = (code or "").strip() or f"__row_{ligne_id}"
+            node = nodes_by_code.get(cle)
+            if node is None:
+                node = nodes_by_code[cle] = {
+                    "code": cle,
+                    "parent_code": (parent_code or "").strip(),
+                    "indicateur": label,
+                    "ordre": ordre,
+                    "valeurs": defaultdict(dict),
+                    "children": [],
+                    "ligne_id": ligne_id,
+                    "niveau": niveau,
+                    "rang": rang,
+                    "rang_fin": rang_fin,
+                }
+            node["valeurs"][col_principal][col_sous] = v
+
+        # Lignes groupées (~)
+        elif "~" in label:
+            principal, sous = map(str.strip, label.split("~", 1))
+            entree = structure.get(principal)
+            if entree is None:
+                entree = structure[principal] = {"sous_indicateurs": [], "valeurs": defaultdict(dict), "rang": rang}
+            entree["sous_indicateurs"].append({
+                "nom": sous,
+                "valeurs": {col_principal: {col_sous: v}},
+                "rang": rang,
+            })
+            if rang is not None and (entree["rang"] is None or rang < entree["rang"]):
+                entree["rang"] = rang
+        else:
+            entree = structure.get(label)
+            if entree is None:
+                entree = structure[label] = {"sous_indicateurs": [], "valeurs": defaultdict(dict), "rang": rang}
+            entree["valeurs"][col_principal][col_sous] = v
+            if rang is not None and (entree["rang"] is None or rang < entree["rang"]):
+                entree["rang"] = rang
+
+    if vide:
+        return structure_vide()
+
+    # Colonnes groupées + ordre à plat
+    colonnes_groupées = {
+        col: sous if any(sous) else [""]
+        for col, sous in colonnes_principales.items()
+    }
+    colonnes_order = []
+    for gp, sous in colonnes_principales.items():
+        if any(sous):
+            for s in sous:
+                colonnes_order.append({"principal": gp, "sous": s})
+        else:
+            colonnes_order.append({"principal": gp, "sous": ""})
+
+    if is_nouveau_format:
+        data = _aplatir_par_rang(nodes_by_code)
+        if data is None:
+            data = _aplatir_arbre(nodes_by_code)
+        has_sous_indicateurs = False
+    else:
+        data = _aplatir_ancien(structure)
+        has_sous_indicateurs = any(row.get("sous_indicateurs") for row in data)
+
+    return {
+        "colonnes_groupées": colonnes_groupées,
+        "colonnes_order": colonnes_order,
+        "data": data,
+        "has_sous_indicateurs": has_sous_indicateurs,
+        "meta": {
+            "titre": tableau["titre"],
+            "source": tableau["source"] or "",
+            "etiquette_ligne": tableau["etiquette_ligne"] or ""
+        },
+        "format": format_tableau,
+        "notes": list(notes),
+        "statuts": list(statuts_uniques),
+    }
+
+
+def _ligne_nouveau(n, niveau, is_section):
+    return {
+        "indicateur": n["indicateur"],
+        "valeurs": dict(n["valeurs"]),
+        "niveau": niveau,
+        "ordre": n["ordre"],
+        "code": n["code"],
+        "parent_code": n["parent_code"] or None,
+        "ligne_id": n["ligne_id"],
+        "is_section": is_section,
+    }
+
+
+def _has_any_value(n):
+    return any(v for g in n["valeurs"].values() for v in g.values())
+
+
+def _aplatir_par_rang(nodes_by_code):
+    """
+    Nouveau format : lignes dans l'ordre de la hiérarchie enregistrée à l'import (rang, niveau).
+    Retourne None si elle manque ou ne couvre pas exactement les lignes affichées
+    (tableau importé avant son calcul, ligne sans cellule...) : l'arbre est alors reconstruit.
+    """
+    nodes = sorted(nodes_by_code.values(), key=lambda n: (n["rang"] is None, n["rang"] or 0))
+    if not nodes or nodes[-1]["rang"] is None:
+        return None
+    if any(n["rang"] != i or n["rang_fin"] >= len(nodes) for i, n in enumerate(nodes)):
+        return None
+    return [
+        # une ligne a des enfants si son sous-arbre ne se limite pas à elle-même
+        _ligne_nouveau(n, n["niveau"], n["rang_fin"] > n["rang"] and not _has_any_value(n))
+        for n in nodes
+    ]
+
+
+def _aplatir_arbre(nodes_by_code):
+    """Nouveau format : arbre code / parent_code reconstruit et aplati, trié par ordre puis libellé."""
+    roots = []
+    for node in nodes_by_code.values():
+        p = node["parent_code"]
+        if p and p in nodes_by_code:
+            nodes_by_code[p]["children"].append(node)
+        else:
+            roots.append(node)
+
+    def flatten(nodes, niveau=0):
+        out = []
+        nodes_sorted = sorted(
+            nodes,
+            key=lambda n: (
+                n["ordre"] is None,                # ceux sans ordre en dernier
+                n["ordre"],
+                n["indicateur"]
+            )
+        )
+        for n in nodes_sorted:
+            out.append(_ligne_nouveau(n, niveau, len(n["children"]) > 0 and not _has_any_value(n)))
+            out.extend(flatten(n["children"], niveau + 1))
+        return out
+
+    return flatten(roots)
+
+
+def _par_rang(element):
+    rang = element["rang"]
+    return (rang is None, rang or 0)
+
+
+def _aplatir_ancien(structure):
+    """
+    Ancien format : lignes à plat, sous-indicateurs regroupés (séparateur ~).
+    Les lignes suivent leur rang (ordre de la feuille, même après une mise à jour en place) ;
+    à rang égal, l'ordre de lecture des cellules est conservé.
+    """
+    data = []
+    for indicateur, contenu in sorted(structure.items(), key=lambda e: _par_rang(e[1])):
+        if contenu["sous_indicateurs"]:
+            regroupé = OrderedDict()
+            for sous in sorted(contenu["sous_indicateurs"], key=_par_rang):
+                nom = sous["nom"]
+                if nom not in regroupé:
+                    regroupé[nom] = defaultdict(dict)
+                for c, sous_vals in sous["valeurs"].items():
+                    for sc, val in sous_vals.items():
+                        regroupé[nom][c][sc] = val
+            data.append({
+                "indicateur": indicateur,
+                "sous_indicateurs": [
+                    {"nom": nom, "valeurs": regroupé[nom]}
+                    for nom in regroupé
+                ],
+                "niveau": 0,
+                "ordre": None,
+                "code": None,
+                "parent_code": None,
+                "ligne_id": None,
+                "is_section": False
+            })
+        else:
+            data.append({
+                "indicateur": indicateur,
+                "valeurs": dict(contenu["valeurs"]),
+                "niveau": 0,
+                "ordre": None,
+                "code": None,
+                "parent_code": None,
+                "ligne_id": None,
+                "is_section": False
+            })
+    return data
+
+
+def _options_groupees(libelles):
+    """
+    (id, libellé) dans l'ordre du tableau -> options "Indicateur ~ Sous" regroupées par indicateur
+    (première apparition), avec les id correspondants. Un indicateur qui a des sous-lignes
+    n'est proposé qu'à travers elles.
+    """
+    groupes = OrderedDict()
+    ids = defaultdict(list)
+    for pk, libelle in libelles:
+        libelle = (libelle or "").strip()
+        if not libelle:
+            continue
+        if "~" in libelle:
+            principal, sous = map(str.strip, libelle.split("~", 1))
+            option = f"{principal} ~ {sous}"
+            groupes.setdefault(principal, OrderedDict())[option] = None
+        else:
+            principal = option = libelle
+            groupes.setdefault(principal, OrderedDict())
+        ids[option].append(pk)
+
+    options = []
+    for principal, sous_options in groupes.items():
+        options.extend(sous_options or [principal])
+    return options, {option: ids[option] for option in options}
+
+
+def construire_options(tableau_id):
+    """
+    Options de filtrage d'un tableau : lignes et colonnes qui ont au moins une cellule, dans
+    l'ordre de la feuille. Deux requêtes (semi-jointures sur les index (tableau, ligne) et
+    (tableau, colonne) des cellules), quel que soit le nombre de cellules.
+    """
+    cellules = Donnees.objects.filter(tableau_id=tableau_id)
+    lignes, lignes_ids = _options_groupees(
+        LigneIndicateur.objects
+        .filter(tableau_id=tableau_id, id__in=cellules.values("ligne_id"))
+        .order_by(F("ordre").asc(nulls_last=True), "id")
+        .values_list("id", "label")
+    )
+    colonnes, colonnes_ids = _options_groupees(
+        Colonne.objects
+        .filter(tableau_id=tableau_id, id__in=cellules.values("colonne_id"))
+        .order_by("ordre", "id")
+        .values_list("id", "label")
+    )
+    return {"lignes": lignes, "colonnes": colonnes, "lignes_ids": lignes_ids, "colonnes_ids": colonnes_ids}
+
+
+def generer_structure(tableau_id):
+    """
+    Construit et enregistre l'instantané du tableau (document et options de filtrage) ;
+    sa version augmente à chaque régénération. Retourne le document JSON (bytes).
+    """
+    document = JSONRenderer().render(construire_structure(tableau_id))
+    options = JSONRenderer().render(construire_options(tableau_id))
+    mises_a_jour = StructureTableau.objects.filter(tableau_id=tableau_id).update(
+        document=document, options=options, version=F("version") + 1, genere_le=timezone.now(),
+    )
+    if not mises_a_jour:
+        try:
+            with transaction.atomic():
+                StructureTableau.objects.create(tableau_id=tableau_id, document=document, options=options)
+        except IntegrityError:
+            # tableau supprimé entre-temps, ou instantané créé en parallèle
+            pass
+    return document
+
+
+def regenerer(tableau_id):
+    """
+    Régénère la matrice des valeurs (si le stockage en matrice est actif), l'instantané
+    et l'index de recherche du tableau.
+    """
+    if stockage_actif():
+        generer_matrice(tableau_id)
+    generer_structure(tableau_id)
+    indexer_tableau(tableau_id)
+
+
+def regenerer_apres_commit(*tableau_ids):
+    """Régénère les instantanés une fois la transaction en cours validée."""
+    for tableau_id in set(filter(None, tableau_ids)):
+        transaction.on_commit(partial(regenerer, tableau_id))
+
+
+def structure_json(tableau_id):
+    """
+    Document structure d'un tableau, lu dans StructureTableau (une lecture par clé primaire).
+    Les tableaux sans instantané (importés avant son introduction) sont construits puis stockés.
+    """
+    document = (
+        StructureTableau.objects
+        .filter(tableau_id=tableau_id)
+        .values_list("document", flat=True)
+        .first()
+    )
+    if document is not None:
+        return bytes(document)
+    if not Tableau.objects.filter(pk=tableau_id).exists():
+        return JSONRenderer().render(construire_structure(tableau_id))
+    return generer_structure(tableau_id)
+
+
+DUREE_APERCU = 24 * 3600
+
+
+def _documents_manquants(tableau_ids):
+    """Documents des tableaux existants sans instantané (construits puis stockés), par id."""
+    existants = Tableau.objects.filter(pk__in=tableau_ids).values_list("id", flat=True)
+    return {tableau_id: generer_structure(tableau_id) for tableau_id in existants}
+
+
+def apercu(document, nb_lignes):
+    """En-têtes et `nb_lignes` premières lignes d'un document structure (bytes), avec le total de lignes."""
+    structure = json.loads(document)
+    structure["nb_lignes"] = len(structure["data"])
+    structure["data"] = structure["data"][:nb_lignes]
+    return JSONRenderer().render(structure)
+
+
+def documents_par_lot(tableau_ids, nb_lignes=None):
+    """
+    Documents structure (bytes) de plusieurs tableaux, par id, lus en une requête sur
+    StructureTableau. Avec `nb_lignes`, aperçus (voir apercu) mis en cache par version
+    d'instantané : seuls les documents absents du cache sont relus.
+    """
+    instantanes = StructureTableau.objects.filter(tableau_id__in=tableau_ids)
+    if nb_lignes is None:
+        documents = {tableau_id: bytes(d) for tableau_id, d in instantanes.values_list("tableau_id", "document")}
+        manquants = [t for t in tableau_ids if t not in documents]
+        return {**documents, **(_documents_manquants(manquants) if manquants else {})}
+
+    cles = {
+        tableau_id: f"ansade:apercu:{tableau_id}:v{version}:l{nb_lignes}"
+        for tableau_id, version in instantanes.values_list("tableau_id", "version")
+    }
+    en_cache = cache.get_many(cles.values())
+    documents = {t: en_cache[cle] for t, cle in cles.items() if cle in en_cache}
+    a_lire = [t for t in cles if t not in documents]
+    if a_lire:
+        nouveaux = {
+            tableau_id: apercu(bytes(d), nb_lignes)
+            for tableau_id, d in instantanes.filter(tableau_id__in=a_lire).values_list("tableau_id", "document")
+        }
+        cache.set_many({cles[t]: d for t, d in nouveaux.items()}, DUREE_APERCU)
+        documents.update(nouveaux)
+    manquants = [t for t in tableau_ids if t not in cles]
+    if manquants:
+        documents.update({t: apercu(d, nb_lignes) for t, d in _documents_manquants(manquants).items()})
+    return documents
+
+
+def structures_json(tableau_ids, nb_lignes=None):
+    """
+    Réponse du lot : {"structures": [{"id", "structure"}...] dans l'ordre demandé, "absents": [ids]},
+    assemblée à partir des documents déjà sérialisés.
+    """
+    documents = documents_par_lot(tableau_ids, nb_lignes)
+    structures = b",".join(b'{"id":%d,"structure":%s}' % (t, documents[t]) for t in tableau_ids if t in documents)
+    absents = json.dumps([t for t in tableau_ids if t not in documents]).encode()
+    return b'{"structures":[%s],"absents":%s}' % (structures, absents)
+
+
+def options_json(tableau_id):
+    """
+    Options de filtrage d'un tableau, lues dans StructureTableau (une lecture par clé primaire).
+    None si le tableau n'existe pas ; recalculées puis stockées si l'instantané n'en a pas.
+    """
+    options = (
+        StructureTableau.objects
+        .filter(tableau_id=tableau_id)
+        .values_list("options", flat=True)
+        .first()
+    )
+    if options is not None:
+        return bytes(options)
+    if not Tableau.objects.filter(pk=tableau_id).exists():
+        return None
+    options = JSONRenderer().render(construire_options(tableau_id))
+    if not StructureTableau.objects.filter(tableau_id=tableau_id).update(options=options):
+        generer_structure(tableau_id)
+    return options
@@ -0,0 +1,226 @@
+"""
+Suggestions de la barre de recherche : index de préfixes en mémoire (tableau trié + bisect)
+sur les noms de catégories et de thèmes, les titres et sources des tableaux et les libellés
+d'indicateurs, normalisés comme la recherche (minuscules, sans accents).
+Chaque suggestion est trouvée à partir du début de chacun de ses premiers mots.
+L'index est construit une fois par processus depuis DocumentRecherche, puis tenu à jour en
+rejouant JournalRecherche (recherche.journaliser) : seuls les propriétaires modifiés sont relus.
+Sa taille est bornée (ANSADE_SUGGESTIONS_MAX_ENTREES) : une fois le budget atteint, les
+nouveaux libellés d'indicateurs ne sont plus ajoutés (titres, thèmes et catégories le sont toujours).
+"""
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .models import DocumentRecherche, JournalRecherche
+from .recherche import JOURNAL_MAX, generation_courante, termes
+
+SOURCE = "Source"
+# rang d'affichage à pertinence égale
+PRIORITE = {
+    DocumentRecherche.CATEGORIE: 0,
+    DocumentRecherche.THEME: 1,
+    DocumentRecherche.TABLEAU: 2,
+    SOURCE: 3,
+    DocumentRecherche.LIGNE: 4,
+}
+MOTS_INDEXES = 10     # une entrée par début de mot, pour les premiers mots seulement
+LONGUEUR_CLE = 32     # les clés sont tronquées ; au-delà, le texte complet est vérifié
+EXAMEN_MAX = 2000     # entrées examinées au plus par requête
+
+
+def _texte(libelle):
+    return " ".join(termes(libelle))
+
+
+class IndexPrefixes:
+    """
+    `entrees` : liste triée de (début de texte, numéro de suggestion) ;
+    `suggestions` : numéro -> [libellé, type, texte normalisé, nombre de propriétaires, id] ;
+    `proprietaires` : propriétaire -> numéros des suggestions qu'il apporte.
+    """
+
+    def __init__(self, max_entrees, generation=0):
+        self.max_entrees = max_entrees
+        self.generation = generation
+        self.entrees = []
+        self.suggestions = {}
+        self.numeros = {}  # (type, texte) -> numéro
+        self.proprietaires = {}
+        self._suivant = 0
+        self.taille = 0  # entrées, y compris celles d'un chargement pas encore trié
+        self.ignorees = 0
+
+    @staticmethod
+    def _cles(texte):
+        mots = texte.split(" ")
+        debuts, position = [], 0
+        for mot in mots[:MOTS_INDEXES]:
+            if len(mot) > 1 or position == 0:
+                debuts.append(texte[position:position + LONGUEUR_CLE])
+            position += len(mot) + 1
+        return debuts
+
+    def _enregistrer(self, proprietaire, elements):
+        """
+        elements : (type, libellé, id) apportés par le propriétaire (remplace les précédents).
+        Retourne les entrées (clé, numéro) des nouvelles suggestions, à insérer dans `entrees`.
+        """
+        self.retirer(proprietaire)
+        numeros, nouvelles = set(), []
+        for type, libelle, objet_id in elements:
+            texte = _texte(libelle)
+            if not texte:
+                continue
+            numero = self.numeros.get((type, texte))
+            if numero is None:
+                cles = self._cles(texte)
+                if type == DocumentRecherche.LIGNE and self.taille + len(cles) > self.max_entrees:
+                    self.ignorees += 1
+                    continue
+                numero = self._suivant
+                self._suivant += 1
+                self.numeros[(type, texte)] = numero
+                self.suggestions[numero] = [libelle.strip(), type, texte, 0, objet_id]
+                nouvelles.extend((cle, numero) for cle in cles)
+                self.taille += len(cles)
+            if numero not in numeros:
+                numeros.add(numero)
+                self.suggestions[numero][3] += 1
+        self.proprietaires[proprietaire] = numeros
+        return nouvelles
+
+    def ajouter(self, proprietaire, elements):
+        """Mise à jour d'un propriétaire : insertion triée (bisect) des nouvelles entrées."""
+        for entree in self._enregistrer(proprietaire, elements):
+            insort(self.entrees, entree)
+
+    def charger(self, par_proprietaire):
+        """Construction de l'index complet : toutes les entrées sont triées une seule fois."""
+        for proprietaire, elements in par_proprietaire.items():
+            self.entrees.extend(self._enregistrer(proprietaire, elements))
+        self.entrees.sort()
+
+    def retirer(self, proprietaire):
+        for numero in self.proprietaires.pop(proprietaire, ()):
+            suggestion = self.suggestions[numero]
+            suggestion[3] -= 1
+            if suggestion[3] > 0:
+                continue
+            for cle in self._cles(suggestion[2]):
+                i = bisect_left(self.entrees, (cle, numero))
+                if i < len(self.entrees) and self.entrees[i] == (cle, numero):
+                    del self.entrees[i]
+                    self.taille -= 1
+            del self.numeros[(suggestion[1], suggestion[2])]
+            del self.suggestions[numero]
+
+    def chercher(self, requete, limite=10):
+        prefixe = _texte(requete)
+        premier, _, reste = prefixe.partition(" ")
+        if len(premier) == 1 and reste:
+            prefixe = reste  # "d'électr" : les mots d'une lettre ne sont pas des débuts indexés
+        if not prefixe:
+            return []
+        cle = prefixe[:LONGUEUR_CLE]
+        trouves = set()
+        i = bisect_left(self.entrees, (cle,))
+        for debut, numero in self.entrees[i:i + EXAMEN_MAX]:
+            if not debut.startswith(cle):
+                break
+            trouves.add(numero)
+        if len(prefixe) > LONGUEUR_CLE:
+            trouves = {n for n in trouves if f" {prefixe}" in f" {self.suggestions[n][2]}"}
+
+        meilleures = sorted(
+            (self.suggestions[n] for n in trouves),
+            key=lambda s: (PRIORITE[s[1]], -s[3], len(s[0]), s[0]),
+        )[:limite]
+        return [
+            {"texte": libelle, "type": type, "nombre": nombre,
+             "id": objet_id if type not in (SOURCE, DocumentRecherche.LIGNE) else None}
+            for libelle, type, _, nombre, objet_id in meilleures
+        ]
+
+
+def elements(documents):
+    """(type, libellé, id) par propriétaire, depuis les lignes de DocumentRecherche."""
+    par_proprietaire = {}
+    for type, objet_id, libelle, categorie_id, theme_id, tableau_id, source in documents:
+        if type == DocumentRecherche.CATEGORIE:
+            proprietaire = ("categorie", categorie_id)
+        elif type == DocumentRecherche.THEME:
+            proprietaire = ("theme", theme_id)
+        else:
+            proprietaire = ("tableau", tableau_id)
+        liste = par_proprietaire.setdefault(proprietaire, [])
+        liste.append((type, libelle, objet_id))
+        if type == DocumentRecherche.TABLEAU and source:
+            liste.append((SOURCE, source, None))
+    return par_proprietaire
+
+
+def _documents(**filtres):
+    return (
+        DocumentRecherche.objects
+        .filter(type__in=[t for t in PRIORITE if t != SOURCE], **filtres)
+        .order_by("id")
+        .values_list("type", "objet_id", "libelle", "categorie_id", "theme_id", "tableau_id", "tableau__source")
+    )
+
+
+def construire(generation):
+    index = IndexPrefixes(getattr(settings, 'ANSADE_SUGGESTIONS_MAX_ENTREES', 200_000), generation)
+    index.charger(elements(_documents()))
+    return index
+
+
+def rafraichir(index, proprietaire):
+    """Relit en base les documents d'un seul propriétaire."""
+    genre, pk = proprietaire
+    liste = elements(_documents(**{f"{genre}_id": pk})).get(proprietaire, [])
+    if liste:
+        index.ajouter(proprietaire, liste)
+    else:
+        index.retirer(proprietaire)
+
+
+_index = None
+_verrou = threading.Lock()
+
+
+def index_a_jour():
+    """
+    Index du processus : une lecture de la génération en base par appel ; seuls les propriétaires
+    modifiés depuis sont relus (tout l'index si le journal ne couvre plus le retard).
+    """
+    global _index
+    generation = generation_courante()
+    with _verrou:
+        if _index is not None and _index.generation == generation:
+            return _index
+        if _index is not None and 0 < generation - _index.generation <= JOURNAL_MAX:
+            modifies = list(
+                JournalRecherche.objects
+                .filter(generation__gt=_index.generation, generation__lte=generation)
+                .order_by("generation")
+                .values_list("genre", "objet_id")
+            )
+            if len(modifies) == generation - _index.generation and ("tout", None) not in modifies:
+                for proprietaire in dict.fromkeys(modifies):
+                    rafraichir(_index, proprietaire)
+                _index.generation = generation
+                return _index
+        _index = construire(generation)
+        return _index
+
+
+def suggerer(requete, limite=10):
+    return index_a_jour().chercher(requete, limite)
+
+
+def oublier():
+    global _index
+    with _verrou:
+        _index = None
@@ -0,0 +1,79 @@
+"""
+Classeurs Excel synthétiques pour mesurer l'import (commande bench_import).
+Deux mises en page, celles reconnues par l'import :
+- "nouveau" : en-têtes titre_fr / source_fr / ordre / code / parent / des_fr puis les années ;
+- "ancien" : ligne "TABLEAU ...", ligne d'en-têtes, données puis "Source : ...".
+"""
+import random
+
+import openpyxl
+
+FORMATS = ["nouveau", "ancien"]
+
+STATUTS = ["N/D", "-", "nd", "..."]
+
+
+def _valeur(hasard, part_statuts):
+    """Cellule de données : nombre Excel, nombre saisi en texte (virgule, espaces) ou statut."""
+    tirage = hasard.random()
+    if tirage < part_statuts:
+        return hasard.choice(STATUTS)
+    tirage = hasard.random()
+    if tirage < 0.6:
+        return round(hasard.uniform(0, 100000), 2)
+    if tirage < 0.8:
+        return f"{hasard.uniform(0, 1000):.1f}".replace('.', ',')
+    return f"{hasard.randint(1, 999)} {hasard.randint(0, 999):03d}"
+
+
+def _annees(nb_colonnes):
+    return [str(2024 - nb_colonnes + 1 + i) for i in range(nb_colonnes)]
+
+
+def _feuille_nouveau(ws, numero, nb_lignes, nb_colonnes, part_statuts, hasard):
+    ws.append(["titre_fr", "source_fr", "ordre", "code", "parent", "des_fr"] + _annees(nb_colonnes))
+    titre = f"Tableau {numero} : Indicateur synthétique {numero}"
+    parent = ""
+    for i in range(nb_lignes):
+        code = f"{numero}.{i + 1}"
+        # une ligne sur cinq est un regroupement, les suivantes en dépendent
+        if i % 5 == 0:
+            parent_ligne, parent = "", code
+        else:
+            parent_ligne = parent
+        ws.append(
+            [titre if i == 0 else "", "ANSADE (synthétique)" if i == 0 else "", i + 1, code, parent_ligne,
+             f"Indicateur {code}"]
+            + [_valeur(hasard, part_statuts) for _ in range(nb_colonnes)]
+        )
+
+
+def _feuille_ancien(ws, numero, nb_lignes, nb_colonnes, part_statuts, hasard):
+    ws.append([f"TABLEAU {numero} : Indicateur synthétique {numero}"])
+    ws.append(["Indicateur"] + _annees(nb_colonnes))
+    for i in range(nb_lignes):
+        ws.append([f"Indicateur {numero}.{i + 1}"] + [_valeur(hasard, part_statuts) for _ in range(nb_colonnes)])
+    ws.append(["Source : ANSADE (synthétique)"])
+
+
+def generer_classeur(chemin, format="nouveau", feuilles=1, lignes=100, colonnes=10, part_statuts=0.05, graine=0):
+    """
+    Écrit un classeur synthétique de `feuilles` feuilles de `lignes` lignes × `colonnes` années.
+    `part_statuts` est la part des cellules contenant un statut texte ("N/D", "-", ...).
+    Le contenu ne dépend que des paramètres (graine fixe) : deux exécutions sont comparables.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Format inconnu : {format}")
+    remplir = _feuille_nouveau if format == "nouveau" else _feuille_ancien
+    hasard = random.Random(graine)
+
+    # Classeur ordinaire (pas write_only) : comme un fichier enregistré par Excel, il porte la
+    # balise <dimension>, et la lecture read_only rend toutes les lignes à la largeur de la
+    # feuille ; la ligne "Source : ..." de l'ancien format est alors lue comme les vraies.
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for n in range(feuilles):
+        ws = wb.create_sheet(f"T{n + 1}")
+        remplir(ws, n + 1, lignes, colonnes, part_statuts, hasard)
+    wb.save(chemin)
+    return chemin
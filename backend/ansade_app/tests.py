@@ -1,3 +1,1154 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import Future
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import openpyxl
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import matrice
+from .analyse import analyser, instant
+from .carte import code_wilaya
+from .series import cellules
+from .hierarchie import calculer_hierarchie
+from .bulk import _valeur_csv, copie_disponible
+from .importation import executer_tache, hierarchiser, importer_classeur, reserver_tache
+from .lecture import compacter, deployer, lire_feuille
+from .management.commands.bench_cellules import analyser_par_cellule, analyser_vectorise, generer_bloc
+from .management.commands import import_dossier
+from .management.commands.import_dossier import ecrire_reprise, parcourir
+from .matrice import Matrice, charger_index, charger_matrice, generer_matrice, oublier_index
+from .recherche import JOURNAL_MAX, indexer_categorie, indexer_tableau, journaliser
+from . import suggestions
+from .models import (
+    Categorie, Colonne, DocumentRecherche, Donnees, LigneIndicateur, MatriceTableau, Tableau, TacheImport, Theme, User,
+)
+from .synthetique import FORMATS, generer_classeur
+from .structure import CHAMPS_CELLULE, construire_structure, generer_structure
+
+
+def creer_colonnes(tableau, labels, notes=None):
+    """Colonnes d'un tableau de test, dans l'ordre de `labels` ; `notes` : {libellé: note}."""
+    notes = notes or {}
+    return Colonne.objects.bulk_create([
+        Colonne(tableau=tableau, label=label, principal=Colonne.decouper(label)[0], sous=Colonne.decouper(label)[1],
+                note=notes.get(label), ordre=i)
+        for i, label in enumerate(labels)
+    ])
+
+
+class StructureTableauTests(TestCase):
+    """Le document structure est construit avec un nombre de requêtes fixe."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categorie = Categorie.objects.create(nom_cat="Démographie")
+        cls.theme = Theme.objects.create(nom_theme="Population", categorie=cls.categorie)
+
+    def creer_tableau(self, nb_lignes, nb_colonnes, format=Tableau.NOUVEAU):
+        tableau = Tableau.objects.create(
+            nom_feuille=f"T{nb_lignes}", titre="Population (%)", theme=self.theme, format=format,
+        )
+        nouveau = format != Tableau.ANCIEN
+        lignes = LigneIndicateur.objects.bulk_create([
+            LigneIndicateur(
+                tableau=tableau,
+                label=f"Indicateur {i}",
+                code=f"C{i}" if nouveau else "",
+                parent_code=f"C{i - i % 5}" if nouveau and i % 5 else "",
+                ordre=i if nouveau else None,
+            )
+            for i in range(nb_lignes)
+        ])
+        colonnes = creer_colonnes(tableau, [str(2000 + j) for j in range(nb_colonnes)], {"2000": "Données RGE 2024"})
+        Donnees.objects.bulk_create([
+            Donnees(
+                tableau=tableau, ligne=ligne, colonne=colonne,
+                unite="%", valeur=0.5 if j % 3 else None, statut=None if j % 3 else "N/D",
+            )
+            for ligne in lignes for j, colonne in enumerate(colonnes)
+        ])
+        return tableau
+
+    def test_nombre_de_requetes_fixe(self):
+        for format in (Tableau.NOUVEAU, Tableau.ANCIEN):
+            petit = self.creer_tableau(2, 2, format)
+            grand = self.creer_tableau(200, 15, format)
+            with self.subTest(format=format):
+                with self.assertNumQueries(2):
+                    structure_petit = construire_structure(petit.id)
+                with self.assertNumQueries(2):
+                    structure_grand = construire_structure(grand.id)
+                self.assertEqual(structure_petit["format"], format)
+                self.assertEqual(len(structure_grand["colonnes_order"]), 15)
+                self.assertEqual(structure_grand["statuts"], ["N/D"])
+                self.assertEqual(structure_grand["notes"], ["Données RGE 2024"])
+
+    def test_format_non_renseigne(self):
+        tableau = self.creer_tableau(20, 5, format="")
+        with self.assertNumQueries(2):
+            structure = construire_structure(tableau.id)
+        self.assertEqual(structure["format"], Tableau.NOUVEAU)
+        # arbre code / parent_code : une section de tête tous les 5 indicateurs
+        self.assertEqual([ligne["niveau"] for ligne in structure["data"][:6]], [0, 1, 1, 1, 1, 0])
+
+    def test_tableau_sans_donnees(self):
+        tableau = Tableau.objects.create(nom_feuille="vide", titre="Vide", theme=self.theme)
+        with self.assertNumQueries(2):
+            structure = construire_structure(tableau.id)
+        self.assertEqual(structure["data"], [])
+        self.assertIsNone(structure["format"])
+
+    def test_vue_lit_l_instantane(self):
+        tableau = self.creer_tableau(50, 10)
+        generer_structure(tableau.id)
+        with self.assertNumQueries(1):
+            reponse = self.client.get(f"/api/tableaux/{tableau.id}/structure/")
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()["format"], Tableau.NOUVEAU)
+
+    def test_options_precalculees(self):
+        tableau = self.creer_tableau(30, 4)
+        LigneIndicateur.objects.filter(tableau=tableau, label="Indicateur 3").update(label="Indicateur 2 ~ Urbain")
+        LigneIndicateur.objects.create(tableau=tableau, label="Sans cellule", ordre=99)
+        generer_structure(tableau.id)
+        with self.assertNumQueries(1):
+            options = self.client.get(f"/api/tableaux/{tableau.id}/filtres-options/").json()
+        # ordre de la feuille ; "Indicateur 2" n'est proposé qu'à travers sa sous-ligne
+        self.assertEqual(options["lignes"][:3], ["Indicateur 0", "Indicateur 1", "Indicateur 2 ~ Urbain"])
+        self.assertNotIn("Sans cellule", options["lignes"])
+        self.assertEqual(options["colonnes"], ["2000", "2001", "2002", "2003"])
+        self.assertEqual(options["colonnes_ids"]["2001"], [tableau.colonnes.get(label="2001").id])
+
+        grand = self.creer_tableau(300, 15)
+        generer_structure(grand.id)
+        with self.assertNumQueries(1):
+            self.client.get(f"/api/tableaux/{grand.id}/filtres-options/")
+        self.assertEqual(self.client.get("/api/tableaux/999999/filtres-options/").status_code, 404)
+
+    def test_lot(self):
+        cache.clear()  # aperçus en cache par id de tableau et version
+        tableaux = [self.creer_tableau(n, 3) for n in (5, 40, 12)]
+        for tableau in tableaux:
+            generer_structure(tableau.id)
+        ids = [tableaux[2].id, tableaux[0].id, tableaux[1].id]
+        with self.assertNumQueries(1):
+            reponse = self.client.get(f"/api/structures/?ids={','.join(map(str, ids))}")
+        lot = reponse.json()
+        self.assertEqual([s["id"] for s in lot["structures"]], ids)
+        self.assertEqual(lot["structures"][1]["structure"], self.client.get(f"/api/tableaux/{ids[1]}/structure/").json())
+
+        # aperçu : en-têtes et premières lignes ; le second appel ne relit que les versions
+        with self.assertNumQueries(3):  # versions, documents hors cache, tableau 999999 inexistant
+            apercus = self.client.get(f"/api/structures/?ids={ids[2]},999999&lignes=3").json()
+        self.assertEqual(apercus["absents"], [999999])
+        (apercu,) = apercus["structures"]
+        self.assertEqual((len(apercu["structure"]["data"]), apercu["structure"]["nb_lignes"]), (3, 40))
+        self.assertEqual(len(apercu["structure"]["colonnes_order"]), 3)
+        with self.assertNumQueries(2):
+            self.client.get(f"/api/structures/?ids={ids[2]},999999&lignes=3")
+
+        with self.settings(ANSADE_STRUCTURES_PAR_LOT=2):
+            self.assertEqual(self.client.get(f"/api/structures/?ids={','.join(map(str, ids))}").status_code, 400)
+        self.assertEqual(self.client.get("/api/structures/?ids=1,a").status_code, 400)
+
+
+class HierarchieTests(TestCase):
+    """Hiérarchie code / parent_code enregistrée sur les lignes."""
+
+    def test_calculer_hierarchie(self):
+        lignes = [
+            (1, "Total", "T", "", 1),
+            (2, "Femmes", "F", "T", 3),
+            (3, "Hommes", "H", "T", 2),
+            (4, "Urbain", "HU", "H", 1),
+            (5, "Autre", "", "", None),
+        ]
+        self.assertEqual(calculer_hierarchie(lignes), {
+            1: (None, 0, 0, 3),
+            3: (1, 1, 1, 2),
+            4: (3, 2, 2, 2),
+            2: (1, 1, 3, 3),
+            5: (None, 0, 4, 4),
+        })
+
+    def test_lignes_par_niveau_parent_et_sous_arbre(self):
+        categorie = Categorie.objects.create(nom_cat="Démographie")
+        theme = Theme.objects.create(nom_theme="Population", categorie=categorie)
+        tableau = Tableau.objects.create(nom_feuille="T1", titre="Population", theme=theme, format=Tableau.NOUVEAU)
+        for i, (code, parent) in enumerate([("A", ""), ("A1", "A"), ("A11", "A1"), ("B", "")]):
+            LigneIndicateur.objects.create(tableau=tableau, label=code, code=code, parent_code=parent, ordre=i)
+        hierarchiser(tableau)
+        a = LigneIndicateur.objects.get(tableau=tableau, code="A")
+
+        url = f"/api/tableaux/{tableau.id}/lignes/"
+        with self.assertNumQueries(1):
+            tete = self.client.get(url, {"niveau": 0}).json()
+        self.assertEqual([l["code"] for l in tete], ["A", "B"])
+        self.assertEqual([l["code"] for l in self.client.get(url, {"parent": a.id}).json()], ["A1"])
+        with self.assertNumQueries(1):
+            sous_arbre = self.client.get(url, {"sous_arbre": a.id}).json()
+        self.assertEqual([(l["code"], l["niveau"]) for l in sous_arbre], [("A1", 1), ("A11", 2)])
+
+
+class ExecuteurImmediat:
+    """Remplace le pool de processus dans les tests : chaque tâche est exécutée à sa soumission."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fonction, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fonction(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class ImportTests(TestCase):
+    """Lecture et import de classeurs synthétiques (synthetique.generer_classeur)."""
+
+    def classeur(self, format="nouveau", **parametres):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        return generer_classeur(os.path.join(dossier.name, f"{format}.xlsx"), format, **parametres)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.theme = Theme.objects.create(nom_theme="Import", categorie=Categorie.objects.create(nom_cat="Import"))
+
+    def tache(self, **champs):
+        with open(self.classeur(feuilles=1, lignes=5, colonnes=3), "rb") as f:
+            fichier = SimpleUploadedFile("classeur.xlsx", f.read())
+        tache = TacheImport.objects.create(
+            fichier=fichier, nom_fichier="classeur.xlsx", theme=self.theme, categorie=self.theme.categorie, **champs
+        )
+        self.addCleanup(tache.fichier.storage.delete, tache.fichier.name)
+        return tache
+
+    def test_reprise_tache_abandonnee(self):
+        maintenant = timezone.now()
+        self.tache(statut=TacheImport.EN_COURS, actif_le=maintenant, tentatives=1)  # worker vivant
+        abandonnee = self.tache(statut=TacheImport.EN_COURS, actif_le=maintenant - timedelta(minutes=31), tentatives=1)
+        tache = reserver_tache()
+        self.assertEqual((tache.id, tache.statut, tache.tentatives), (abandonnee.id, TacheImport.EN_COURS, 2))
+        self.assertIsNone(reserver_tache())
+
+        TacheImport.objects.filter(pk=tache.id).update(actif_le=maintenant - timedelta(minutes=31), tentatives=3)
+        self.assertIsNone(reserver_tache())
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, TacheImport.ECHOUEE)
+        self.assertFalse(tache.fichier)
+
+    def test_fichier_supprime_en_fin_de_tache(self):
+        self.tache()
+        tache = reserver_tache()
+        chemin = tache.fichier.path
+        executer_tache(tache)
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, TacheImport.TERMINEE)
+        self.assertFalse(tache.fichier)
+        self.assertFalse(os.path.exists(chemin))
+        self.assertIsNotNone(tache.actif_le)
+
+    def contenu(self, theme):
+        """Contenu importé dans un thème, sans les id : comparable d'un import à l'autre."""
+        tableaux = Tableau.objects.filter(theme=theme)
+        return {
+            "tableaux": sorted(tableaux.values_list(
+                "nom_feuille", "titre", "source", "etiquette_ligne", "format", "empreinte",
+            )),
+            "lignes": sorted(LigneIndicateur.objects.filter(tableau__in=tableaux).values_list(
+                "tableau__nom_feuille", "label", "code", "parent_code", "ordre", "parent__code", "niveau",
+                "rang", "rang_fin",
+            ), key=repr),
+            "colonnes": sorted(Colonne.objects.filter(tableau__in=tableaux).values_list(
+                "tableau__nom_feuille", "label", "principal", "sous", "note", "ordre",
+            ), key=repr),
+            "donnees": sorted(Donnees.objects.filter(tableau__in=tableaux).values_list(
+                "tableau__nom_feuille", "ligne__rang", "colonne__label", "unite", "valeur", "statut",
+            ), key=repr),
+        }
+
+    def autre_theme(self, nom):
+        return Theme.objects.create(nom_theme=nom, categorie=self.theme.categorie)
+
+    def test_reimport_inchange(self):
+        for format in FORMATS:
+            with self.subTest(format=format):
+                theme = self.autre_theme(format)
+                chemin = self.classeur(format, feuilles=2, lignes=20, colonnes=4)
+                rapports = importer_classeur(chemin, theme.id)
+                self.assertEqual([r["statut"] for r in rapports], ["importee", "importee"])
+                avant = self.contenu(theme)
+
+                with CaptureQueriesContext(connection) as requetes:
+                    rapports = importer_classeur(chemin, theme.id)
+                self.assertEqual([r["statut"] for r in rapports], ["inchangee", "inchangee"])
+                ecritures = [q["sql"] for q in requetes if re.match(r"\s*(INSERT|UPDATE|DELETE)", q["sql"], re.I)]
+                self.assertEqual(ecritures, [])
+                self.assertEqual(self.contenu(theme), avant)
+
+    def test_reimport_modifie_egal_import_neuf(self):
+        for format, colonne_label in (("nouveau", 6), ("ancien", 1)):
+            with self.subTest(format=format):
+                theme, neuf = self.autre_theme(format), self.autre_theme(f"{format} (neuf)")
+                chemin = self.classeur(format, feuilles=2, lignes=20, colonnes=4, part_statuts=0.2)
+                importer_classeur(chemin, theme.id)
+
+                # une valeur et un libellé modifiés dans la première feuille
+                wb = openpyxl.load_workbook(chemin)
+                ws = wb["T1"]
+                ws.cell(row=4, column=colonne_label + 2).value = 123456.5
+                ws.cell(row=5, column=colonne_label).value = "Indicateur renommé"
+                modifie = os.path.join(os.path.dirname(chemin), f"{format}_modifie.xlsx")
+                wb.save(modifie)
+
+                rapports = importer_classeur(modifie, theme.id)
+                self.assertEqual([r["statut"] for r in rapports], ["mise_a_jour", "inchangee"])
+                self.assertEqual(
+                    (rapports[0]["donnees_modifiees"], rapports[0]["lignes_supprimees"], rapports[0]["lignes"]),
+                    (1, 1, 1),
+                )
+                importer_classeur(modifie, neuf.id)
+                self.assertEqual(self.contenu(theme), self.contenu(neuf))
+                # la ligne renommée reste à sa place dans la structure affichée
+                structures = [
+                    construire_structure(Tableau.objects.get(theme=t, nom_feuille="T1").id)["data"]
+                    for t in (theme, neuf)
+                ]
+                self.assertEqual(*[[(l["indicateur"], l.get("valeurs")) for l in data] for data in structures])
+
+    def test_import_parallele(self):
+        sequentiel, parallele = self.autre_theme("1 processus"), self.autre_theme("2 processus")
+        chemin = self.classeur("nouveau", feuilles=3, lignes=30, colonnes=5, part_statuts=0.2)
+        rapports = importer_classeur(chemin, sequentiel.id, processus=1)
+        rapports_paralleles = importer_classeur(chemin, parallele.id, processus=2)
+        self.assertEqual(
+            [(r["feuille"], r["statut"], r["lignes"], r["donnees"]) for r in rapports_paralleles],
+            [(r["feuille"], r["statut"], r["lignes"], r["donnees"]) for r in rapports],
+        )
+        self.assertEqual(self.contenu(parallele), self.contenu(sequentiel))
+
+    def test_import_parallele_processus_tue(self):
+        sequentiel, parallele = self.autre_theme("1 processus"), self.autre_theme("pool cassé")
+        chemin = self.classeur("nouveau", feuilles=5, lignes=30, colonnes=5)
+        importer_classeur(chemin, sequentiel.id)
+
+        etats = {}
+
+        def progression(feuille, rapport):
+            etats[feuille] = rapport["statut"]
+            if feuille == "T1" and rapport["statut"] == "en_cours":
+                for processus in multiprocessing.active_children():  # les processus du pool
+                    processus.kill()
+                    processus.join()
+
+        with self.assertLogs("ansade_app.importation", "WARNING"):
+            rapports = importer_classeur(chemin, parallele.id, progression, processus=2)
+        self.assertEqual([r["statut"] for r in rapports], ["importee"] * 5)
+        self.assertEqual(etats, {f"T{n}": "importee" for n in range(1, 6)})
+        self.assertEqual(self.contenu(parallele), self.contenu(sequentiel))
+
+    def test_annulation_par_feuille(self):
+        def hierarchiser_sauf_t2(tableau, batch_size=1000):
+            if tableau.nom_feuille == "T2":
+                raise RuntimeError("échec simulé")
+            return hierarchiser(tableau, batch_size)
+
+        chemin = self.classeur("nouveau", feuilles=3, lignes=10, colonnes=3)
+        with mock.patch("ansade_app.importation.hierarchiser", side_effect=hierarchiser_sauf_t2):
+            rapports = importer_classeur(chemin, self.theme.id)
+        self.assertEqual([r["statut"] for r in rapports], ["importee", "erreur", "importee"])
+        self.assertEqual(rapports[1]["erreur"], "échec simulé")
+        self.assertEqual(
+            sorted(Tableau.objects.filter(theme=self.theme).values_list("nom_feuille", flat=True)), ["T1", "T3"],
+        )
+        # la feuille annulée n'a laissé ni ligne ni cellule
+        self.assertEqual(LigneIndicateur.objects.filter(tableau__theme=self.theme).count(), 20)
+        self.assertEqual(Donnees.objects.filter(tableau__theme=self.theme).count(), 60)
+
+        # au passage suivant, seule la feuille en erreur est importée
+        rapports = importer_classeur(chemin, self.theme.id)
+        self.assertEqual([r["statut"] for r in rapports], ["inchangee", "importee", "inchangee"])
+
+    def test_cycle_tache(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(email="admin@ansade.mr", password="x", is_superuser=True))
+        tache = self.tache()
+        self.assertEqual(client.get(f"/api/import-taches/{tache.id}/").json()["statut"], TacheImport.EN_ATTENTE)
+
+        tache = reserver_tache()
+        self.assertEqual((tache.statut, tache.tentatives), (TacheImport.EN_COURS, 1))
+        self.assertIsNotNone(tache.debut)
+        self.assertEqual(client.get(f"/api/import-taches/{tache.id}/").json()["statut"], TacheImport.EN_COURS)
+
+        executer_tache(tache)
+        suivi = client.get(f"/api/import-taches/{tache.id}/").json()
+        self.assertEqual(suivi["statut"], TacheImport.TERMINEE)
+        self.assertEqual([f["statut"] for f in suivi["feuilles"]], ["importee"])
+        self.assertEqual((suivi["totaux"]["feuilles"], suivi["totaux"]["importees"]), (1, 1))
+        self.assertIsNotNone(suivi["duree"])
+        self.assertIsNone(reserver_tache())
+
+    def test_tache_fichier_illisible(self):
+        tache = TacheImport.objects.create(
+            fichier=SimpleUploadedFile("casse.xlsx", b"pas un classeur"), nom_fichier="casse.xlsx",
+            theme=self.theme, categorie=self.theme.categorie,
+        )
+        chemin = tache.fichier.path
+        executer_tache(reserver_tache())
+        tache.refresh_from_db()
+        self.assertEqual(tache.statut, TacheImport.ECHOUEE)
+        self.assertIn("Erreur de lecture du fichier", tache.erreur)
+        self.assertFalse(os.path.exists(chemin))
+
+    def test_analyser_bloc_comme_par_cellule(self):
+        entete, textes = generer_bloc(300, 25)
+        for is_pourcentage in (False, True):
+            with self.subTest(is_pourcentage=is_pourcentage):
+                self.assertEqual(
+                    analyser_vectorise(entete, textes, is_pourcentage),
+                    analyser_par_cellule(entete, textes, is_pourcentage),
+                )
+
+    def test_copie_csv(self):
+        # COPY seulement sur PostgreSQL avec psycopg2 : les tests (SQLite) passent par bulk_create
+        self.assertFalse(copie_disponible())
+        self.assertEqual(
+            [_valeur_csv(v) for v in (None, True, 3, 1.5, "", 'a "b", c')],
+            ["\\N", "t", "3", "1.5", '""', '"a ""b"", c"'],
+        )
+
+    def test_import_dossier(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        racine = Path(dossier.name)
+        (racine / "1_Démographie" / "2.Population").mkdir(parents=True)
+        for relatif in ("1_Démographie/2.Population/a.xlsx", "1_Démographie/b.xlsx", "1_Démographie/~$b.xlsx"):
+            (racine / relatif).write_bytes(b"")
+        self.assertEqual(parcourir(racine), [
+            (racine / "1_Démographie" / "2.Population" / "a.xlsx", "Démographie", "Population"),
+            (racine / "1_Démographie" / "b.xlsx", "Démographie", "Démographie"),
+        ])
+
+        # reprise : les classeurs déjà terminés ne sont ni relus ni rattachés à un thème
+        reprise = racine / "reprise.json"
+        ecrire_reprise(reprise, {
+            "1_Démographie/2.Population/a.xlsx": {"statut": "termine"},
+            "1_Démographie/b.xlsx": {"statut": "termine"},
+        })
+        self.assertFalse(reprise.with_name("reprise.json.tmp").exists())
+        sortie = io.StringIO()
+        call_command("import_dossier", str(racine), reprise=str(reprise), stdout=sortie)
+        self.assertIn("0 classeur(s) à importer (2 déjà importé(s)", sortie.getvalue())
+        self.assertFalse(Categorie.objects.filter(nom_cat="Démographie").exists())
+
+    def test_import_dossier_reprise_partielle(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        racine = Path(dossier.name)
+        (racine / "1_Démographie").mkdir()
+        for nom in ("a.xlsx", "b.xlsx"):
+            (racine / "1_Démographie" / nom).write_bytes(b"")
+        # doublons laissés par des envois manuels : ils ne doivent pas bloquer l'import
+        for _ in range(2):
+            Theme.objects.create(nom_theme="Démographie", categorie=Categorie.objects.create(nom_cat="Démographie"))
+
+        def importer(chemin, id_theme, processus):
+            erreur = chemin.endswith("b.xlsx")
+            return [
+                {"feuille": "T1", "statut": "importee"},
+                {"feuille": "T2", "statut": "erreur" if erreur else "importee", "erreur": "connexion perdue"},
+            ]
+
+        reprise = racine / "reprise.json"
+        with mock.patch(f"{import_dossier.__name__}.ProcessPoolExecutor", ExecuteurImmediat), \
+                mock.patch(f"{import_dossier.__name__}.importer_fichier", side_effect=importer) as importer_fichier:
+            call_command("import_dossier", str(racine), reprise=str(reprise), stdout=io.StringIO(), stderr=io.StringIO())
+            etats = json.loads(reprise.read_text(encoding="utf-8"))
+            self.assertEqual(etats["1_Démographie/a.xlsx"]["statut"], "termine")
+            self.assertEqual(etats["1_Démographie/b.xlsx"]["statut"], "partiel")
+            self.assertIn("T2 : connexion perdue", etats["1_Démographie/b.xlsx"]["erreur"])
+            self.assertEqual(Categorie.objects.filter(nom_cat="Démographie").count(), 2)
+
+            # le classeur partiel est repris au passage suivant, le classeur terminé non
+            importer_fichier.reset_mock()
+            call_command("import_dossier", str(racine), reprise=str(reprise), stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual([Path(c.args[0]).name for c in importer_fichier.call_args_list], ["b.xlsx"])
+
+    def test_forme_compacte(self):
+        for format in FORMATS:
+            with self.subTest(format=format):
+                wb = openpyxl.load_workbook(self.classeur(format, feuilles=2, lignes=30, colonnes=6, part_statuts=0.2),
+                                            data_only=True, read_only=True)
+                evenements = [ev for feuille in wb.sheetnames for ev in lire_feuille(wb[feuille], feuille)]
+                wb.close()
+                self.assertEqual(list(deployer(compacter(evenements))), evenements)
+        self.assertEqual(list(deployer(compacter([]))), [])
+
+
+class QueryPlanTests(TestCase):
+    """
+    Plans d'exécution (EXPLAIN) des requêtes chaudes des vues : aucune ne doit
+    parcourir séquentiellement Donnees (ni Tableau / LigneIndicateur quand un index existe).
+    PostgreSQL : les parcours séquentiels sont désactivés pour vérifier qu'un chemin
+    par index existe, quelle que soit la taille de la base de test.
+    """
+
+    # Parcours complet d'une table : "Seq Scan on t" (PostgreSQL), "SCAN t" (SQLite)
+    PARCOURS = {
+        "postgresql": r"Seq Scan on {table}\b",
+        "sqlite": r"\bSCAN {table}\b",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom_cat="Démographie")
+        theme = Theme.objects.create(nom_theme="Population", categorie=categorie)
+        cls.tableaux = []
+        for t in range(5):
+            tableau = Tableau.objects.create(
+                nom_feuille=f"T{t}", titre=f"Tableau {t}", theme=theme,
+                source=f"RGPH {2000 + t}", format=Tableau.NOUVEAU,
+            )
+            lignes = LigneIndicateur.objects.bulk_create([
+                LigneIndicateur(
+                    tableau=tableau, label=f"Indicateur {i}", code=f"C{i}",
+                    parent_code=f"C{i - i % 5}" if i % 5 else "", ordre=i,
+                )
+                for i in range(100)
+            ])
+            colonnes = creer_colonnes(tableau, [str(2000 + j) for j in range(20)], {"2000": "Estimation"})
+            Donnees.objects.bulk_create([
+                Donnees(
+                    tableau=tableau, ligne=ligne, colonne=colonne,
+                    valeur=None if j % 7 == 0 else 1.5, statut="N/D" if j % 7 == 0 else None,
+                )
+                for ligne in lignes for j, colonne in enumerate(colonnes)
+            ])
+            cls.tableaux.append(tableau)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        if connection.vendor not in self.PARCOURS:
+            self.skipTest(f"EXPLAIN non interprété pour {connection.vendor}")
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def requetes_chaudes(self):
+        tableau = self.tableaux[2]
+        return {
+            # TableauFiltreView / TableauFiltreStructureView
+            "filtre_colonnes": Donnees.objects.filter(tableau=tableau, colonne__label__in=["2003", "2010"]),
+            "filtre_structure": (
+                Donnees.objects
+                .filter(tableau=tableau, ligne__label__in=["Indicateur 3", "Indicateur 7"], colonne__label__in=["2003"])
+                .select_related("ligne", "colonne")
+                .order_by("ligne__ordre", "colonne__label")
+            ),
+            # TableauFiltresOptionsView, structure, export
+            "donnees_tableau": Donnees.objects.filter(tableau=tableau).select_related("ligne", "colonne"),
+            "structure": Donnees.objects.filter(tableau_id=tableau.id).order_by("id").values_list(*CHAMPS_CELLULE),
+            "statuts": Donnees.objects.filter(tableau=tableau, statut__isnull=False).values("statut").distinct(),
+            "colonnes": Colonne.objects.filter(tableau=tableau).values_list("label", "note"),
+            # mise à jour d'un tableau : cellules des lignes supprimées
+            "suppression_lignes": Donnees.objects.filter(tableau=tableau, ligne_id__in=[1, 2, 3]),
+            # TableauxParSourceAPIView
+            "tableaux_source": Tableau.objects.filter(source="RGPH 2002").values("id", "titre"),
+            # TableauLignesView et hiérarchie
+            "lignes_code": LigneIndicateur.objects.filter(tableau=tableau, code="C12"),
+            "lignes_parent": LigneIndicateur.objects.filter(tableau=tableau, parent_code="C10"),
+            # IndicateurSeriesAPIView : toutes les cellules d'un indicateur, tous tableaux confondus
+            "series_indicateur": cellules(["C12"], ["Indicateur 7"]),
+        }
+
+    def test_aucun_parcours_sequentiel(self):
+        tables = [m._meta.db_table for m in (Donnees, Tableau, LigneIndicateur, Colonne)]
+        motif = self.PARCOURS[connection.vendor]
+        for nom, requete in self.requetes_chaudes().items():
+            plan = requete.explain()
+            with self.subTest(requete=nom):
+                for table in tables:
+                    self.assertNotRegex(plan, re.compile(motif.format(table=table)), f"{nom} :\n{plan}")
+
+
+class PaginationTests(TestCase):
+    """Listes paginées par curseur, filtrées côté serveur et champs à la demande."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom_cat="Démographie")
+        cls.themes = [Theme.objects.create(nom_theme=f"Thème {i}", categorie=categorie) for i in range(2)]
+        cls.tableau, *_ = [
+            Tableau.objects.create(nom_feuille=f"T{i}", titre=f"Tableau {i}", theme=cls.themes[i % 2])
+            for i in range(6)
+        ]
+        lignes = LigneIndicateur.objects.bulk_create([
+            LigneIndicateur(tableau=cls.tableau, label=f"Indicateur {i}", ordre=i) for i in range(30)
+        ])
+        colonnes = creer_colonnes(cls.tableau, [str(2000 + j) for j in range(10)])
+        Donnees.objects.bulk_create([
+            Donnees(tableau=cls.tableau, ligne=ligne, colonne=colonne, valeur=j)
+            for ligne in lignes for j, colonne in enumerate(colonnes)
+        ])
+
+    def parcourir(self, url, params):
+        """Suit les curseurs `next` et renvoie tous les résultats."""
+        resultats, pages = [], 0
+        reponse = self.client.get(url, params)
+        while True:
+            self.assertEqual(reponse.status_code, 200)
+            corps = reponse.json()
+            resultats += corps["results"]
+            pages += 1
+            if not corps["next"]:
+                return resultats, pages
+            reponse = self.client.get(corps["next"])
+
+    def test_tableaux_par_theme(self):
+        tableaux, pages = self.parcourir("/api/tableaux/", {"theme": self.themes[1].id, "page_size": 2})
+        self.assertEqual(pages, 2)
+        self.assertEqual([t["titre"] for t in tableaux], ["Tableau 1", "Tableau 3", "Tableau 5"])
+        self.assertEqual(self.client.get("/api/tableaux/", {"theme": "x"}).status_code, 400)
+
+    def test_donnees_sans_requete_par_ligne(self):
+        with self.assertNumQueries(1):
+            reponse = self.client.get("/api/donnees/", {"tableau": self.tableau.id, "page_size": 200})
+        corps = reponse.json()
+        self.assertEqual(len(corps["results"]), 200)
+        self.assertEqual(corps["results"][0]["ligne"]["label"], "Indicateur 0")
+
+        donnees, _ = self.parcourir("/api/donnees/", {"tableau": self.tableau.id, "page_size": 200})
+        self.assertEqual(len(donnees), 300)
+        self.assertEqual(len({d["id"] for d in donnees}), 300)
+
+    def test_filtre_colonne_et_champs(self):
+        reponse = self.client.get(
+            "/api/donnees/", {"tableau": self.tableau.id, "colonne": ["2003", "2005"], "fields": "id,valeur"},
+        )
+        resultats = reponse.json()["results"]
+        self.assertEqual(len(resultats), 60)
+        self.assertEqual(set(resultats[0]), {"id", "valeur"})
+        self.assertEqual({d["valeur"] for d in resultats}, {3.0, 5.0})
+
+        reponse = self.client.get("/api/tableaux/", {"fields": "id,inconnu"})
+        self.assertEqual(reponse.status_code, 400)
+
+
+class ExportDonneesFluxTests(TestCase):
+    """Export brut des cellules envoyé en flux (NDJSON / CSV)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categorie = Categorie.objects.create(nom_cat="Démographie")
+        theme = Theme.objects.create(nom_theme="Population", categorie=cls.categorie)
+        autre = Theme.objects.create(nom_theme="Autre", categorie=Categorie.objects.create(nom_cat="Autre"))
+        cls.tableaux = []
+        for i, t in enumerate([theme, theme, autre]):
+            tableau = Tableau.objects.create(nom_feuille=f"T{i}", titre=f"Tableau {i}", theme=t)
+            ligne = LigneIndicateur.objects.create(tableau=tableau, label="Taux « brut »", code="C1")
+            Donnees.objects.bulk_create([
+                Donnees(tableau=tableau, ligne=ligne, colonne=colonne,
+                        valeur=None if j == 0 else j / 2, statut="N/D" if j == 0 else None, unite="%")
+                for j, colonne in enumerate(creer_colonnes(tableau, [str(2000 + j) for j in range(5)]))
+            ])
+            cls.tableaux.append(tableau)
+
+    def lire(self, params):
+        reponse = self.client.get("/api/export/donnees/", params)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.streaming)
+        return reponse, b"".join(reponse.streaming_content).decode("utf-8")
+
+    def test_ndjson_par_categorie(self):
+        reponse, contenu = self.lire({"categorie": self.categorie.id})
+        self.assertEqual(reponse["Content-Type"], "application/x-ndjson")
+        cellules = [json.loads(l) for l in contenu.splitlines()]
+        self.assertEqual(len(cellules), 10)
+        self.assertEqual({c["tableau"] for c in cellules}, {self.tableaux[0].id, self.tableaux[1].id})
+        self.assertEqual(cellules[0]["indicateur"], "Taux « brut »")
+        self.assertEqual((cellules[0]["valeur"], cellules[0]["statut"]), (None, "N/D"))
+
+    def test_csv_par_tableaux(self):
+        _, contenu = self.lire({"tableau": f"{self.tableaux[0].id},{self.tableaux[2].id}", "format": "csv"})
+        lignes = list(csv.DictReader(io.StringIO(contenu)))
+        self.assertEqual(len(lignes), 10)
+        self.assertEqual(lignes[1]["valeur"], "0.5")
+
+    def test_parametres_invalides(self):
+        url = "/api/export/donnees/"
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {"tableau": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"theme": 1, "format": "xml"}).status_code, 400)
+
+
+class MatriceTableauTests(TestCase):
+    """Valeurs d'un tableau stockées en matrice NumPy et relues par filtrer-structure."""
+
+    @classmethod
+    def setUpTestData(cls):
+        theme = Theme.objects.create(nom_theme="Population", categorie=Categorie.objects.create(nom_cat="Démographie"))
+        cls.tableau = Tableau.objects.create(nom_feuille="T1", titre="Tableau 1", theme=theme)
+        colonnes = creer_colonnes(cls.tableau, ["Sexe~Masculin", "Sexe~Feminin", "Total"])
+        lignes = [
+            LigneIndicateur.objects.create(tableau=cls.tableau, label=label, code=f"C{i}", ordre=ordre)
+            for i, (label, ordre) in enumerate([("Urbain", 2), ("Rural", 1), ("Mauritanie", None)])
+        ]
+        Donnees.objects.bulk_create([
+            Donnees(tableau=cls.tableau, ligne=ligne, colonne=colonne,
+                    valeur=None if (i, j) == (0, 2) else i * 10 + j + 0.5,
+                    statut="N/D" if (i, j) == (0, 2) else None, unite="%" if j == 0 else "")
+            for i, ligne in enumerate(lignes)
+            for j, colonne in enumerate(colonnes)
+            if (i, j) != (1, 1)
+        ])
+
+    def setUp(self):
+        # index gardés en mémoire et versions en cache survivent au rollback entre deux tests
+        cache.clear()
+        oublier_index()
+
+    def filtrer(self, corps, vue="filtrer-structure"):
+        reponse = self.client.post(f"/api/tableaux/{self.tableau.id}/{vue}/", corps, content_type="application/json")
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+    def test_aller_retour(self):
+        generer_matrice(self.tableau.id)
+        matrice = Matrice.depuis_modele(MatriceTableau.objects.get(tableau=self.tableau))
+        self.assertEqual(matrice.forme, (3, 3))
+        self.assertEqual(matrice.colonnes.tolist(), list(
+            Colonne.objects.filter(tableau=self.tableau).order_by("ordre").values_list("id", flat=True)))
+        self.assertEqual(int(matrice.presentes().sum()), 8)
+        self.assertTrue(np.isnan(matrice.valeurs[0, 2]))
+        self.assertEqual(matrice.statuts[matrice.etats[0, 2] - 1], "N/D")
+        self.assertEqual(matrice.unites[matrice.codes_unites[1, 0]], "%")
+
+        generer_matrice(self.tableau.id)
+        self.assertEqual(MatriceTableau.objects.get(tableau=self.tableau).version, 2)
+
+    def test_filtre_depuis_matrice(self):
+        corps = {"lignes": ["Urbain", "Mauritanie"], "colonnes": ["Sexe~Masculin", "Total"]}
+        self.filtrer(corps)  # la première lecture construit et enregistre la matrice
+        self.assertTrue(MatriceTableau.objects.filter(tableau=self.tableau).exists())
+        with self.assertNumQueries(2):
+            # existence du tableau et version de la matrice : la matrice indexée est déjà en mémoire
+            resultat = self.filtrer(corps)
+        self.assertEqual([d["indicateur"] for d in resultat["data"]], ["Urbain", "Mauritanie"])
+        self.assertEqual(resultat["data"][0]["valeurs"], {"Sexe": {"Masculin": "0.5%"}, "Total": {"": ""}})
+
+        with override_settings(ANSADE_STOCKAGE_MATRICE=False):
+            self.assertIsNone(charger_matrice(self.tableau.id))
+            sans_matrice = self.filtrer(corps)
+        self.assertEqual(sans_matrice["colonnes_groupées"], resultat["colonnes_groupées"])
+        self.assertEqual(
+            sorted(sans_matrice["data"], key=json.dumps), sorted(resultat["data"], key=json.dumps))
+
+    def test_matrice_perimee_reconstruite(self):
+        generer_matrice(self.tableau.id)
+        LigneIndicateur.objects.filter(tableau=self.tableau, label="Rural").delete()
+        resultat = self.filtrer({"lignes": [], "colonnes": []})
+        self.assertEqual([d["indicateur"] for d in resultat["data"]], ["Urbain", "Mauritanie"])
+
+    def test_filtre_par_ids(self):
+        lignes = dict(LigneIndicateur.objects.filter(tableau=self.tableau).values_list("label", "id"))
+        colonnes = dict(Colonne.objects.filter(tableau=self.tableau).values_list("label", "id"))
+        corps = {"ligne_ids": [lignes["Rural"], lignes["Urbain"]], "colonne_ids": [colonnes["Sexe~Feminin"], colonnes["Total"]]}
+
+        resultat = self.filtrer(corps)
+        self.assertEqual(resultat["colonnes_groupées"], {"Sexe": ["Feminin"], "Total": [""]})
+        self.assertEqual([d["indicateur"] for d in resultat["data"]], ["Rural", "Urbain"])
+        self.assertEqual(resultat["data"][0]["valeurs"], {"Total": {"": "12.5"}})
+
+        # vue brute : les id de lignes sont de vraies clés étrangères (plus de Q(ligne=<libellé>))
+        cellules = self.filtrer(corps, vue="filtrer")
+        self.assertEqual(len(cellules), 3)
+        self.assertEqual({c["ligne"]["label"] for c in cellules}, {"Rural", "Urbain"})
+        self.assertEqual(len(self.filtrer({"lignes": ["Urbain"]}, vue="filtrer")), 3)
+
+        reponse = self.client.post(f"/api/tableaux/{self.tableau.id}/filtrer-structure/",
+                                   {"ligne_ids": ["x"]}, content_type="application/json")
+        self.assertEqual(reponse.status_code, 400)
+
+    def test_index_invalide_apres_regeneration(self):
+        avant = charger_index(self.tableau.id)
+        self.assertIs(charger_index(self.tableau.id), avant)
+        Donnees.objects.filter(tableau=self.tableau, valeur=0.5).update(valeur=7)
+        generer_matrice(self.tableau.id)
+        apres = charger_index(self.tableau.id)
+        self.assertGreater(apres.version, avant.version)
+        self.assertIn(7.0, apres.matrice.valeurs.tolist()[0])
+
+    def test_regeneration_par_un_autre_processus(self):
+        # import_worker, commande ou autre worker web : ni ce cache ni cette mémoire ne sont prévenus
+        avant = charger_index(self.tableau.id)
+        Donnees.objects.filter(tableau=self.tableau, valeur=0.5).update(valeur=7)
+        generer_matrice(self.tableau.id)
+        cache.clear()
+        with matrice._verrou:
+            matrice._index[self.tableau.id] = avant
+        apres = charger_index(self.tableau.id)
+        self.assertIsNot(apres, avant)
+        self.assertIn(7.0, apres.matrice.valeurs.tolist()[0])
+        # les analyses en cache sont indexées par version : pas de résultat périmé non plus
+        self.assertEqual(analyser(self.tableau.id, "T")["version"], apres.version)
+
+
+class AnalyseTests(TestCase):
+    """Séries temporelles et mesures de TableauAnalyseAPIView, calculées depuis la matrice."""
+
+    @classmethod
+    def setUpTestData(cls):
+        theme = Theme.objects.create(nom_theme="Électricité", categorie=Categorie.objects.create(nom_cat="Énergie"))
+        cls.tableau = Tableau.objects.create(nom_feuille="T1", titre="Production", theme=theme)
+        colonnes = creer_colonnes(cls.tableau, ["2019", "2020", "2021", "2023"])
+        total = LigneIndicateur.objects.create(tableau=cls.tableau, label="Total", code="T", ordre=1)
+        nord = LigneIndicateur.objects.create(tableau=cls.tableau, label="Nord", code="N", ordre=2, parent=total)
+        valeurs = {total: [100, 110, None, 400], nord: [50, 55, 60, 100]}
+        Donnees.objects.bulk_create([
+            Donnees(tableau=cls.tableau, ligne=ligne, colonne=colonne, valeur=v, unite="")
+            for ligne, serie in valeurs.items()
+            for colonne, v in zip(colonnes, serie)
+        ])
+        generer_matrice(cls.tableau.id)
+
+    def setUp(self):
+        cache.clear()
+        oublier_index()
+
+    def test_periodes(self):
+        self.assertEqual(instant("2019-2020"), 2019.0)
+        self.assertEqual(instant("19-20"), 2019.0)
+        self.assertEqual(instant("1T2021"), 2021.0)
+        self.assertEqual(instant("3 T 2021"), 2021.5)
+        self.assertEqual(instant("Déc21"), 2021 + 11 / 12)
+        self.assertIsNone(instant("Wilaya"))
+
+    def test_mesures(self):
+        reponse = self.client.get(f"/api/tableaux/{self.tableau.id}/analyse/?fenetre=2")
+        self.assertEqual(reponse.status_code, 200)
+        analyse = reponse.json()
+        self.assertEqual(analyse["type"], "annees")
+        self.assertEqual(analyse["periodes"], ["2019", "2020", "2021", "2023"])
+        total, nord = analyse["series"]
+        self.assertEqual(total["valeurs"], [100, 110, None, 400])
+        self.assertEqual(total["croissance"], [None, 0.1, None, None])
+        self.assertEqual(total["moyenne_mobile"], [100, 105, 110, 400])
+        self.assertIsNone(total["part_parent"])
+        self.assertEqual(nord["part_parent"], [0.5, 0.5, None, 0.25])
+        self.assertEqual(nord["stats"]["min"], 50)
+        self.assertEqual(nord["stats"]["max"], 100)
+        self.assertAlmostEqual(nord["stats"]["tcam"], 2 ** 0.25 - 1, places=6)  # x2 en 4 ans
+        self.assertEqual(analyse["moyennes"][2], {"annee": "2021", "moyenne": 60})
+
+        # deuxième appel : titre et version de la matrice en base, l'analyse vient du cache
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(f"/api/tableaux/{self.tableau.id}/analyse/?fenetre=2").json(), analyse)
+
+    def test_erreurs(self):
+        self.assertEqual(self.client.get("/api/tableaux/999999/analyse/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/tableaux/{self.tableau.id}/analyse/?fenetre=0").status_code, 400)
+
+
+class CarteTests(TestCase):
+    """Carte par wilaya : toutes les périodes et leurs classes en une réponse."""
+
+    @classmethod
+    def setUpTestData(cls):
+        theme = Theme.objects.create(nom_theme="Population", categorie=Categorie.objects.create(nom_cat="Démographie"))
+        cls.tableau = Tableau.objects.create(nom_feuille="T1", titre="Population", theme=theme, etiquette_ligne="Wilaya")
+        colonnes = creer_colonnes(cls.tableau, ["2013", "2023"])
+        valeurs = {"Adrar": [10, 20], "Hodh Charghi": [20, 40], "Assaba": [30, None], "D. Nouadhibou": [40, 80],
+                   "Mauritanie": [100, 140]}
+        for ordre, (label, serie) in enumerate(valeurs.items()):
+            ligne = LigneIndicateur.objects.create(tableau=cls.tableau, label=label, code=label, ordre=ordre)
+            Donnees.objects.bulk_create([
+                Donnees(tableau=cls.tableau, ligne=ligne, colonne=colonne, valeur=v, unite="")
+                for colonne, v in zip(colonnes, serie)
+            ])
+        generer_matrice(cls.tableau.id)
+
+    def setUp(self):
+        cache.clear()
+        oublier_index()
+
+    def test_wilayas(self):
+        self.assertEqual(code_wilaya("Hodh ech Chargui"), "MR01")
+        self.assertEqual(code_wilaya("Wilaya~Dakhlet Nouadhibou"), "MR08")
+        self.assertEqual(code_wilaya("Nouakchott-Ouest"), "MR13")
+        self.assertIsNone(code_wilaya("Aéroport de Nouadhibou"))
+        self.assertIsNone(code_wilaya("Nouakchott"))
+
+    def test_toutes_periodes(self):
+        reponse = self.client.get(f"/api/tableaux/{self.tableau.id}/carte/?classes=2")
+        self.assertEqual(reponse.status_code, 200)
+        carte = reponse.json()
+        self.assertEqual(carte["periodes"], ["2013", "2023"])
+        self.assertEqual([w["code"] for w in carte["wilayas"]], ["MR07", "MR01", "MR03", "MR08", None])
+        self.assertEqual(carte["valeurs"], [[10, 20, 30, 40, 100], [20, 40, None, 80, 140]])
+        # classes calculées sur les wilayas seules, sans l'agrégat national
+        self.assertEqual(carte["classes"]["quantiles"], [[25], [40]])
+        self.assertEqual(carte["classes"]["intervalles"], [[25], [50]])
+        self.assertEqual(carte["classes"]["max"], [40, 80])
+
+        with self.assertNumQueries(2):  # tableau et version de la matrice
+            self.assertEqual(self.client.get(f"/api/tableaux/{self.tableau.id}/carte/?classes=2").json(), carte)
+
+    def test_refus(self):
+        Tableau.objects.filter(id=self.tableau.id).update(etiquette_ligne=None)
+        self.assertEqual(self.client.get(f"/api/tableaux/{self.tableau.id}/carte/").status_code, 200)
+        self.assertEqual(self.client.get(f"/api/tableaux/{self.tableau.id}/carte/?classes=1").status_code, 400)
+        self.assertEqual(self.client.get("/api/tableaux/999999/carte/").status_code, 404)
+
+
+class SeriesTests(TestCase):
+    """Série d'un indicateur à travers plusieurs tableaux et éditions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        theme = Theme.objects.create(nom_theme="Population", categorie=Categorie.objects.create(nom_cat="Démographie"))
+        editions = [
+            ("Édition 2021", ["2019", "2020", "2021"], [10, 11, None]),
+            ("Édition 2023", ["2021~Total", "2021~Urbain", "2022~Total", "2023~Total"], [13, 7, 14, 15]),
+            ("Ancienne série", ["2015", "2020"], [5, 99]),
+        ]
+        cls.tableaux = []
+        for titre, labels, valeurs in editions:
+            tableau = Tableau.objects.create(nom_feuille=titre, titre=titre, theme=theme)
+            ligne = LigneIndicateur.objects.create(tableau=tableau, label="Population totale", code="POP", ordre=1)
+            Donnees.objects.bulk_create([
+                Donnees(tableau=tableau, ligne=ligne, colonne=colonne, valeur=v, statut="N/D" if v is None else None)
+                for colonne, v in zip(creer_colonnes(tableau, labels), valeurs)
+            ])
+            cls.tableaux.append(tableau)
+
+    def setUp(self):
+        cache.clear()
+
+    def serie(self, parametres):
+        reponse = self.client.get(f"/api/indicateurs/series/?{parametres}")
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()["indicateurs"]
+
+    def test_fusion(self):
+        with self.assertNumQueries(2):  # génération du journal, puis toutes les cellules en une requête
+            (pop,) = self.serie("code=POP")
+        edition_2021, recente, ancienne = (t.id for t in self.tableaux)
+        self.assertEqual(
+            [(p["periode"], p["valeur"]) for p in pop["serie"]],
+            # 2020 : l'édition 2021 finit après l'ancienne série ; 2021 : valeur plutôt que N/D
+            [("2015", 5), ("2019", 10), ("2020", 11), ("2021", 13), ("2022", 14), ("2023", 15)],
+        )
+        self.assertEqual(pop["serie"][3]["tableau_id"], recente)
+        self.assertEqual([s["tableau_id"] for s in pop["sources"]], [recente, edition_2021, ancienne])
+
+    def test_lignes_en_double(self):
+        # deux lignes "POP" dans le même tableau : la première de la feuille, quel que soit l'ordre de lecture
+        tableau = self.tableaux[2]
+        doublon = LigneIndicateur.objects.create(tableau=tableau, label="Population totale", code="POP", ordre=2)
+        Donnees.objects.create(tableau=tableau, ligne=doublon, colonne=tableau.colonnes.get(label="2015"), valeur=6)
+        (pop,) = self.serie("code=POP")
+        self.assertEqual((pop["serie"][0]["periode"], pop["serie"][0]["valeur"]), ("2015", 5))
+
+    def test_bornes_groupe_et_label(self):
+        code, label = self.serie("code=POP&label=population TOTALE&debut=2020&fin=2021&groupe=Urbain")
+        self.assertEqual([(p["periode"], p["valeur"]) for p in code["serie"]], [("2021", 7)])
+        self.assertEqual(label["serie"], code["serie"])
+        self.assertEqual(label["par"], "label")
+
+    def test_parametres(self):
+        self.assertEqual(self.client.get("/api/indicateurs/series/").status_code, 400)
+        self.assertEqual(self.client.get("/api/indicateurs/series/?code=POP&debut=2023&fin=2020").status_code, 400)
+
+
+class EditionApiTests(TestCase):
+    """Modifications par l'API (chef de catégorie) des cellules et des tableaux."""
+
+    @classmethod
+    def setUpTestData(cls):
+        theme = Theme.objects.create(nom_theme="Population", categorie=Categorie.objects.create(nom_cat="Démographie"))
+        cls.tableau = Tableau.objects.create(nom_feuille="T1", titre="Tableau 1", theme=theme)
+        (cls.colonne,) = creer_colonnes(cls.tableau, ["2023"])
+        ligne = LigneIndicateur.objects.create(tableau=cls.tableau, label="Total", ordre=1)
+        cls.donnee = Donnees.objects.create(tableau=cls.tableau, ligne=ligne, colonne=cls.colonne, valeur=1, unite="")
+        cls.chef = User.objects.create_user(email="chef@ansade.mr", password="x", is_chef=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.chef)
+
+    def test_colonne_modifiable(self):
+        reponse = self.client.patch(f"/api/donnees/{self.donnee.id}/", {"colonne": "2024 ~ Total"}, format="json")
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()["colonne"], "2024 ~ Total")
+        colonne = Donnees.objects.get(pk=self.donnee.id).colonne
+        self.assertEqual((colonne.tableau_id, colonne.principal, colonne.sous), (self.tableau.id, "2024", "Total"))
+        self.assertGreater(colonne.ordre, self.colonne.ordre)
+
+        # libellé existant : la colonne est réutilisée
+        self.client.patch(f"/api/donnees/{self.donnee.id}/", {"colonne": "2023"}, format="json")
+        self.assertEqual(Donnees.objects.get(pk=self.donnee.id).colonne_id, self.colonne.id)
+
+    def test_champs_internes_du_tableau(self):
+        empreinte, format_ = self.tableau.empreinte, self.tableau.format
+        reponse = self.client.patch(
+            f"/api/tableaux/{self.tableau.id}/",
+            {"titre": "Nouveau titre", "empreinte": "x" * 64, "format": "autre"}, format="json",
+        )
+        self.assertEqual(reponse.status_code, 200)
+        tableau = Tableau.objects.get(pk=self.tableau.id)
+        self.assertEqual(tableau.titre, "Nouveau titre")
+        self.assertEqual((tableau.empreinte, tableau.format), (empreinte, format_))
+
+
+class RechercheTests(TestCase):
+    """Index plein texte (FTS5 en local) : sans accents, par préfixe, classé et paginé."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom_cat="Énergie")
+        indexer_categorie(categorie)
+        theme = Theme.objects.create(nom_theme="Électricité", categorie=categorie)
+        cls.tableau = Tableau.objects.create(nom_feuille="T1", titre="Production d'électricité par wilaya",
+                                             source="SOMELEC", theme=theme)
+        autre = Tableau.objects.create(nom_feuille="T2", titre="Population", theme=theme)
+        for tableau, labels in ((cls.tableau, ["Nouakchott", "Électricité thermique"]), (autre, ["Nouakchott"])):
+            LigneIndicateur.objects.bulk_create([LigneIndicateur(tableau=tableau, label=l) for l in labels])
+            creer_colonnes(tableau, ["2020", "Production~Électricité"])
+            indexer_tableau(tableau.id)
+
+    def chercher(self, q, **params):
+        reponse = self.client.get("/api/recherche-globale/", {"q": q, **params})
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+    def test_sans_accents_par_prefixe_et_classe(self):
+        resultat = self.chercher("electr")
+        types = [r["type"] for r in resultat["results"]]
+        self.assertEqual(resultat["count"], 4)  # tableau, indicateur, colonne ; "Énergie" ne correspond pas
+        self.assertEqual(types[0], "Tableau")
+        self.assertEqual(set(types), {"Tableau", "Indicateur", "Colonne"})
+        indicateur = next(r for r in resultat["results"] if r["type"] == "Indicateur")
+        self.assertEqual(indicateur["tableau"], {"id": self.tableau.id, "titre": self.tableau.titre})
+        self.assertEqual(self.chercher("somelec")["results"][0]["source"], "SOMELEC")
+        self.assertEqual(self.chercher("ÉNERGIE")["results"][0]["type"], "Categorie")
+
+    def test_pagination_et_requete_vide(self):
+        page = self.chercher("nouakchott", page_size=1)
+        self.assertEqual(page["count"], 2)
+        self.assertEqual(len(page["results"]), 1)
+        self.assertIsNotNone(page["next"])
+        self.assertEqual(self.chercher("  ")["count"], 0)
+        self.assertEqual(self.chercher('"*)')["results"], [])
+
+    def test_index_suit_le_tableau(self):
+        Tableau.objects.filter(pk=self.tableau.id).update(titre="Production de gaz")
+        indexer_tableau(self.tableau.id)
+        self.assertEqual(self.chercher("gaz")["count"], 1)
+        tableau_id = self.tableau.id
+        self.tableau.delete()
+        self.assertEqual(self.chercher("nouakchott")["count"], 1)
+        self.assertFalse(DocumentRecherche.objects.filter(tableau_id=tableau_id).exists())
+
+
+class SuggestionsTests(TestCase):
+    """Index de préfixes en mémoire, tenu à jour par le journal de la recherche."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom_cat="Démographie")
+        theme = Theme.objects.create(nom_theme="Population", categorie=categorie)
+        cls.tableaux = [
+            Tableau.objects.create(nom_feuille=f"T{i}", titre=titre, source="ANSADE, RGPH 2023", theme=theme)
+            for i, titre in enumerate(["Production d'électricité", "Population par wilaya"])
+        ]
+        for tableau in cls.tableaux:
+            LigneIndicateur.objects.create(tableau=tableau, label="Nouakchott-Nord")
+        indexer_categorie(categorie)
+        for tableau in cls.tableaux:
+            indexer_tableau(tableau.id)
+
+    def setUp(self):
+        cache.clear()
+        suggestions.oublier()
+
+    def suggerer(self, q):
+        reponse = self.client.get("/api/suggestions/", {"q": q})
+        self.assertEqual(reponse.status_code, 200)
+        return [(s["type"], s["texte"], s["nombre"]) for s in reponse.json()]
+
+    def test_debut_de_mot_sans_accents(self):
+        self.assertEqual(self.suggerer("electr"), [("Tableau", "Production d'électricité", 1)])
+        self.assertEqual(self.suggerer("nord"), [("Indicateur", "Nouakchott-Nord", 2)])
+        self.assertEqual(self.suggerer("rgph"), [("Source", "ANSADE, RGPH 2023", 2)])
+        self.assertEqual([t for t, _, _ in self.suggerer("d")], ["Categorie"])
+        with self.assertNumQueries(1):  # génération du journal seulement
+            suggestions.suggerer("pop")
+
+    def test_mise_a_jour_incrementale(self):
+        suggestions.suggerer("pop")
+        # réindexation par un autre processus (import_worker...) : ni ce cache ni cette mémoire ne sont prévenus
+        Tableau.objects.filter(pk=self.tableaux[0].id).update(titre="Production de gaz")
+        indexer_tableau(self.tableaux[0].id)
+        cache.clear()
+        with self.assertNumQueries(3):  # génération, journal, puis seul le tableau modifié
+            self.assertEqual(self.suggerer("gaz"), [("Tableau", "Production de gaz", 1)])
+        self.assertEqual(self.suggerer("electr"), [])
+
+        tableau_id = self.tableaux[1].id
+        self.tableaux[1].delete()
+        journaliser(("tableau", tableau_id))
+        self.assertEqual(self.suggerer("nouakchott"), [("Indicateur", "Nouakchott-Nord", 1)])
+
+    def test_journal_depasse(self):
+        suggestions.suggerer("pop")
+        index = suggestions.index_a_jour()
+        index.generation -= JOURNAL_MAX + 1  # trop en retard : reconstruit entièrement
+        self.assertIsNot(suggestions.index_a_jour(), index)
+
+    def test_budget_memoire(self):
+        index = suggestions.IndexPrefixes(max_entrees=3)
+        index.ajouter(("tableau", 1), [
+            ("Tableau", "Taux brut de scolarisation", 1),
+            ("Indicateur", "Garçons scolarisés", 2),
+        ])
+        self.assertEqual(len(index.entrees), 4)  # le titre est toujours indexé
+        self.assertEqual(index.ignorees, 1)
+        index.retirer(("tableau", 1))
+        self.assertEqual((index.entrees, index.suggestions), ([], {}))
+
+    def test_chargement_trie_une_fois(self):
+        par_proprietaire = suggestions.elements(suggestions._documents())
+        charge = suggestions.IndexPrefixes(max_entrees=1000)
+        charge.charger(par_proprietaire)
+        incremental = suggestions.IndexPrefixes(max_entrees=1000)
+        for proprietaire, liste in par_proprietaire.items():
+            incremental.ajouter(proprietaire, liste)
+        self.assertEqual(charge.entrees, incremental.entrees)
+        self.assertEqual(charge.taille, len(charge.entrees))
@@ -2,11 +2,12 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     CategorieViewSet, ThemeViewSet, TableauViewSet, DonneesViewSet,
-    ImportExcelView, TableauDetailStructureView, TableauFiltreView,
+    ImportExcelView, TableauDetailStructureView, StructuresParLotView, TableauFiltreView,
     TableauFiltresOptionsView, TableauFiltreStructureView, TableauAnalyseAPIView,
     CarteParTableauAPIView, ListeSourcesAPIView, TableauxParSourceAPIView,
-    RechercheGlobaleAPIView, UserInfoAPIView, CustomLoginView,
-    ExportTableauAPIView
+    RechercheGlobaleAPIView, SuggestionsAPIView, IndicateurSeriesAPIView,
+    UserInfoAPIView, CustomLoginView,
+    ExportTableauAPIView, ExportDonneesFluxView, TacheImportListView, TacheImportDetailView, TableauLignesView
 )
 
 router = DefaultRouter()
@@ -18,13 +19,18 @@ router.register(r'donnees', DonneesViewSet)
 urlpatterns = [
     # ✅ On met cette route AVANT include(router.urls)
     path('export/tableaux/<int:tableau_id>/', ExportTableauAPIView.as_view(), name='export_tableau'),
+    path('export/donnees/', ExportDonneesFluxView.as_view(), name='export_donnees'),
 
     # ✅ Ensuite le router
     path('', include(router.urls)),
 
     # ✅ Puis les autres API
     path('import-excel/', ImportExcelView.as_view(), name='import-excel'),
+    path('import-taches/', TacheImportListView.as_view(), name='import-taches'),
+    path('import-taches/<int:pk>/', TacheImportDetailView.as_view(), name='import-tache-detail'),
     path('tableaux/<int:tableau_id>/structure/', TableauDetailStructureView.as_view(), name='tableau-structure'),
+    path('structures/', StructuresParLotView.as_view(), name='structures-par-lot'),
+    path('tableaux/<int:tableau_id>/lignes/', TableauLignesView.as_view(), name='tableau-lignes'),
     path('tableaux/<int:tableau_id>/filtres-options/', TableauFiltresOptionsView.as_view()),
     path('tableaux/<int:tableau_id>/filtrer/', TableauFiltreView.as_view(), name='tableau-filtrer'),
     path('tableaux/<int:tableau_id>/filtrer-structure/', TableauFiltreStructureView.as_view(), name='filtrer-structure'),
@@ -33,6 +39,8 @@ urlpatterns = [
     path('sources/', ListeSourcesAPIView.as_view(), name='liste-sources'),
     path('sources/<path:source>/tableaux/', TableauxParSourceAPIView.as_view(), name='tableaux-par-source'),
     path("recherche-globale/", RechercheGlobaleAPIView.as_view(), name="recherche-globale"),
+    path("suggestions/", SuggestionsAPIView.as_view(), name="suggestions"),
+    path("indicateurs/series/", IndicateurSeriesAPIView.as_view(), name="indicateur-series"),
     path("user-info/", UserInfoAPIView.as_view(), name="user-info"),
     path('login/', CustomLoginView.as_view(), name='custom_login'),
 ]
@@ -1,6 +1,6 @@
 from rest_framework import viewsets
-from .models import Categorie, Theme, Tableau, Donnees,LigneIndicateur
-from .serializers import CategorieSerializer, ThemeSerializer, TableauSerializer, DonneesSerializer,LigneIndicateurSerializer
+from .models import Categorie, Theme, Tableau, Donnees,LigneIndicateur, TacheImport
+from .serializers import CategorieSerializer, ThemeSerializer, TableauSerializer, DonneesSerializer,LigneIndicateurSerializer, TacheImportSerializer
 import openpyxl
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -8,13 +8,17 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework import status, generics
 import re
 from collections import defaultdict,OrderedDict
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 import pandas as pd
 import math
 from django.db.models import Q
-from django.db.models import F
+from django.db.models import F, Subquery
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated,IsAdminUser,AllowAny
 from .permissions import IsChef
+from .pagination import DonneesPagination, RecherchePagination, TableauPagination
+from .serializers import champs_demandes
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
 from rest_framework.authtoken.views import ObtainAuthToken
@@ -25,6 +29,14 @@ from django.contrib.auth import authenticate
 from urllib.parse import unquote
 from datetime import datetime
 from openpyxl.utils.datetime import from_excel
+from django.http import HttpResponse
+from .structure import options_json, regenerer_apres_commit, structure_json, structures_json
+from .matrice import charger_index
+from .recherche import indexer_categorie, indexer_theme, journaliser, rechercher, resultats_json
+from .suggestions import suggerer
+from .analyse import analyser
+from .carte import NB_CLASSES, carte, est_carte
+from .series import MAX_INDICATEURS, series
 
 
 
@@ -76,6 +88,16 @@ class CategorieViewSet(viewsets.ModelViewSet):
             return [IsAdminUser()]
         return []
 
+    def perform_create(self, serializer):
+        indexer_categorie(serializer.save())  # ✅ index de recherche
+
+    def perform_update(self, serializer):
+        indexer_categorie(serializer.save())
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        journaliser(("tout", None))  # thèmes et tableaux supprimés en cascade
+
 class ThemeViewSet(viewsets.ModelViewSet):
     queryset = Theme.objects.all()
     serializer_class = ThemeSerializer
@@ -84,22 +106,94 @@ class ThemeViewSet(viewsets.ModelViewSet):
             return [IsAdminUser()]
         return []
 
+    def perform_create(self, serializer):
+        indexer_theme(serializer.save())  # ✅ index de recherche
+
+    def perform_update(self, serializer):
+        indexer_theme(serializer.save())
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        journaliser(("tout", None))  # tableaux supprimés en cascade
+
+def parametre_entier(request, nom):
+    """Paramètre de filtre entier (None s'il est absent)."""
+    valeur = request.query_params.get(nom)
+    if valeur in (None, ''):
+        return None
+    try:
+        return int(valeur)
+    except ValueError:
+        raise ValidationError({nom: "Doit être un entier"})
+
+
 class TableauViewSet(viewsets.ModelViewSet):
     queryset = Tableau.objects.all()
     serializer_class = TableauSerializer
+    pagination_class = TableauPagination
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsChef()]
         return []
 
+    def get_queryset(self):
+        tableaux = super().get_queryset()
+        if self.action == 'list':
+            theme = parametre_entier(self.request, 'theme')
+            if theme is not None:
+                tableaux = tableaux.filter(theme_id=theme)
+        return tableaux
+
+    def perform_update(self, serializer):
+        tableau = serializer.save()
+        regenerer_apres_commit(tableau.id)  # ✅ titre / source / étiquette dans la structure
+
+    def perform_destroy(self, instance):
+        tableau_id = instance.id
+        instance.delete()
+        journaliser(("tableau", tableau_id))  # ✅ suggestions du tableau retirées
+
 class DonneesViewSet(viewsets.ModelViewSet):
     queryset = Donnees.objects.all()
     serializer_class = DonneesSerializer
+    pagination_class = DonneesPagination
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsChef()]
         return []
 
+    def get_queryset(self):
+        donnees = super().get_queryset()
+        champs = champs_demandes(self.request)
+        # ✅ pas de requête par cellule : seules les relations sérialisées sont jointes
+        relations = {'ligne': {'ligne'}, 'colonne': {'colonne', 'note_colonne'}, 'tableau': {'source'}}
+        jointes = [r for r, noms in relations.items() if champs is None or champs & noms]
+        if jointes:
+            donnees = donnees.select_related(*jointes)
+        if self.action == 'list':
+            tableau = parametre_entier(self.request, 'tableau')
+            if tableau is not None:
+                donnees = donnees.filter(tableau_id=tableau)
+            colonnes = [c for c in self.request.query_params.getlist('colonne') if c]
+            if colonnes:
+                donnees = donnees.filter(colonne__label__in=colonnes)
+        return donnees
+
+    # ✅ Toute modification d'une donnée régénère la structure pré-calculée du tableau
+    def perform_create(self, serializer):
+        donnee = serializer.save()
+        regenerer_apres_commit(donnee.tableau_id)
+
+    def perform_update(self, serializer):
+        ancien_tableau = serializer.instance.tableau_id
+        donnee = serializer.save()
+        regenerer_apres_commit(ancien_tableau, donnee.tableau_id)
+
+    def perform_destroy(self, instance):
+        tableau_id = instance.tableau_id
+        instance.delete()
+        regenerer_apres_commit(tableau_id)
+
 
 class ListeSourcesAPIView(APIView):
     def get(self, request):
@@ -116,39 +210,46 @@ class TableauxParSourceAPIView(APIView):
 
  
 class RechercheGlobaleAPIView(APIView):
+    """
+    Recherche dans les catégories, thèmes, tableaux (titre, source), libellés de lignes et
+    en-têtes de colonnes, via l'index plein texte (voir recherche.py) : résultats classés
+    par pertinence, paginés (?page=, ?page_size=), avec le tableau de chaque ligne ou colonne.
+    """
     def get(self, request):
         query = request.GET.get('q', '').strip()
-        if not query:
-            return Response([])
+        pagination = RecherchePagination()
+        page = pagination.paginate_queryset(rechercher(query), request, view=self)
+        return pagination.get_paginated_response(resultats_json(page))
 
-        results = []
 
-        # Recherche dans Categorie
-        for c in Categorie.objects.filter(nom_cat__icontains=query):
-            results.append({
-                'type': 'Categorie',
-                'id': c.id,
-                'nom': c.nom_cat,
-            })
-
-        # Recherche dans Theme
-        for t in Theme.objects.filter(nom_theme__icontains=query):
-            results.append({
-                'type': 'Theme',
-                'id': t.id,
-                'nom': t.nom_theme,
-            })
+class SuggestionsAPIView(APIView):
+    """
+    Suggestions pendant la frappe (?q=, ?limite=) : index de préfixes en mémoire
+    (voir suggestions.py), sans requête en base tant que l'index est à jour.
+    """
+    def get(self, request):
+        limite = min(parametre_entier(request, 'limite') or 10, 50)
+        return Response(suggerer(request.GET.get('q', ''), limite))
 
-        # Recherche dans Tableau
-        for tb in Tableau.objects.filter(Q(titre__icontains=query) | Q(source__icontains=query)):
-            results.append({
-                'type': 'Tableau',
-                'id': tb.id,
-                'nom': tb.titre,
-                'source': tb.source
-            })
 
-        return Response(results)
+class IndicateurSeriesAPIView(APIView):
+    """
+    Série d'un ou plusieurs indicateurs à travers tous les tableaux, en une requête :
+    ?code= et ?label= (répétables), ?debut= / ?fin= (années), ?groupe= (sous-colonne),
+    ?theme=. Les périodes en double sont départagées comme décrit dans series.py.
+    """
+    def get(self, request):
+        codes = list(dict.fromkeys(c.strip() for c in request.query_params.getlist('code') if c.strip()))
+        labels = list(dict.fromkeys(l.strip() for l in request.query_params.getlist('label') if l.strip()))
+        if not codes and not labels:
+            raise ValidationError({"code": "Indiquer au moins un code ou un label"})
+        if len(codes) + len(labels) > MAX_INDICATEURS:
+            raise ValidationError({"code": f"{MAX_INDICATEURS} indicateurs au plus"})
+        debut, fin = parametre_entier(request, 'debut'), parametre_entier(request, 'fin')
+        if debut is not None and fin is not None and debut > fin:
+            raise ValidationError({"debut": "Doit précéder fin"})
+        groupe = request.query_params.get('groupe') or None
+        return Response(series(codes, labels, debut, fin, groupe, parametre_entier(request, 'theme')))
 
 
 class ImportExcelView(APIView):
@@ -168,748 +269,187 @@ class ImportExcelView(APIView):
         if not all([fichier_excel, id_theme, id_cat]):
             return Response({'error': 'Veuillez fournir le fichier, theme_id et cat_id'}, status=400)
 
-        try:
-            wb = openpyxl.load_workbook(fichier_excel, data_only=True, read_only=True)
-        except Exception as e:
-            return Response({'error': f'Erreur de lecture du fichier : {str(e)}'}, status=400)
-
-        # --------- helpers ---------
-        def parse_numeric(cell):
-            """Retourne (valeur_float_ou_None, had_percent_sign: bool)"""
-            if isinstance(cell, str):
-                had_pct = '%' in cell
-                txt = (cell.replace('%', '')
-                           .replace('\u202f', '')
-                           .replace(' ', '')
-                           .replace(',', '.')).strip()
-                if txt == '':
-                    return None, had_pct
-                try:
-                    return float(txt), had_pct
-                except ValueError:
-                    return None, had_pct
-            elif isinstance(cell, (int, float)):
-                return float(cell), False
-            return None, False
-
-        def format_excel_date(value):
-            """Convertit une valeur Excel en texte mois-année (ex: janv-12)."""
-            mois_fr = [
-                "janv", "févr", "mars", "avr", "mai", "juin",
-                "juil", "août", "sept", "oct", "nov", "déc"
-            ]
-            try:
-                # Si Excel a stocké la date comme nombre
-                if isinstance(value, (int, float)):
-                    date_val = from_excel(value)
-                    return f"{mois_fr[date_val.month - 1]}-{str(date_val.year)[2:]}"
-                # Si c'est un datetime
-                if isinstance(value, datetime):
-                    return f"{mois_fr[value.month - 1]}-{str(value.year)[2:]}"
-                # Si c’est une chaîne ISO comme "2012-01-01"
-                if isinstance(value, str):
-                    try:
-                        date_val = datetime.fromisoformat(value.split(" ")[0])
-                        return f"{mois_fr[date_val.month - 1]}-{str(date_val.year)[2:]}"
-                    except Exception:
-                        return value.strip()
-                return str(value)
-            except Exception:
-                return str(value)
-
-        # --------- lecture des feuilles ---------
-        for feuille in wb.sheetnames:
-            ws = wb[feuille]
-            lignes = []
-            first_non_empty_row = None
-
-            for row in ws.iter_rows(values_only=True):
-                row_str = [str(cell).strip() if cell is not None else '' for cell in row]
-                if all(cell == '' for cell in row_str):
-                    continue
-                if first_non_empty_row is None:
-                    first_non_empty_row = row_str
-                lignes.append(row_str)
-
-            if not lignes:
-                continue
-
-            normalized_first_row = [h.lower() for h in (first_non_empty_row or [])]
-            is_new_format = all(col in normalized_first_row
-                                for col in ["titre_fr", "source_fr", "ordre", "code", "parent", "des_fr"])
-
-            # ==============================
-            # NOUVEAU FORMAT (structuré)
-            # ==============================
-            if is_new_format:
-                try:
-                    titre_fr_idx = normalized_first_row.index('titre_fr')
-                    source_fr_idx = normalized_first_row.index('source_fr')
-                    ordre_idx = normalized_first_row.index('ordre')
-                    code_idx = normalized_first_row.index('code')
-                    parent_idx = normalized_first_row.index('parent')
-                    des_fr_idx = normalized_first_row.index('des_fr')
-                except ValueError as e:
-                    return Response({'error': f"Colonnes manquantes : {str(e)}"}, status=400)
-
-
-                # ✅ Inclure toutes les colonnes sauf 'Agreg'
-                annee_indexes = []
-                for i in range(des_fr_idx + 1, len(first_non_empty_row)):
-                    header = str(first_non_empty_row[i]).strip()
-                    if header == "" or header.lower() in ["agreg", "agrég", "agrégée"]:
-                        continue  # ignorer les colonnes sans nom
-                    annee_indexes.append(i)
-
-
-
-                if len(lignes) < 2:
-                    continue
-
-                titre = lignes[1][titre_fr_idx]
-                source = lignes[1][source_fr_idx]
-                is_pourcentage = "%" in titre
-
-                tableau = Tableau.objects.create(
-                    nom_feuille=feuille,
-                    titre=titre,
-                    theme_id=id_theme,
-                    source=source,
-                    etiquette_ligne="Indicateur"
-                )
-                # ✅ Collecte des notes de bas de page (ex: "* Données RGE 2024")
-                notes_etoiles = {}
-                for row in lignes:
-                    if not row:
-                        continue
-                    first_cell = str(row[0]).strip() if row[0] is not None else ""
-                    if first_cell.startswith("*"):
-                        # exemple: "* Données RGE 2024"
-                        note_text = first_cell.lstrip("*").strip()
-                        notes_etoiles["*"] = note_text  # on stocke la note brute
-
-
-                for row in lignes[1:]:
-                    label_raw = row[des_fr_idx] if len(row) > des_fr_idx else ''
-                    label = format_excel_date(label_raw).strip()
-
-                    # ⚠️ Si le label est vide (aucun indicateur), on saute la ligne
-                    if not label:
-                        continue
-
-
-                    code = str(row[code_idx]).strip() if len(row) > code_idx and row[code_idx] else ''
-                    parent_code = str(row[parent_idx]).strip() if len(row) > parent_idx and row[parent_idx] else ''
-
-                    ordre = None
-                    if len(row) > ordre_idx and row[ordre_idx] != '':
-                        try:
-                            ordre = int(float(str(row[ordre_idx]).replace(',', '.')))
-                        except Exception:
-                            ordre = None
-
-                    ligne_obj = LigneIndicateur.objects.create(
-                        tableau=tableau,
-                        label=label,
-                        code=code,
-                        parent_code=parent_code,
-                        ordre=ordre
-                    )
-
-                    # === Vérifie si la ligne est entièrement vide
-                    ligne_vide = True
-
-                    for idx in annee_indexes:
-                        annee = format_excel_date(first_non_empty_row[idx])
-                        raw_val, had_percent = (None, False)
-
-                        # Si la colonne existe pour cette ligne
-                        if idx < len(row):
-                            raw_val, had_percent = parse_numeric(row[idx])
-
-                        # Gérer la note étoilée (*)
-                        note = None
-                        if "*" in str(annee):
-                            note = notes_etoiles.get("*", "")
-
-                        # Si la cellule est vide
-                        if raw_val is None:
-                            texte_original = ""
-                            if idx < len(row) and row[idx] not in [None, ""]:
-                                texte_original = str(row[idx]).strip()
-                                ligne_vide = False
-                            else:
-                                texte_original = ""
-
-                            Donnees.objects.create(
-                                ligne=ligne_obj,
-                                colonne=str(annee),
-                                unite="",
-                                source=source,
-                                valeur=None,
-                                statut=texte_original,
-                                categorie_id=id_cat,
-                                tableau=tableau,
-                                note_colonne=note
-                            )
-                            continue
-                            
-                        unite = ""
-                        val = raw_val
-
-                        if is_pourcentage or had_percent:
-                            unite = "%"
-
-                            # ✅ Si la cellule Excel est un texte contenant "%", on divise par 100
-                            # sinon (Excel stocke déjà 0.1502 pour 15%), on ne touche pas.
-                            if had_percent:
-                                val = val / 100.0 if val is not None else None
-
-                            # ✅ Garder plus de précision (4 décimales)
-                            val = round(val, 4) if val is not None else None
-
-
-
-                        Donnees.objects.create(
-                            ligne=ligne_obj,
-                            colonne=str(annee),
-                            unite=unite,
-                            source=source,
-                            valeur=val,
-                            categorie_id=id_cat,
-                            tableau=tableau,
-                            note_colonne=note
-                        )
-
-                    # Même si toute la ligne est vide, elle a été créée avec statut="" pour chaque colonne
-
-                continue  # feuille traitée
-
-            # ==============================
-            # ANCIEN FORMAT
-            # ==============================
-            titre = ""
-            source = ""
-            data_start = None
-
-            def is_non_empty(row):
-                return any((str(c or "").strip() for c in row))
-
-            def first_non_empty_after(rows, i):
-                for j in range(i + 1, len(rows)):
-                    if is_non_empty(rows[j]):
-                        return j
-                return None
-
-            for idx, row in enumerate(lignes):
-                joined = " ".join([str(c) for c in row if c]).strip()
-                up = joined.upper()
-
-                if re.search(r'\bTABLEAU\b', up) or re.match(r'^\s*TAB(?:LEAU)?\s*[\.:]?\s*\d+', up):
-                    titre = joined
-                    data_start = first_non_empty_after(lignes, idx)
-                    continue
-
-                if re.search(r'\bSOURCE\b', up):
-                    src_text = re.sub(r'(?i)^source\s*:?', '', joined).strip()
-                    if src_text:
-                        source = src_text
-
-            if not titre or data_start is None or data_start >= len(lignes):
-                continue
-
-            headers_old = lignes[data_start] if lignes[data_start] else []
-            etiquette_value = str(headers_old[0]).strip() if headers_old else ""
-
-            tableau = Tableau.objects.create(
-                nom_feuille=feuille,
-                titre=titre,
-                theme_id=id_theme,
-                source=source,
-                etiquette_ligne=etiquette_value
-            )
-
-            data_rows = lignes[data_start + 1:]
-            is_pourcentage = "%" in titre
-
-            for row in data_rows:
-                if not row or len(row) < 2:
-                    continue
-
-                indicateur_raw = (row[0] or "").strip()
-                indicateur_brut = format_excel_date(indicateur_raw)  # ✅ formate les lignes
-
-                if not indicateur_brut:
-                    continue
-
-                ligne_obj = LigneIndicateur.objects.create(
-                    tableau=tableau,
-                    label=indicateur_brut,  # ✅ version formatée
-                    code='',
-                    parent_code='',
-                    ordre=None
-                )
-
-                for cidx in range(1, len(headers_old)):
-                    if cidx >= len(row):
-                        continue
-                    annee = format_excel_date(headers_old[cidx])  # ✅ colonnes
-                    if not annee:
-                        continue
-
-                    raw_val, had_percent = parse_numeric(row[cidx])  
-                    if raw_val is None:
-                        # ✅ Vérifie que l'index existe avant d'y accéder
-                        texte_original = ''
-                        if cidx < len(row) and row[cidx] is not None:
-                            texte_original = str(row[cidx]).strip()
-
-                        if texte_original:  # s'il y a "N/D" ou "NS" etc.
-                            Donnees.objects.create(
-                                ligne=ligne_obj,
-                                colonne=str(annee),
-                                unite="",
-                                source=source,
-                                valeur=None,
-                                statut=texte_original,
-                                categorie_id=id_cat,
-                                tableau=tableau
-                            )
-                        continue
-
-
+        # La catégorie des données est celle du thème : les deux doivent concorder
+        if not Theme.objects.filter(id=id_theme, categorie_id=id_cat).exists():
+            return Response({'error': "Ce thème n'appartient pas à cette catégorie"}, status=400)
+
+        # ✅ Le fichier est mis en file d'attente : la commande `import_worker` se charge de l'import
+        tache = TacheImport.objects.create(
+            fichier=fichier_excel,
+            nom_fichier=fichier_excel.name,
+            theme_id=id_theme,
+            categorie_id=id_cat,
+            utilisateur=request.user,
+        )
 
-                    unite = ""
-                    val = raw_val
-                    if is_pourcentage or had_percent:
-                        unite = "%"
+        return Response({
+            'message': 'Importation en attente de traitement',
+            'tache_id': tache.id,
+            'statut': tache.statut,
+        }, status=202)
 
-                        # ✅ Si la cellule Excel est un texte contenant "%", on divise par 100
-                        # sinon (Excel stocke déjà 0.1502 pour 15%), on ne touche pas.
-                        if had_percent:
-                            val = val / 100.0 if val is not None else None
 
-                        # ✅ Garder plus de précision (4 décimales)
-                        val = round(val, 4) if val is not None else None
+class TacheImportListView(generics.ListAPIView):
+    serializer_class = TacheImportSerializer
+    permission_classes = [IsChef]
 
+    def get_queryset(self):
+        taches = TacheImport.objects.all()
+        if not self.request.user.is_superuser:
+            taches = taches.filter(categorie_id=self.request.user.categorie_id)
+        return taches[:50]
 
 
-                    Donnees.objects.create(
-                        ligne=ligne_obj,
-                        colonne=str(annee),
-                        unite=unite,
-                        source=source,
-                        valeur=val,
-                        categorie_id=id_cat,
-                        tableau=tableau,
-                       
-                    )
+class TacheImportDetailView(generics.RetrieveAPIView):
+    serializer_class = TacheImportSerializer
+    permission_classes = [IsChef]
 
-        return Response({'message': 'Importation réussie'}, status=201)
+    def get_queryset(self):
+        taches = TacheImport.objects.all()
+        if not self.request.user.is_superuser:
+            taches = taches.filter(categorie_id=self.request.user.categorie_id)
+        return taches
 
 
 
 class TableauDetailStructureView(APIView):
     def get(self, request, tableau_id):
-        donnees = (
-            Donnees.objects
-            .filter(tableau_id=tableau_id)
-            .select_related("ligne", "tableau")
-            .order_by("id")
-        )
-
-        if not donnees.exists():
-            return Response({
-                "colonnes_groupées": {},
-                "colonnes_order": [],
-                "data": [],
-                "has_sous_indicateurs": False,
-                "meta": {"titre": "", "source": "", "etiquette_ligne": ""},
-                "format": None,
-                "statuts": [],
-            })
-
-        tableau = donnees.first().tableau
-         # ✅ Détection des statuts textuels spéciaux
-        statuts_present = (
-            Donnees.objects
-            .filter(tableau_id=tableau_id)
-            .exclude(statut__isnull=True)
-            .values_list('statut', flat=True)
-        )
-
-        statuts_uniques = set([s.strip().upper() for s in statuts_present if s.strip()])
-
-
-        def format_value(d):
-            """Formate une donnée complète (valeur, unité, statut, note)."""
-            if d.valeur is None and not d.statut:
-                return ""  # cellule vide
-            if d.statut:
-                return d.statut  # ex: "N/D", "NS"
-
-            titre_lower = (d.tableau.titre or "").lower()
-            titre_contient_pourcentage = ("%" in titre_lower) or ("pourcentage" in titre_lower)
-
-            unite = d.unite or ""
-            val = d.valeur
-
-            if unite == "%":
-                val = (val * 100) if abs(val) <= 1.5 else val
-                s = f"{val:.1f}".rstrip('0').rstrip('.')
-                valeur_str = s if titre_contient_pourcentage else f"{s}%"
-            else:
-                valeur_str = f"{val:.2f}".rstrip('0').rstrip('.')
-
-            # 👉 ne pas ajouter d'étoile ici, juste retourner la valeur
-            return valeur_str
+        # ✅ Document pré-calculé à l'import / aux modifications (voir structure.py)
+        return HttpResponse(structure_json(tableau_id), content_type="application/json")
 
 
+class StructuresParLotView(APIView):
+    """
+    Documents structure de plusieurs tableaux en une réponse (?ids=1,2,3), lus ensemble
+    dans StructureTableau ; ?lignes=N ne renvoie que les en-têtes et les N premières lignes.
+    """
+    def get(self, request):
+        try:
+            ids = [int(v) for v in request.query_params.get('ids', '').split(',') if v.strip()]
+        except ValueError:
+            raise ValidationError({"ids": "Doit être une liste d'entiers séparés par des virgules"})
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            raise ValidationError({"ids": "Indiquer au moins un tableau"})
+        maximum = getattr(settings, 'ANSADE_STRUCTURES_PAR_LOT', 50)
+        if len(ids) > maximum:
+            raise ValidationError({"ids": f"{maximum} tableaux au plus par lot"})
+        nb_lignes = parametre_entier(request, 'lignes')
+        if nb_lignes is not None and nb_lignes < 0:
+            raise ValidationError({"lignes": "Doit être positif"})
+        return HttpResponse(structures_json(ids, nb_lignes), content_type="application/json")
+
+
+class TableauLignesView(generics.ListAPIView):
+    """
+    Lignes d'un tableau dans l'ordre d'affichage, pour déplier les grands tableaux à la demande :
+    ?niveau=0 (lignes de tête), ?parent=<id> (enfants directs), ?sous_arbre=<id> (tous les descendants).
+    Chaque filtre est une seule requête sur les index (tableau, niveau, rang) / (tableau, rang).
+    """
+    serializer_class = LigneIndicateurSerializer
 
-        # Détection format (nouveau si présence code/ordre)
-        is_nouveau_format = any(
-            (getattr(d.ligne, "code", None) or getattr(d.ligne, "ordre", None) is not None)
-            for d in donnees
-        )
+    def get_queryset(self):
+        tableau_id = self.kwargs['tableau_id']
+        lignes = LigneIndicateur.objects.filter(tableau_id=tableau_id)
+        params = self.request.query_params
 
-        colonnes_principales = OrderedDict()
-
-        # =====================================================================
-        # NOUVEAU FORMAT (avec code/parent_code/ordre)
-        # =====================================================================
-        if is_nouveau_format:
-            nodes_by_code = OrderedDict()
-
-            # 1) Parcours des données -> colonnes groupées + noeuds
-            for d in donnees:
-                l = d.ligne
-                label = (l.label or "").strip()
-                col = (d.colonne or "").strip()
-
-                # Colonnes groupées
-                if "~" in col:
-                    col_principal, col_sous = map(str.strip, col.split("~", 1))
-                else:
-                    col_principal, col_sous = col, ""
-                if col_principal not in colonnes_principales:
-                    colonnes_principales[col_principal] = []
-                if col_sous and col_sous not in colonnes_principales[col_principal]:
-                    colonnes_principales[col_principal].append(col_sous)
-                elif not col_sous and "" not in colonnes_principales[col_principal]:
-                    colonnes_principales[col_principal].append("")
-
-                # Clés hiérarchie
-                code = (l.code or "").strip() or f"__row_{l.id}"
-                parent_code = (l.parent_code or "").strip()
-                ordre = l.ordre if l.ordre is not None else None
-
-                if code not in nodes_by_code:
-                    nodes_by_code[code] = {
-                        "code": code,
-                        "parent_code": parent_code,
-                        "indicateur": label,
-                        "ordre": ordre,
-                        "valeurs": defaultdict(dict),
-                        "children": [],
-                        "ligne_id": l.id,
-                    }
-
-                nodes_by_code[code]["valeurs"][col_principal][col_sous] = format_value(d)
-
-
-            # 2) Construire l’arbre
-            roots = []
-            for code, node in nodes_by_code.items():
-                p = node.get("parent_code")
-                if p and p in nodes_by_code:
-                    nodes_by_code[p]["children"].append(node)
-                else:
-                    roots.append(node)
-
-            # 3) Aplatir avec tri et niveau
-            def has_any_value(n):
-                return any(v for g in n["valeurs"].values() for v in g.values())
-
-            def flatten(nodes, niveau=0):
-                out = []
-                nodes_sorted = sorted(
-                    nodes,
-                    key=lambda n: (
-                        n.get("ordre") is None,                # ceux sans ordre en dernier
-                        n.get("ordre", 0),
-                        n.get("indicateur", "")
-                    )
+        try:
+            if 'niveau' in params:
+                lignes = lignes.filter(niveau=int(params['niveau']))
+            if 'parent' in params:
+                lignes = lignes.filter(parent_id=int(params['parent']))
+            if 'sous_arbre' in params:
+                racine = LigneIndicateur.objects.filter(pk=int(params['sous_arbre']), tableau_id=tableau_id)
+                lignes = lignes.filter(
+                    rang__gt=Subquery(racine.values('rang')[:1]),
+                    rang__lte=Subquery(racine.values('rang_fin')[:1]),
                 )
-                for n in nodes_sorted:
-                    out.append({
-                        "indicateur": n["indicateur"],
-                        "valeurs": dict(n["valeurs"]),
-                        "niveau": niveau,
-                        "ordre": n.get("ordre"),
-                        "code": n.get("code"),
-                        "parent_code": n.get("parent_code") or None,
-                        "ligne_id": n.get("ligne_id"),
-                        "is_section": (len(n["children"]) > 0 and not has_any_value(n)),
-                    })
-                    out.extend(flatten(n["children"], niveau + 1))
-                return out
-
-            data = flatten(roots)
-
-            # 4) Colonnes groupées + ordre à plat
-            colonnes_groupées = {
-                col: sous if any(sous) else [""]
-                for col, sous in colonnes_principales.items()
-            }
-            colonnes_order = []
-            for gp, sous in colonnes_principales.items():
-                if any(sous):
-                    for s in sous:
-                        colonnes_order.append({"principal": gp, "sous": s})
-                else:
-                    colonnes_order.append({"principal": gp, "sous": ""})
-
-            # ✅ Récupération des notes liées aux colonnes (ex: * Données RGE 2024)
-            notes = (
-                Donnees.objects
-                .filter(tableau_id=tableau_id)
-                .exclude(note_colonne__isnull=True)
-                .exclude(note_colonne__exact="")
-                .values_list("note_colonne", flat=True)
-                .distinct()
-            )
-            notes_text = [f"{n}" for n in notes]
-
-            return Response({
-                "colonnes_groupées": colonnes_groupées,
-                "colonnes_order": colonnes_order,
-                "data": data,
-                "has_sous_indicateurs": False,
-                "meta": {
-                    "titre": tableau.titre,
-                    "source": tableau.source or "",
-                    "etiquette_ligne": tableau.etiquette_ligne or ""
-                },
-                "format": "nouveau",
-                "notes": notes_text,  
-                "statuts": list(statuts_uniques)
-
-            })
-
-        # =====================================================================
-        # ANCIEN FORMAT (séparateur ~ dans lignes/colonnes)
-        # =====================================================================
-        structure = OrderedDict()
-
-        for d in donnees:
-            label = (d.ligne.label or "").strip()
-            col = (d.colonne or "").strip()
-
-            # Colonnes groupées
-            if "~" in col:
-                col_principal, col_sous = map(str.strip, col.split("~", 1))
-            else:
-                col_principal, col_sous = col, ""
-            if col_principal not in colonnes_principales:
-                colonnes_principales[col_principal] = []
-            if col_sous and col_sous not in colonnes_principales[col_principal]:
-                colonnes_principales[col_principal].append(col_sous)
-            elif not col_sous and "" not in colonnes_principales[col_principal]:
-                colonnes_principales[col_principal].append("")
-
-            v = format_value(d)
-
-
-            # Lignes groupées (~)
-            if "~" in label:
-                principal, sous = map(str.strip, label.split("~", 1))
-                if principal not in structure:
-                    structure[principal] = {
-                        "sous_indicateurs": [],
-                        "valeurs": defaultdict(dict)
-                    }
-                structure[principal]["sous_indicateurs"].append({
-                    "nom": sous,
-                    "valeurs": {col_principal: {col_sous: v}}
-                })
-            else:
-                if label not in structure:
-                    structure[label] = {
-                        "sous_indicateurs": [],
-                        "valeurs": defaultdict(dict)
-                    }
-                structure[label]["valeurs"][col_principal][col_sous] = v
-
-        # Colonnes groupées + ordre à plat
-        colonnes_groupées = {
-            col: sous if any(sous) else [""]
-            for col, sous in colonnes_principales.items()
-        }
-        colonnes_order = []
-        for gp, sous in colonnes_principales.items():
-            if any(sous):
-                for s in sous:
-                    colonnes_order.append({"principal": gp, "sous": s})
-            else:
-                colonnes_order.append({"principal": gp, "sous": ""})
-
-        # Aplatir pour le front
-        data = []
-        for indicateur, contenu in structure.items():
-            if contenu["sous_indicateurs"]:
-                regroupé = OrderedDict()
-                for sous in contenu["sous_indicateurs"]:
-                    nom = sous["nom"]
-                    if nom not in regroupé:
-                        regroupé[nom] = defaultdict(dict)
-                    for c, sous_vals in sous["valeurs"].items():
-                        for sc, val in sous_vals.items():
-                            regroupé[nom][c][sc] = val
-                data.append({
-                    "indicateur": indicateur,
-                    "sous_indicateurs": [
-                        {"nom": nom, "valeurs": regroupé[nom]}
-                        for nom in regroupé
-                    ],
-                    "niveau": 0,
-                    "ordre": None,
-                    "code": None,
-                    "parent_code": None,
-                    "ligne_id": None,
-                    "is_section": False
-                })
-            else:
-                data.append({
-                    "indicateur": indicateur,
-                    "valeurs": dict(contenu["valeurs"]),
-                    "niveau": 0,
-                    "ordre": None,
-                    "code": None,
-                    "parent_code": None,
-                    "ligne_id": None,
-                    "is_section": False
-                })
-
-        has_sous_indicateurs = any(row.get("sous_indicateurs") for row in data)
-
-        # ✅ Récupération des notes si présentes
-        notes = (
-            Donnees.objects
-            .filter(tableau_id=tableau_id)
-            .exclude(note_colonne__isnull=True)
-            .exclude(note_colonne__exact="")
-            .values_list("note_colonne", flat=True)
-            .distinct()
-        )
-        notes_text = [f"{n}" for n in notes]
-       
-
-        return Response({
-            "colonnes_groupées": colonnes_groupées,
-            "colonnes_order": colonnes_order,
-            "data": data,
-            "has_sous_indicateurs": has_sous_indicateurs,
-            "meta": {
-                "titre": tableau.titre,
-                "source": tableau.source or "",
-                "etiquette_ligne": tableau.etiquette_ligne or ""
-            },
-            "format": "ancien",
-            "notes": notes_text,  
-            "statuts": list(statuts_uniques)
-
-
-        })
+        except ValueError:
+            raise ValidationError("niveau, parent et sous_arbre doivent être des entiers")
+        return lignes.order_by('rang', 'id')
 
 
 class TableauFiltresOptionsView(APIView):
     def get(self, request, tableau_id):
-        try:
-            tableau = Tableau.objects.get(id=tableau_id)
-        except Tableau.DoesNotExist:
+        # ✅ Options pré-calculées à l'import / aux modifications (voir structure.construire_options)
+        options = options_json(tableau_id)
+        if options is None:
             return Response({"error": "Tableau non trouvé"}, status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(options, content_type="application/json")
+
+
+def liste_ids(request, nom):
+    """Liste d'id envoyée dans le corps de la requête (None si absente ou vide)."""
+    valeurs = request.data.get(nom)
+    if not valeurs:
+        return None
+    if not isinstance(valeurs, list):
+        raise ValidationError({nom: "Doit être une liste d'entiers"})
+    try:
+        return [int(v) for v in valeurs]
+    except (TypeError, ValueError):
+        raise ValidationError({nom: "Doit être une liste d'entiers"})
+
+
+def labels_lignes(lignes):
+    """Libellés de LigneIndicateur visés par les lignes choisies ("Indicateur ~ Sous")."""
+    labels = set()
+    for ligne in lignes:
+        parts = ligne.split("~")
+        indicateur = parts[0].strip()
+        sous = parts[1].strip() if len(parts) > 1 else None
+        if sous and sous.lower() != "ensemble":
+            labels.add(f"{indicateur}~{sous}")
+        else:
+            labels.add(indicateur)
+    return labels
 
-        donnees = Donnees.objects.filter(tableau=tableau).select_related("ligne")
-
-        lignes_set = set()
-        colonnes_set = set()
-
-        for d in donnees:
-            ligne_label = d.ligne.label.strip() if d.ligne and d.ligne.label else ""
-            colonne = (d.colonne or "").strip()
-            if ligne_label:
-                lignes_set.add(ligne_label)
-            if colonne:
-                colonnes_set.add(colonne)
-
-        # Traitement des lignes
-        lignes_groupées = defaultdict(list)
-        for ligne in lignes_set:
-            if "~" in ligne:
-                indicateur, sous = map(str.strip, ligne.split("~", 1))
-                lignes_groupées[indicateur].append(sous)
-            else:
-                lignes_groupées[ligne]
-
-        lignes_finales = []
-        for indicateur, sous_liste in lignes_groupées.items():
-            if sous_liste:
-                for sous in sous_liste:
-                    lignes_finales.append(f"{indicateur} ~ {sous}")
-            else:
-                lignes_finales.append(indicateur)
-
-        # Colonnes
-        colonnes_groupées = defaultdict(list)
-        for col in colonnes_set:
-            if "~" in col:
-                principal, sous = map(str.strip, col.split("~", 1))
-                colonnes_groupées[principal].append(sous)
-            else:
-                colonnes_groupées[col]
 
-        colonnes_finales = []
-        for principal, sous_liste in colonnes_groupées.items():
-            if sous_liste:
-                for sous in sous_liste:
-                    colonnes_finales.append(f"{principal} ~ {sous}")
-            else:
-                colonnes_finales.append(principal)
+def selection_filtre(request):
+    """
+    Sélection d'un filtre : ligne_ids / colonne_ids (id des LigneIndicateur et des Colonne),
+    ou anciens libellés lignes / colonnes. Une liste vide ne filtre pas.
+    """
+    lignes = request.data.get("lignes", [])
+    colonnes = request.data.get("colonnes", [])
+    return {
+        "ligne_ids": liste_ids(request, "ligne_ids"),
+        "colonne_ids": liste_ids(request, "colonne_ids"),
+        "labels": labels_lignes(lignes) if lignes else None,
+        "colonnes": set(colonnes) if colonnes else None,
+    }
+
+
+def filtres_donnees(tableau_id, ligne_ids=None, colonne_ids=None, labels=None, colonnes=None):
+    """Même sélection que MatriceIndexee.selection, exprimée sur les cellules."""
+    filtres = Q(tableau_id=tableau_id)
+    if ligne_ids is not None or labels is not None:
+        filtres &= Q(ligne_id__in=ligne_ids or []) | Q(ligne__label__in=labels or [])
+    if colonne_ids is not None or colonnes is not None:
+        filtres &= Q(colonne_id__in=colonne_ids or []) | Q(colonne__label__in=colonnes or [])
+    return filtres
 
-        return Response({
-            "lignes": sorted(lignes_finales),
-            "colonnes": sorted(colonnes_finales)
-        })
 
 class TableauFiltreView(APIView):
     def post(self, request, tableau_id):
-        lignes = request.data.get("lignes", [])  # Ex: ["Population urbaine ~ Masculine"]
-        colonnes = request.data.get("colonnes", [])  # Ex: ["1977", "2023"]
-
-        try:
-            tableau = Tableau.objects.get(id=tableau_id)
-        except Tableau.DoesNotExist:
+        # Ex: {"ligne_ids": [12, 13], "colonne_ids": [40]} ou {"lignes": ["Population urbaine ~ Masculine"], "colonnes": ["1977"]}
+        if not Tableau.objects.filter(id=tableau_id).exists():
             return Response({"error": "Tableau non trouvé"}, status=status.HTTP_404_NOT_FOUND)
-        filtres = Q(tableau=tableau)
-
-        if lignes:
-            conditions = Q()
-            for ligne in lignes:
-                parts = ligne.split("~")
-                indicateur = parts[0].strip()
-                sous = parts[1].strip() if len(parts) > 1 else None
-
-                if sous and sous.lower() != "ensemble":
-                    conditions |= Q(ligne=f"{indicateur}~{sous}")
-                else:
-                    conditions |= Q(ligne=indicateur)
-
-            filtres &= conditions
-
-        if colonnes:
-            filtres &= Q(colonne__in=colonnes)
+        selection = selection_filtre(request)
+
+        # ✅ lignes et colonnes résolues en id dans l'index en mémoire, puis cellules lues par id
+        index = charger_index(tableau_id)
+        if index is not None:
+            i, j = index.selection(**selection)
+            filtres = Q(
+                tableau_id=tableau_id,
+                ligne_id__in=index.matrice.lignes[i].tolist(),
+                colonne_id__in=index.matrice.colonnes[j].tolist(),
+            )
+        else:
+            filtres = filtres_donnees(tableau_id, **selection)
 
-        donnees = Donnees.objects.filter(filtres)
+        donnees = Donnees.objects.filter(filtres).select_related("ligne", "colonne", "tableau")
         serializer = DonneesSerializer(donnees, many=True)
         return Response(serializer.data)
 
@@ -917,40 +457,28 @@ class TableauFiltreView(APIView):
 
 class TableauFiltreStructureView(APIView):
     def post(self, request, tableau_id):
-        lignes = request.data.get("lignes", [])
-        colonnes = request.data.get("colonnes", [])
-
-        try:
-            tableau = Tableau.objects.get(id=tableau_id)
-        except Tableau.DoesNotExist:
+        if not Tableau.objects.filter(id=tableau_id).exists():
             return Response({"error": "Tableau non trouvé"}, status=status.HTTP_404_NOT_FOUND)
+        selection = selection_filtre(request)
+
+        # ✅ découpe de la matrice en mémoire (aucune requête après le premier chargement),
+        # sinon requête sur les cellules
+        index = charger_index(tableau_id)
+        if index is not None:
+            libelles_lignes = dict(zip(index.matrice.lignes.tolist(), (label for label, _, _ in index.lignes)))
+            colonnes_par_id = dict(zip(index.matrice.colonnes.tolist(), index.colonnes))
+            donnees = [
+                (libelles_lignes[ligne_id], colonnes_par_id[colonne_id][1], colonnes_par_id[colonne_id][2], valeur, unite)
+                for ligne_id, colonne_id, valeur, unite, _ in index.cellules(*index.selection(**selection))
+            ]
+        else:
+            donnees = list(
+                Donnees.objects.filter(filtres_donnees(tableau_id, **selection))
+                .order_by("ligne__ordre", "colonne__label")
+                .values_list("ligne__label", "colonne__principal", "colonne__sous", "valeur", "unite")
+            )
 
-        filtres = Q(tableau=tableau)
-
-        # ---- Filtrage des lignes ----
-        if lignes:
-            conditions = Q()
-            for ligne in lignes:
-                parts = ligne.split("~")
-                indicateur = parts[0].strip()
-                sous = parts[1].strip() if len(parts) > 1 else None
-                if sous and sous.lower() != "ensemble":
-                    conditions |= Q(ligne__label=f"{indicateur}~{sous}")
-                else:
-                    conditions |= Q(ligne__label=indicateur)
-            filtres &= conditions
-
-        # ---- Filtrage des colonnes ----
-        if colonnes:
-            filtres &= Q(colonne__in=colonnes)
-
-        donnees = (
-            Donnees.objects.filter(filtres)
-            .select_related("ligne")
-            .order_by("ligne__ordre", "colonne")
-        )
-
-        if not donnees.exists():
+        if not donnees:
             return Response({
                 "colonnes_groupées": {},
                 "data": [],
@@ -964,18 +492,12 @@ class TableauFiltreStructureView(APIView):
             "valeurs": defaultdict(dict)
         })
 
-        for d in donnees:
-            ligne_label = d.ligne.label.strip() if d.ligne and d.ligne.label else ""
-            colonne = (d.colonne or "").strip()
+        for label, col_principal, col_sous, valeur, unite in donnees:
+            ligne_label = label.strip() if label else ""
             valeur_formatee = (
-                f"{d.valeur:.2f}".rstrip("0").rstrip(".") if d.valeur is not None else ""
+                f"{valeur:.2f}".rstrip("0").rstrip(".") if valeur is not None else ""
             )
-            valeur_finale = f"{valeur_formatee}{d.unite}" if d.unite else valeur_formatee
-
-            if "~" in colonne:
-                col_principal, col_sous = map(str.strip, colonne.split("~", 1))
-            else:
-                col_principal, col_sous = colonne, ""
+            valeur_finale = f"{valeur_formatee}{unite}" if unite else valeur_formatee
 
             colonnes_principales[col_principal].add(col_sous)
 
@@ -1026,98 +548,45 @@ class TableauFiltreStructureView(APIView):
         })
 
 class TableauAnalyseAPIView(APIView):
+    """
+    Séries temporelles du tableau (indicateurs × périodes) avec croissance, TCAM, min / max /
+    moyenne, part dans la ligne parente et moyenne mobile (?fenetre=, 3 par défaut) ;
+    calculées en NumPy depuis la matrice du tableau (voir analyse.py), en cache par version.
+    """
     def get(self, request, pk):
-        try:
-            tableau = Tableau.objects.get(id=pk)
-        except Tableau.DoesNotExist:
+        titre = Tableau.objects.filter(id=pk).values_list("titre", flat=True).first()
+        if titre is None:
             return Response({"detail": "Tableau non trouvé"}, status=404)
+        fenetre = parametre_entier(request, "fenetre")
+        fenetre = 3 if fenetre is None else fenetre
+        if not 1 <= fenetre <= 24:
+            raise ValidationError({"fenetre": "Doit être compris entre 1 et 24"})
+        return Response(analyser(pk, titre, fenetre))
 
-        donnees = Donnees.objects.filter(tableau=tableau)
-
-        lignes = [d.ligne for d in donnees if d.ligne]
-        colonnes = [d.colonne for d in donnees if d.colonne]
-
-        # Détection du type de tableau
-        a_wilayas = any("wilaya" in l.lower() for l in lignes)
-        if all(c.isdigit() or c.startswith("20") or c.startswith("19") for c in colonnes):
-            tableau_type = "annees"
-        elif any(c in colonnes for c in ["Féminin", "Masculin", "Total"]):
-            tableau_type = "groupes"
-        elif a_wilayas:
-            tableau_type = "carte"
-        else:
-            tableau_type = "generique"
-
-        # Format des données
-        results = []
-        for d in donnees:
-            try:
-                valeur = float(d.valeur) if isinstance(d.valeur, str) else d.valeur
-            except:
-                valeur = 0
-            results.append({
-                "categorie_ligne": d.ligne or "",
-                "categorie_colonne": d.colonne or "",
-                "valeur": valeur
-            })
-
-        return Response({
-            "titre": tableau.titre,
-            "donnees": results,
-            "type": tableau_type
-        })
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Donnees, Tableau
 
 class CarteParTableauAPIView(APIView):
+    """
+    Toutes les périodes de la carte en une réponse : valeurs périodes × wilayas et bornes de
+    classes par période (?classes=, 5 par défaut) ; voir carte.py.
+    """
     def get(self, request, tableau_id):
-        try:
-            tableau = Tableau.objects.get(id=tableau_id)
-        except Tableau.DoesNotExist:
+        tableau = Tableau.objects.filter(id=tableau_id).values("titre", "etiquette_ligne").first()
+        if tableau is None:
             return Response({'error': 'Tableau non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+        nb_classes = parametre_entier(request, "classes")
+        nb_classes = NB_CLASSES if nb_classes is None else nb_classes
+        if not 2 <= nb_classes <= 9:
+            raise ValidationError({"classes": "Doit être compris entre 2 et 9"})
 
-        if tableau.etiquette_ligne.lower() != 'wilaya':
+        resultat = carte(tableau_id, tableau["titre"], nb_classes)
+        if not est_carte(tableau["etiquette_ligne"], resultat):
             return Response({'error': 'Ce tableau ne contient pas des données par Wilaya'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resultat)
 
-        donnees = Donnees.objects.filter(tableau_id=tableau_id)
-
-        tableau_donnees = {}
-
-        for donnee in donnees:
-            annee = donnee.colonne
-            wilaya = donnee.ligne
-            valeur = donnee.valeur
-
-            if not annee or not wilaya:
-                continue
-
-            if annee not in tableau_donnees:
-                tableau_donnees[annee] = {}
-
-            if wilaya not in tableau_donnees[annee]:
-                tableau_donnees[annee][wilaya] = []
-
-            tableau_donnees[annee][wilaya].append(valeur)
-
-        # Trie des années
-        annees_triees = sorted(tableau_donnees.keys(), key=lambda x: int(x) if x.isdigit() else x)
-
-        # Moyenne pour chaque wilaya pour la première année (la plus ancienne)
-        valeurs_par_defaut = {}
-        if annees_triees:
-            premiere_annee = annees_triees[0]
-            for wilaya, valeurs in tableau_donnees[premiere_annee].items():
-                moyenne = sum(valeurs) / len(valeurs) if valeurs else 0
-                valeurs_par_defaut[wilaya] = round(moyenne, 2)
-
-        return Response({
-            'titre': tableau.titre,
-            'annees': annees_triees,
-            'valeurs': valeurs_par_defaut
-        })
-    
     from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -1145,7 +614,10 @@ class ExportTableauAPIView(APIView):
         tableau = get_object_or_404(Tableau, pk=tableau_id)
 
         # ✅ Correction : filtrer directement avec tableau_id
-        donnees = Donnees.objects.filter(tableau_id=tableau_id).values()
+        donnees = Donnees.objects.filter(tableau_id=tableau_id).order_by("id").values(
+            "ligne_id", "unite", "valeur", "statut",
+            colonne_label=F("colonne__label"), note=F("colonne__note"),
+        )
 
         if not donnees.exists():
             return Response(
@@ -1153,10 +625,9 @@ class ExportTableauAPIView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        df = pd.DataFrame(list(donnees))
-        for col in ["id", "tableau_id", "categorie_id"]:
-            if col in df.columns:
-                df.drop(columns=[col], inplace=True)
+        df = pd.DataFrame(list(donnees)).rename(columns={"colonne_label": "colonne", "note": "note_colonne"})
+        df["source"] = tableau.source or ""
+        df = df[["ligne_id", "colonne", "unite", "source", "valeur", "statut", "note_colonne"]]
 
         # === EXPORT XLSX ===
         if fmt == "xlsx":
@@ -1218,4 +689,98 @@ class ExportTableauAPIView(APIView):
                 {"error": "Format non supporté. Utilisez ?format=pdf ou ?format=xlsx"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-  
\ No newline at end of file
+  
+
+import csv
+import json
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire."""
+    def write(self, valeur):
+        return valeur
+
+
+class ExportDonneesFluxView(View):
+    """
+    Export brut des cellules, envoyé au fil de la lecture (mémoire constante).
+    Sélection : ?tableau=1&tableau=2, ?theme=3 et/ou ?categorie=4 (au moins un).
+    Format : ?format=ndjson (défaut, un objet JSON par ligne) ou ?format=csv.
+    Exemple : /api/export/donnees/?categorie=2&format=csv
+    """
+
+    CHAMPS = [
+        "id", "tableau_id", "ligne_id", "ligne__label", "ligne__code",
+        "colonne__label", "unite", "valeur", "statut", "colonne__note",
+    ]
+    NOMS = [
+        "id", "tableau", "ligne", "indicateur", "code",
+        "colonne", "unite", "valeur", "statut", "note_colonne", "source",
+    ]
+    TAILLE_LOT = 2000  # lignes lues par aller-retour du curseur serveur et envoyées d'un bloc
+
+    def get(self, request):
+        fmt = request.GET.get("format", "ndjson").lower()
+        if fmt not in ("ndjson", "csv"):
+            return JsonResponse({"error": "Format non supporté. Utilisez ?format=ndjson ou ?format=csv"}, status=400)
+
+        try:
+            ids = [int(v) for valeur in request.GET.getlist("tableau") for v in valeur.split(",") if v]
+            theme = int(request.GET["theme"]) if request.GET.get("theme") else None
+            categorie = int(request.GET["categorie"]) if request.GET.get("categorie") else None
+        except ValueError:
+            return JsonResponse({"error": "tableau, theme et categorie doivent être des entiers"}, status=400)
+        if not (ids or theme or categorie):
+            return JsonResponse({"error": "Précisez au moins un tableau, un thème ou une catégorie"}, status=400)
+
+        tableaux = Tableau.objects.all()
+        if ids:
+            tableaux = tableaux.filter(id__in=ids)
+        if theme:
+            tableaux = tableaux.filter(theme_id=theme)
+        if categorie:
+            tableaux = tableaux.filter(theme__categorie_id=categorie)
+        sources = list(tableaux.order_by("id").values_list("id", "source"))
+
+        lignes = self.lignes_ndjson(sources) if fmt == "ndjson" else self.lignes_csv(sources)
+        response = StreamingHttpResponse(
+            lignes,
+            content_type="application/x-ndjson" if fmt == "ndjson" else "text/csv; charset=utf-8",
+        )
+        if fmt == "csv":
+            response["Content-Disposition"] = 'attachment; filename="donnees.csv"'
+        return response
+
+    def lots(self, sources):
+        """
+        Cellules tableau par tableau, dans l'ordre d'import, par lots de TAILLE_LOT.
+        `sources` : (tableau_id, source) ; la source, portée par le tableau, est ajoutée à chaque cellule.
+        """
+        for tableau_id, source in sources:
+            suite = (source or "",)
+            # ✅ iterator() : curseur côté serveur sur PostgreSQL, rien n'est chargé d'un coup
+            lot = []
+            for ligne in (
+                Donnees.objects.filter(tableau_id=tableau_id)
+                .order_by("id")
+                .values_list(*self.CHAMPS)
+                .iterator(chunk_size=self.TAILLE_LOT)
+            ):
+                lot.append(ligne + suite)
+                if len(lot) == self.TAILLE_LOT:
+                    yield lot
+                    lot = []
+            if lot:
+                yield lot
+
+    def lignes_ndjson(self, sources):
+        for lot in self.lots(sources):
+            yield "".join(json.dumps(dict(zip(self.NOMS, ligne)), ensure_ascii=False) + "\n" for ligne in lot)
+
+    def lignes_csv(self, sources):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.NOMS)
+        for lot in self.lots(sources):
+            yield "".join(writer.writerow(ligne) for ligne in lot)
@@ -1,19 +1,28 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useMemo, useState } from "react";
 import { useParams } from "react-router-dom";
 import { MapContainer, TileLayer, GeoJSON } from "react-leaflet";
 import "leaflet/dist/leaflet.css";
 
 interface DonneesCarte {
   titre: string;
-  annees: string[];
-  valeurs: Record<string, number>;
+  periodes: string[];
+  wilayas: { ligne_id: number; nom: string; code: string | null }[];
+  valeurs: (number | null)[][]; // périodes × wilayas
+  classes: {
+    nombre: number;
+    quantiles: (number | null)[][];
+    intervalles: (number | null)[][];
+  };
 }
 
+const COULEURS = ["#a8ddb5", "#7bccc4", "#4eb3d3", "#2b8cbe", "#0868ac", "#084081", "#08306b", "#081d58", "#041030"];
+
 const AnalyseCarte = () => {
   const { id } = useParams();
   const [geoData, setGeoData] = useState<any>(null);
   const [donnees, setDonnees] = useState<DonneesCarte | null>(null);
-  const [anneeSelectionnee, setAnneeSelectionnee] = useState<string>("");
+  const [periode, setPeriode] = useState<number>(0);
+  const [methode, setMethode] = useState<"quantiles" | "intervalles">("quantiles");
 
   // Charger la carte GeoJSON
   useEffect(() => {
@@ -23,19 +32,7 @@ const AnalyseCarte = () => {
       .catch(console.error);
   }, []);
 
-  // Charger les données du backend (valeurs + années)
-  const chargerDonnees = (annee: string) => {
-    if (!id) return;
-
-    fetch(`/api/tableaux/${id}/carte/?annee=${annee}`)
-      .then((res) => res.json())
-      .then((data) => {
-        setDonnees(data);
-      })
-      .catch(console.error);
-  };
-
-  // Charger les données dès la 1ère fois (avec l’année par défaut)
+  // ✅ une seule requête : toutes les périodes et leurs classes
   useEffect(() => {
     if (!id) return;
 
@@ -43,27 +40,30 @@ const AnalyseCarte = () => {
       .then((res) => res.json())
       .then((data) => {
         setDonnees(data);
-        if (data.annees.length > 0) {
-          setAnneeSelectionnee(data.annees[0]);
-          chargerDonnees(data.annees[0]);
-        }
+        setPeriode(0);
       })
       .catch(console.error);
   }, [id]);
 
-  // Style de chaque wilaya selon la valeur
+  // Valeur de chaque wilaya (code MRxx du fond de carte) pour la période choisie
+  const valeursPeriode = useMemo(() => {
+    const valeurs: Record<string, number | null> = {};
+    donnees?.wilayas.forEach((w, i) => {
+      if (w.code) valeurs[w.code] = donnees.valeurs[periode]?.[i] ?? null;
+    });
+    return valeurs;
+  }, [donnees, periode]);
+
+  // Style de chaque wilaya selon sa classe
   const getStyle = (feature: any) => {
-    const nom = feature.properties.name;
-    const valeur = donnees?.valeurs?.[nom] || 0;
+    const valeur = valeursPeriode[feature.properties.id];
+    const bornes = donnees?.classes[methode][periode] ?? [];
 
-    // Couleur basée sur la valeur
     let color = "#ccc";
-    if (valeur > 10000000) color = "#084081";
-    else if (valeur > 5000000) color = "#0868ac";
-    else if (valeur > 1000000) color = "#2b8cbe";
-    else if (valeur > 500000) color = "#4eb3d3";
-    else if (valeur > 100000) color = "#7bccc4";
-    else if (valeur > 0) color = "#a8ddb5";
+    if (valeur !== null && valeur !== undefined) {
+      const classe = bornes.filter((b) => b !== null && valeur > b).length;
+      color = COULEURS[classe];
+    }
 
     return {
       fillColor: color,
@@ -84,20 +84,24 @@ const AnalyseCarte = () => {
         <div className="text-center my-4">
           <label className="mr-2 font-medium">📅 Année : </label>
           <select
-            value={anneeSelectionnee}
-            onChange={(e) => {
-              const newAnnee = e.target.value;
-              setAnneeSelectionnee(newAnnee);
-              chargerDonnees(newAnnee);
-            }}
+            value={periode}
+            onChange={(e) => setPeriode(Number(e.target.value))}
             className="border rounded px-3 py-1"
           >
-            {donnees.annees.map((a) => (
-              <option key={a} value={a}>
-                {a}
+            {donnees.periodes.map((p, i) => (
+              <option key={p} value={i}>
+                {p}
               </option>
             ))}
           </select>
+          <select
+            value={methode}
+            onChange={(e) => setMethode(e.target.value as "quantiles" | "intervalles")}
+            className="border rounded px-3 py-1 ml-2"
+          >
+            <option value="quantiles">Quantiles</option>
+            <option value="intervalles">Intervalles égaux</option>
+          </select>
         </div>
       )}
 
@@ -110,7 +114,7 @@ const AnalyseCarte = () => {
           <TileLayer
             url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
           />
-          <GeoJSON data={geoData} style={getStyle} />
+          <GeoJSON key={`${donnees ? id : ""}-${periode}-${methode}`} data={geoData} style={getStyle} />
         </MapContainer>
       )}
     </div>
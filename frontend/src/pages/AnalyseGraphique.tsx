@@ -11,16 +11,10 @@ import {
   ResponsiveContainer,
 } from "recharts";
 
-interface DonneeAPI {
-  categorie_ligne: string;
-  categorie_colonne: string;
-  valeur: number;
-}
-
 interface ReponseAPI {
   titre: string;
-  donnees: DonneeAPI[];
   type: string;
+  moyennes: DonneeGraphique[];
 }
 
 interface DonneeGraphique {
@@ -41,49 +35,11 @@ const AnalyseGraphique = () => {
     axios
       .get<ReponseAPI>(`/api/tableaux/${id}/analyse/`)
       .then((response) => {
-        const { donnees, titre, type } = response.data;
+        const { moyennes, titre, type } = response.data;
         setTitre(titre);
         setType(type);
-
-        if (type === "annees") {
-          const grouped: Record<string, { total: number; count: number }> = {};
-          donnees.forEach((item) => {
-            const annee = item.categorie_colonne;
-            if (!grouped[annee]) {
-              grouped[annee] = { total: 0, count: 0 };
-            }
-            grouped[annee].total += item.valeur;
-            grouped[annee].count += 1;
-          });
-
-          const moyennes: DonneeGraphique[] = Object.entries(grouped).map(
-            ([annee, { total, count }]) => ({
-              annee,
-              moyenne: parseFloat((total / count).toFixed(4)),
-            })
-          );
-
-          setDonnees(moyennes);
-        } else {
-          const grouped: Record<string, { total: number; count: number }> = {};
-          donnees.forEach((item) => {
-            const groupe = item.categorie_ligne;
-            if (!grouped[groupe]) {
-              grouped[groupe] = { total: 0, count: 0 };
-            }
-            grouped[groupe].total += item.valeur;
-            grouped[groupe].count += 1;
-          });
-
-          const moyennes: DonneeGraphique[] = Object.entries(grouped).map(
-            ([groupe, { total, count }]) => ({
-              groupe,
-              moyenne: parseFloat((total / count).toFixed(4)),
-            })
-          );
-
-          setDonnees(moyennes);
-        }
+        // ✅ moyennes par période (ou par indicateur) calculées côté serveur
+        setDonnees(moyennes);
       })
       .catch((error) => {
         console.error("Erreur lors du chargement des données :", error);
@@ -5,6 +5,10 @@ type Props = {
   onBack: () => void;
 };
 
+// Suivi de la tâche d'import : intervalle entre deux requêtes et durée maximale d'attente
+const SUIVI_INTERVALLE_MS = 2000;
+const SUIVI_DUREE_MAX_MS = 30 * 60 * 1000;
+
 const ImportExcel: React.FC<Props> = ({ onBack }) => {
   const [themes, setThemes] = useState<any[]>([]);
   const [categories, setCategories] = useState<any[]>([]);
@@ -74,8 +78,43 @@ const ImportExcel: React.FC<Props> = ({ onBack }) => {
         },
       });
 
+      // ⏳ Le fichier est en file d'attente : on suit l'avancement de la tâche
+      const tacheId = res.data.tache_id;
+      let tache = res.data;
+      const limite = Date.now() + SUIVI_DUREE_MAX_MS;
+      while (tache.statut === "en_attente" || tache.statut === "en_cours") {
+        if (Date.now() > limite) {
+          // ⏱️ L'import continue côté serveur : on arrête seulement d'attendre
+          setLoading(false);
+          setMessage(
+            `⏳ L'import de "${file.name}" est toujours ${
+              tache.statut === "en_attente" ? "en attente" : "en cours"
+            } : consultez son état plus tard.`
+          );
+          return;
+        }
+        await new Promise((r) => setTimeout(r, SUIVI_INTERVALLE_MS));
+        const suivi = await axiosInstance.get(`/import-taches/${tacheId}/`, {
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        tache = suivi.data;
+        if (tache.statut === "en_cours" && tache.totaux) {
+          setMessage(
+            `⏳ Importation en cours... (${tache.totaux.importees} feuille(s) importée(s))`
+          );
+        }
+      }
+
+      if (tache.statut === "echouee") {
+        throw new Error(tache.erreur || "Échec de l'importation");
+      }
+
       // ✅ Import réussi
-      setMessage(`✅ Fichier "${file.name}" importé avec succès !`);
+      setMessage(
+        tache.totaux?.erreurs
+          ? `✅ Fichier "${file.name}" importé (${tache.totaux.erreurs} feuille(s) en erreur)`
+          : `✅ Fichier "${file.name}" importé avec succès !`
+      );
       setLoading(false);
 
       // 🧹 Réinitialiser les champs
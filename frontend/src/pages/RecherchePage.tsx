@@ -3,16 +3,38 @@ import axios from "axios";
 import { Link } from "react-router-dom";
 import { FaSearch, FaDatabase } from "react-icons/fa";
 
+interface Suggestion {
+  texte: string;
+  type: string;
+}
+
 interface Resultat {
   type: string;
   id: number;
   nom: string;
-  source?: string;
+  source?: string | null;
+  tableau?: { id: number; titre: string } | null; // tableau d'un indicateur ou d'une colonne
 }
 
+// Résultats classés par pertinence : la première page suffit à la liste déroulante
+const TAILLE_PAGE = 50;
+
+const lienResultat = (r: Resultat) =>
+  r.type === "Tableau"
+    ? `/tableaux/${r.id}`
+    : r.type === "Categorie"
+    ? `/categories/${r.id}`
+    : r.type === "Theme"
+    ? `/themes/${r.id}`
+    : r.tableau
+    ? `/tableaux/${r.tableau.id}`
+    : "#";
+
 const RecherchePage: React.FC = () => {
   const [query, setQuery] = useState("");
   const [resultats, setResultats] = useState<Resultat[]>([]);
+  const [total, setTotal] = useState(0);
+  const [suggestions, setSuggestions] = useState<Suggestion[]>([]);
   const [afficherTout, setAfficherTout] = useState(false);
   const [isTyping, setIsTyping] = useState(false);
 
@@ -20,14 +42,16 @@ const RecherchePage: React.FC = () => {
     const delayDebounce = setTimeout(() => {
       if (query.length > 1) {
         axios
-          .get(`/api/recherche-globale/?q=${encodeURIComponent(query)}`)
+          .get(`/api/recherche-globale/?q=${encodeURIComponent(query)}&page_size=${TAILLE_PAGE}`)
           .then((res) => {
-            setResultats(res.data);
+            setResultats(res.data.results);
+            setTotal(res.data.count);
             setAfficherTout(false);
           })
           .catch((err) => console.error("Erreur de recherche :", err));
       } else {
         setResultats([]);
+        setTotal(0);
       }
       setIsTyping(false);
     }, 350);
@@ -35,6 +59,21 @@ const RecherchePage: React.FC = () => {
     return () => clearTimeout(delayDebounce);
   }, [query]);
 
+  // Suggestions pendant la frappe : index en mémoire côté serveur, délai court
+  useEffect(() => {
+    if (!query.trim()) {
+      setSuggestions([]);
+      return;
+    }
+    const delai = setTimeout(() => {
+      axios
+        .get(`/api/suggestions/?q=${encodeURIComponent(query)}&limite=8`)
+        .then((res) => setSuggestions(res.data))
+        .catch(() => setSuggestions([]));
+    }, 80);
+    return () => clearTimeout(delai);
+  }, [query]);
+
   const resultatsAffiches = afficherTout ? resultats : resultats.slice(0, 6);
 
   return (
@@ -52,6 +91,7 @@ const RecherchePage: React.FC = () => {
             <FaSearch className="text-slate-400 mr-2" />
             <input
               type="text"
+              list="suggestions-recherche"
               value={query}
               onChange={(e) => {
                 setQuery(e.target.value);
@@ -60,6 +100,11 @@ const RecherchePage: React.FC = () => {
               placeholder="Rechercher une catégorie, un thème, un tableau ou une source..."
               className="w-full outline-none bg-transparent text-slate-700 placeholder-slate-400"
             />
+            <datalist id="suggestions-recherche">
+              {suggestions.map((s) => (
+                <option key={`${s.type}-${s.texte}`} value={s.texte} label={s.type} />
+              ))}
+            </datalist>
           </div>
 
           {/* Liste déroulante des résultats */}
@@ -71,15 +116,7 @@ const RecherchePage: React.FC = () => {
                   className="border-b last:border-0 hover:bg-slate-50 transition"
                 >
                   <Link
-                    to={
-                      r.type === "Tableau"
-                        ? `/tableaux/${r.id}`
-                        : r.type === "Categorie"
-                        ? `/categories/${r.id}`
-                        : r.type === "Theme"
-                        ? `/themes/${r.id}`
-                        : "#"
-                    }
+                    to={lienResultat(r)}
                     className="block px-4 py-3"
                   >
                     <div className="flex justify-between items-center">
@@ -95,6 +132,9 @@ const RecherchePage: React.FC = () => {
                     <div className="text-slate-800 text-sm font-medium truncate">
                       {r.nom}
                     </div>
+                    {r.tableau && r.type !== "Tableau" && (
+                      <div className="text-xs text-slate-400 truncate">{r.tableau.titre}</div>
+                    )}
                   </Link>
                 </li>
               ))}
@@ -104,7 +144,7 @@ const RecherchePage: React.FC = () => {
                   onClick={() => setAfficherTout(true)}
                   className="text-center text-emerald-700 font-medium hover:bg-emerald-50 cursor-pointer p-3"
                 >
-                  Voir tous les résultats ({resultats.length})
+                  Voir tous les résultats ({total})
                 </li>
               )}
             </ul>
@@ -131,15 +171,7 @@ const RecherchePage: React.FC = () => {
                   className="p-2 rounded-lg hover:bg-slate-50 transition border-b last:border-0"
                 >
                   <Link
-                    to={
-                      r.type === "Tableau"
-                        ? `/tableaux/${r.id}`
-                        : r.type === "Categorie"
-                        ? `/categories/${r.id}`
-                        : r.type === "Theme"
-                        ? `/themes/${r.id}`
-                        : "#"
-                    }
+                    to={lienResultat(r)}
                     className="block"
                   >
                     <span className="font-semibold text-emerald-700">{r.type} :</span>{" "}
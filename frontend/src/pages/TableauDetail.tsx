@@ -38,7 +38,12 @@ type Payload = {
 
 type Meta = { titre: string; source: string; etiquette_ligne: string };
 
-type FilterOptions = { lignes: string[]; colonnes: string[] };
+type FilterOptions = {
+  lignes: string[];
+  colonnes: string[];
+  lignes_ids?: Record<string, number[]>;
+  colonnes_ids?: Record<string, number[]>;
+};
 
 /* ---------- Const ---------- */
 const COL_SPACING_X = 1;
@@ -167,9 +172,12 @@ function FilterModal({
   }, [show, id]);
 
   const handleApply = async () => {
+    // Sélection envoyée par id : le serveur découpe la matrice du tableau en mémoire
+    const ids = (choix: string[], index?: Record<string, number[]>) =>
+      choix.flatMap((c) => index?.[c] ?? []);
     const { data } = await axios.post(`/api/tableaux/${id}/filtrer-structure/`, {
-      lignes: selectedLignes,
-      colonnes: selectedCols,
+      ligne_ids: ids(selectedLignes, options?.lignes_ids),
+      colonne_ids: ids(selectedCols, options?.colonnes_ids),
     });
     setPayload(data);
     onClose();
@@ -50,13 +50,19 @@ export default function Tableaux() {
 
   /* === Charger les tableaux du thème === */
   useEffect(() => {
-    axios
-      .get("/api/tableaux/")
-      .then((res) => {
-        const filtered = res.data.filter((t: Tableau) => t.theme === parseInt(id || "0", 10));
-        setTableaux(filtered);
-      })
-      .catch(console.error);
+    if (!id) return;
+    // Filtre côté serveur + pagination par curseur : on suit "next" jusqu'à la dernière page
+    const charger = async () => {
+      const tous: Tableau[] = [];
+      let url: string | null = `/api/tableaux/?theme=${id}&fields=id,titre,theme`;
+      while (url) {
+        const res: { data: { next: string | null; results: Tableau[] } } = await axios.get(url);
+        tous.push(...res.data.results);
+        url = res.data.next;
+      }
+      setTableaux(tous);
+    };
+    charger().catch(console.error);
   }, [id]);
 
   /* === Charger les métadonnées du thème === */